@@ -0,0 +1,90 @@
+"""
+Cold start of the syncdoor entry point and cost of constructing the clients, as paid by the cron
+jobs and the login plugins that start a new process for every call. Every command runs in a new
+interpreter, the median of the runs is reported.
+
+    python -m benchmarks.coldstart --repeat 10
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from argparse import ArgumentParser
+from statistics import median
+
+# Commands run in a new interpreter, from the import of the package to the construction of the clients
+COMMANDS = {
+    "python": "pass",
+    "import pydesydoor.syncdoor": "import pydesydoor.syncdoor",
+    "import pydesydoor.desydoorauth": "import pydesydoor.desydoorauth",
+    "syncdoor --help": "from pydesydoor import syncdoor\ntry:\n    syncdoor.main(['--help'])\nexcept SystemExit:\n    pass",
+}
+# Clients constructed many times in one interpreter, in microseconds per client
+CONSTRUCTIONS = {
+    "DesyDoorAuth()": "from pydesydoor.desydoorauth import DesyDoorAuth as client_class",
+    "DoorPyISPyB()": "from pydesydoor.doorpyispyb import DoorPyISPyB as client_class",
+    "PyISPyBAPI()": "from pydesydoor.pyispybapi import PyISPyBAPI as client_class",
+}
+CONSTRUCTION_LOOP = """
+import time
+{import_client}
+start_time = time.perf_counter()
+for _ in range({count}):
+    client_class().close()
+print((time.perf_counter() - start_time) / {count} * 1e6)
+"""
+
+
+def create_arg_parser():
+    parser = ArgumentParser(description="Measure the cold start of syncdoor and the construction of the clients.")
+    parser.add_argument("-r", "--repeat", help="Runs of every command, the median is reported (default 5)", type=int,
+                        default=5)
+    parser.add_argument("-n", "--count", help="Clients constructed per run (default 1000)", type=int, default=1000)
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    return parser
+
+
+def get_environment():
+    # Every variable set, so the clients never depend on a .env file of the working directory
+    environment = dict(os.environ, PYTHONPATH=os.getcwd())
+    for name in ("DOOR_REST_ROOT", "PYISPYB_API_ROOT"):
+        environment.setdefault(name, "http://localhost")
+    for name in ("DOOR_REST_TOKEN", "DOOR_SERVICE_ACCOUNT", "DOOR_SERVICE_PASSWORD", "PYISPYB_AUTH_PLUGIN",
+                 "PYISPYB_SERVICE_ACCOUNT", "PYISPYB_SERVICE_PASSWORD"):
+        environment.setdefault(name, "benchmark")
+    return environment
+
+
+def time_command(code, environment):
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=environment, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start_time) * 1000
+
+
+def time_construction(import_client, count, environment):
+    code = CONSTRUCTION_LOOP.format(import_client=import_client, count=count)
+    return float(subprocess.run([sys.executable, "-c", code], env=environment, check=True,
+                                stdout=subprocess.PIPE).stdout)
+
+
+def main(argv):
+    args = create_arg_parser().parse_args(argv)
+    environment = get_environment()
+    results = []
+    for name, code in COMMANDS.items():
+        results.append({"name": name, "ms": round(median(time_command(code, environment)
+                                                         for _ in range(args.repeat)), 1)})
+    for name, import_client in CONSTRUCTIONS.items():
+        results.append({"name": name, "us": round(median(time_construction(import_client, args.count, environment)
+                                                         for _ in range(args.repeat)), 1)})
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        unit = "ms" if "ms" in result else "us"
+        print(f"{result['name']:<32} {result[unit]:>9} {unit}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,155 @@
+"""
+Load test of the DOOR login checks against a local mock DOOR: every service building its own
+DesyDoorAuth and DesyDoorAPI clients per login ("direct"), against the local auth service
+(pydesydoor.authdoor) over TCP or a Unix socket ("sidecar"). Reports the throughput, the
+latency percentiles seen by the callers and the DOOR requests made.
+
+    python -m benchmarks.loadtest_auth --latency 20 --threads 32 --requests 2000
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from argparse import ArgumentParser
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+from tests.fakedoor import MockDataset, DATASETS, USER_PASSWORD
+from tests.mockdoor import MockDoorServer
+from benchmarks.run import set_mock_environment
+from pydesydoor.doorauthserver import LatencyMetrics, UnixHTTPConnection
+
+
+def create_arg_parser():
+    parser = ArgumentParser(description="Load test the DOOR login checks, direct or through the local auth service.")
+    parser.add_argument("--dataset", help="Synthetic dataset, its users log in (default medium)", choices=sorted(DATASETS),
+                        default="medium")
+    parser.add_argument("--latency", help="Latency of every mock DOOR request in milliseconds (default 20)", type=float,
+                        default=20.0)
+    parser.add_argument("-t", "--threads", help="Callers logging users in at the same time (default 16)", type=int,
+                        default=16)
+    parser.add_argument("-n", "--requests", help="Logins of every mode (default 1000)", type=int, default=1000)
+    parser.add_argument("--mode", help="Only run these modes", action="append", choices=sorted(MODES))
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    return parser
+
+
+def get_logins(dataset, count):
+    # One login out of ten has a wrong password
+    usernames = [user["login"] for user in dataset.users.values()]
+    return [(usernames[index % len(usernames)], "wrong" if index % 10 == 9 else USER_PASSWORD)
+            for index in range(count)]
+
+
+def login_direct():
+    from pydesydoor.desydoorapi import DesyDoorAPI
+    from pydesydoor.desydoorauth import DesyDoorAuth
+
+    def login(username, password):
+        # New clients, so new connections, for every login like a service without a shared client
+        with DesyDoorAuth(role_cache=False) as auth_client:
+            auth = auth_client.login(username, password)
+        if not auth:
+            return False
+        with DesyDoorAPI() as api_client:
+            return api_client.get_user_roles(auth[1])
+    return login, None
+
+
+def login_sidecar(unix_socket=False):
+    from pydesydoor import authdoor
+    socket_path = os.path.join(tempfile.mkdtemp(), "authdoor.sock") if unix_socket else None
+    server = authdoor.create_server(authdoor.create_arg_parser().parse_args(
+        ["--port", "0"] + (["--unix-socket", socket_path] if unix_socket else []))).start()
+    local = threading.local()
+
+    def login(username, password):
+        if getattr(local, "connection", None) is None:
+            # One keep-alive connection per caller
+            local.connection = UnixHTTPConnection(socket_path) if unix_socket else HTTPConnection(
+                *server.url[len("http://"):].split(":"))
+        body = urlencode({"username": username, "password": password})
+        local.connection.request("POST", "/auth", body, {"Content-Type": "application/x-www-form-urlencoded"})
+        r = local.connection.getresponse()
+        data = json.loads(r.read())
+        return r.status == 200 and data["roles"]
+    return login, server
+
+
+MODES = {"direct": login_direct, "sidecar": login_sidecar, "sidecar-unix": lambda: login_sidecar(True)}
+
+
+def measure(door_server, mode, args):
+    """
+       Log args.logins in from args.threads callers. Returns the throughput, the latencies of the callers and the
+       DOOR requests made.
+    """
+    login, server = MODES[mode]()
+    metrics = LatencyMetrics(window=len(args.logins))
+    chunks = [args.logins[index::args.threads] for index in range(args.threads)]
+
+    def caller(logins):
+        for username, password in logins:
+            start_time = time.perf_counter()
+            error = False
+            try:
+                login(username, password)
+            except Exception:
+                error = True
+            metrics.add("login", time.perf_counter() - start_time, error)
+
+    door_server.reset_stats()
+    threads = [threading.Thread(target=caller, args=(chunk,)) for chunk in chunks]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    took = time.perf_counter() - start_time
+    result = dict(metrics.get_stats()["login"], wall_time=round(took, 4),
+                  throughput=round(len(args.logins) / took, 1), door_requests=door_server.get_stats()["requests"])
+    if server is not None:
+        result["role_cache"] = server.get_metrics()["role_cache"]
+        server.stop()
+        server.client.close()
+        if server.unix_socket is not None:
+            os.rmdir(os.path.dirname(server.unix_socket))
+    return result
+
+
+def run(args):
+    dataset = MockDataset.from_name(args.dataset)
+    args.logins = get_logins(dataset, args.requests)
+    results = {}
+    with MockDoorServer(dataset, latency=args.latency / 1000.0) as door_server:
+        set_mock_environment(door_server)
+        for mode in args.mode or MODES:
+            results[mode] = measure(door_server, mode, args)
+    return results
+
+
+ROW = "{:<14}{:>12}{:>10}{:>10}{:>10}{:>10}{:>8}{:>15}"
+
+
+def print_results(args, results):
+    print("Dataset {}, {} logins from {} callers, DOOR latency {} ms".format(
+        args.dataset, args.requests, args.threads, args.latency))
+    print(ROW.format("mode", "logins/s", "p50 ms", "p95 ms", "p99 ms", "max ms", "errors", "DOOR requests"))
+    for mode, result in results.items():
+        print(ROW.format(
+            mode, result["throughput"], result["p50"], result["p95"], result["p99"], result["max"], result["errors"],
+            result["door_requests"]))
+
+
+def main(argv):
+    args = create_arg_parser().parse_args(argv)
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(args, results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
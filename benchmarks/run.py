@@ -0,0 +1,172 @@
+"""
+End-to-end benchmarks of the DOOR exporters and of the py-ispyb sync against a local mock
+DOOR and py-ispyb server. Every scenario reports its wall time, the number of HTTP requests
+it made and its peak python memory.
+
+    python -m benchmarks.run --dataset commissioning --latency 20
+"""
+import io
+import os
+import sys
+import json
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from statistics import median
+from tests.fakedoor import MockDataset, DATASETS, COMMISSIONING_PROPOSAL_ID, USER_PASSWORD
+from tests.mockdoor import MockDoorServer
+
+
+def create_arg_parser():
+    parser = ArgumentParser(description="Benchmark the DOOR exporters and the py-ispyb sync against a mock server.")
+    parser.add_argument("--dataset", help="Synthetic dataset (default small)", choices=sorted(DATASETS),
+                        default="small")
+    parser.add_argument("--latency", help="Latency of every mock request in milliseconds (default 0)", type=float,
+                        default=0.0)
+    parser.add_argument("-p", "--proposal_id", help="Proposal to benchmark (default the first of the dataset)")
+    parser.add_argument("-s", "--start", help="Session start date in format YYYY-MM-DD")
+    parser.add_argument("-e", "--end", help="Session end date in format YYYY-MM-DD")
+    parser.add_argument("-c", "--concurrency", help="Maximum number of parallel DOOR lookups (default 8)", type=int,
+                        default=8)
+    parser.add_argument("-r", "--repeat", help="Timed runs of every scenario, the median is reported (default 3)",
+                        type=int, default=3)
+    parser.add_argument("--scenario", help="Only run these scenarios", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    return parser
+
+
+def set_mock_environment(server):
+    os.environ.update(server.get_environment())
+
+
+def run_sync_proposal(args):
+    from pydesydoor import syncdoor
+    with redirect_stdout(io.StringIO()):
+        syncdoor.sync_proposal(args.proposal_id, False, args.start, args.end, max_workers=args.concurrency)
+
+
+def run_pyispyb(args):
+    from pydesydoor.doorpyispyb import DoorPyISPyB
+    with DoorPyISPyB(max_workers=args.concurrency) as client:
+        client.get_full_proposal_to_pyispyb(args.proposal_id, True, True, True, True, args.start, args.end)
+
+
+def run_ispyb(args):
+    from pydesydoor.doorispyb import DoorISPyB
+    with DoorISPyB(max_workers=args.concurrency) as client:
+        client.get_full_proposal_to_ispyb(args.proposal_id)
+
+
+def run_ispyb_java(args):
+    from pydesydoor.doorispybjava import DoorISPyBJava
+    with DoorISPyBJava(max_workers=args.concurrency) as client:
+        client.get_proposers(args.proposal_id)
+        client.get_labcontacts(args.proposal_id)
+        client.get_sessions(args.proposal_id)
+
+
+def run_sessions(args):
+    from pydesydoor.doorpyispyb import DoorPyISPyB
+    from pydesydoor.serializer import get_serializer
+    with DoorPyISPyB(max_workers=args.concurrency, serializer=get_serializer("compact")) as client, \
+            open(os.devnull, "wb") as f:
+        f.write(client.serialize(client.get_sessions_to_pyispyb(args.proposal_id, "P11", True, args.start, args.end)))
+
+
+def run_sessions_pipeline(args):
+    from pydesydoor.doorpyispyb import DoorPyISPyB
+    from pydesydoor.doorpipeline import DoorPipeline, FileSink
+    # The sessions are written while the DOOR response is parsed
+    with DoorPyISPyB(max_workers=args.concurrency) as client:
+        sessions = client.iter_proposal_sessions(args.proposal_id, "P11", args.start, args.end)
+        DoorPipeline(sessions, client.get_session_to_pyispyb, sink=FileSink(os.devnull), max_workers=args.concurrency).run()
+
+
+def run_logins(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from pydesydoor.desydoorapi import DesyDoorAPI
+    from pydesydoor.desydoorauth import DesyDoorAuth
+    # Login then roles, one after the other, like examples/authentication.py
+    with DesyDoorAuth(role_cache=False) as auth_client, DesyDoorAPI() as api_client, \
+            ThreadPoolExecutor(args.concurrency) as executor:
+        def login(username):
+            auth = auth_client.login(username, USER_PASSWORD)
+            return auth and api_client.get_user_roles(auth[1])
+        list(executor.map(login, args.logins))
+
+
+def run_logins_authorize(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from pydesydoor.desydoorauth import DesyDoorAuth
+    with DesyDoorAuth(max_workers=2 * args.concurrency) as client, ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(lambda username: client.authenticate_and_authorize(username, USER_PASSWORD), args.logins))
+
+
+SCENARIOS = {"sync_proposal": run_sync_proposal, "pyispyb": run_pyispyb, "ispyb": run_ispyb,
+             "ispyb-java": run_ispyb_java, "sessions": run_sessions, "sessions-pipeline": run_sessions_pipeline,
+             "logins": run_logins, "logins-authorize": run_logins_authorize}
+
+
+def measure(server, scenario, args):
+    """
+       Run a scenario args.repeat times, then once more to trace its peak memory.
+       Returns the median wall time, the requests of a run and the peak memory in bytes.
+    """
+    took = []
+    stats = None
+    for _ in range(max(1, args.repeat)):
+        server.reset_stats()
+        start_time = time.perf_counter()
+        scenario(args)
+        took.append(time.perf_counter() - start_time)
+        stats = server.get_stats()
+    # Traced apart, as tracing the allocations slows the run down
+    tracemalloc.start()
+    try:
+        scenario(args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"wall_time": round(median(took), 4), "requests": stats["requests"], "bytes": stats["bytes_sent"],
+            "peak_memory": peak_memory, "by_endpoint": stats["by_endpoint"]}
+
+
+def run(args):
+    dataset = MockDataset.from_name(args.dataset)
+    if args.proposal_id is None:
+        args.proposal_id = COMMISSIONING_PROPOSAL_ID if args.dataset == "commissioning" else min(dataset.proposals)
+    if args.proposal_id == COMMISSIONING_PROPOSAL_ID and not (args.start and args.end):
+        # The commissioning proposal is only synchronized by date range
+        args.start, args.end = "2022-07-01", "2022-07-31"
+    # Every user logs in 3 times, Ex: to the beamline GUI and ISPyB at the start of their beamtime
+    args.logins = [user["login"] for user in dataset.users.values()] * 3
+    results = {}
+    with MockDoorServer(dataset, latency=args.latency / 1000.0) as server:
+        set_mock_environment(server)
+        for name in args.scenario or SCENARIOS:
+            results[name] = measure(server, SCENARIOS[name], args)
+    return results
+
+
+def print_results(args, results):
+    print(f"Dataset {args.dataset}, proposal {args.proposal_id}, latency {args.latency} ms, "
+          f"concurrency {args.concurrency}")
+    print(f"{'scenario':<15} {'wall time (s)':>14} {'requests':>9} {'received (KiB)':>15} {'peak memory (MiB)':>18}")
+    for name, result in results.items():
+        print(f"{name:<15} {result['wall_time']:>14} {result['requests']:>9} {result['bytes'] / 1024:>15.1f} "
+              f"{result['peak_memory'] / 1024 / 1024:>18.2f}")
+
+
+def main(argv):
+    args = create_arg_parser().parse_args(argv)
+    results = run(args)
+    if args.json:
+        print(json.dumps({"dataset": args.dataset, "proposal_id": args.proposal_id, "latency_ms": args.latency,
+                          "concurrency": args.concurrency, "results": results}, indent=4))
+    else:
+        print_results(args, results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
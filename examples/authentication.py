@@ -13,3 +13,10 @@ if auth:
     # Request the user roles
     roles = apiclient.get_user_roles(user_id)
     print(roles)
+
+# Or both in a single call, with the roles cached by the client
+auth = authclient.authenticate_and_authorize("username", "password")
+print(auth)
+if auth:
+    _, user_id, roles = auth
+    print(roles)
@@ -0,0 +1,4 @@
+import logging
+
+# The application configures the logging, see pydesydoor.doorlog.configure_logging
+logging.getLogger(__name__).addHandler(logging.NullHandler())
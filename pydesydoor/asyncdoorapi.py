@@ -0,0 +1,273 @@
+import asyncio
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doormodel import DoorProposal, DoorSession, DoorUser, DoorInstitute
+from pydesydoor.serializer import PrettyJSONSerializer
+from pydesydoor.doorflight import AsyncSingleFlight
+from pydesydoor.doorretry import get_timeouts, get_url_family, get_deadline
+from pydesydoor.doorsettings import get_settings
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncDesyDoorAPI(object):
+    """
+    Asyncio RESTful Web-service API client for DESY Door user portal.
+
+    It offers awaitable versions of the DesyDoorAPI getters and parses the DOOR responses
+    the same way. Requires httpx (pip install pydesydoor[async]).
+
+       :param int max_connections: Maximum number of connections to DOOR
+       :param int max_concurrency: Maximum number of DOOR requests in flight at the same time
+       :param DoorCache cache: Optional entity cache for users, institutes and proposals
+       :param httpx.AsyncClient http_client: An already configured client to share between API clients
+       :param httpx.AsyncBaseTransport transport: Optional transport. Ex: httpx.MockTransport for tests
+       :param serializer: Serializer of the generated payloads (see pydesydoor.serializer), pretty JSON str by default
+       :param DoorTracer tracer: Optional tracer recording the DOOR calls
+       :param timeout: (connect, read) timeouts of the DOOR requests, like DesyDoorAPI
+       :param boolean coalesce: True to share one request between the concurrent identical GETs (same url)
+       :param DoorSettings settings: The DOOR settings, the ones of the environment (and .env file) by default
+    """
+
+    def __init__(self, max_connections=10, max_concurrency=10, cache=None, http_client=None, transport=None,
+                 serializer=None, tracer=None, timeout=None, coalesce=True, settings=None):
+        if httpx is None:
+            raise ImportError("AsyncDesyDoorAPI requires httpx. Ex: pip install pydesydoor[async]")
+        settings = settings or get_settings()
+        self.__door_rest_root = settings.get("DOOR_REST_ROOT")
+        self.__door_rest_token = settings.get("DOOR_REST_TOKEN")
+        self.__door_rest_service_account = settings.get("DOOR_SERVICE_ACCOUNT")
+        self.__door_rest_service_password = settings.get("DOOR_SERVICE_PASSWORD")
+        # Set door service account headers
+        self.__door_service_headers = {"x-door-token": self.__door_rest_token,
+                                       "x-door-service-account": self.__door_rest_service_account,
+                                       "x-door-service-auth": self.__door_rest_service_password}
+        self.__owns_http_client = http_client is None
+        if http_client is None:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            http_client = httpx.AsyncClient(verify=False, limits=limits, transport=transport)
+        self.__http_client = http_client
+        self.__cache = cache
+        self.__max_concurrency = max_concurrency
+        # Created on first use, so it belongs to the running event loop
+        self.__semaphore = None
+        self.__serializer = serializer or PrettyJSONSerializer()
+        self.__tracer = tracer
+        self.__timeouts = get_timeouts(timeout)
+        self.__single_flight = AsyncSingleFlight() if coalesce else None
+
+    split_multiple_by_comma = staticmethod(DesyDoorAPI.split_multiple_by_comma)
+    get_cowriter_ids = classmethod(DesyDoorAPI.get_cowriter_ids.__func__)
+    get_participant_ids = classmethod(DesyDoorAPI.get_participant_ids.__func__)
+
+    def get_door_rest_root(self):
+        return self.__door_rest_root
+
+    def get_http_client(self):
+        return self.__http_client
+
+    def get_serializer(self):
+        return self.__serializer
+
+    def serialize(self, data):
+        return self.__serializer.dumps(data)
+
+    def get_cache(self):
+        return self.__cache
+
+    def get_single_flight(self):
+        return self.__single_flight
+
+    def get_timeout(self, url):
+        """
+           The httpx timeout of a DOOR url, capped by the deadline of the running operation if any
+        """
+        timeout = self.__timeouts.get(get_url_family(url), self.__timeouts["default"])
+        current = get_deadline()
+        if current is not None:
+            timeout = current.cap_timeout(timeout)
+        return httpx.Timeout(timeout[1], connect=timeout[0])
+
+    async def get_cached(self, entity_type, entity_id, fetch):
+        """
+           Return an entity from the cache (when the client has one) or await its fetch from DOOR.
+           Cached entities are shared between callers and must not be modified.
+        """
+        if self.__cache is None:
+            return await fetch(entity_id)
+        found, value, error = self.__cache.get(entity_type, entity_id)
+        if found:
+            if error is not None:
+                raise error
+            return value
+        try:
+            value = await fetch(entity_id)
+        except Exception as e:
+            self.__cache.set_error(entity_type, entity_id, e)
+            raise
+        if value is not None:
+            self.__cache.set(entity_type, entity_id, value)
+        return value
+
+    async def aclose(self):
+        """
+           Close the pooled connections of this client (shared clients are left open).
+        """
+        if self.__owns_http_client:
+            await self.__http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def get_door_request(self, url):
+        if self.__tracer is None:
+            r = await self.__get_coalesced(url)
+        else:
+            with self.__tracer.call("GET", url) as span:
+                r = await self.__get_coalesced(url, span)
+                self.__tracer.record_response(span, r)
+        r.raise_for_status()
+        return r
+
+    async def __get_coalesced(self, url, span=None):
+        # The tasks waiting for a shared request do not take a slot of the semaphore
+        if self.__single_flight is None:
+            return await self.__get(url)
+        r, shared = await self.__single_flight.do(url, lambda: self.__get(url))
+        if shared and span is not None:
+            span.cache = "coalesced"
+        return r
+
+    async def __get(self, url):
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.__max_concurrency)
+        async with self.__semaphore:
+            return await self.__http_client.get(self.__door_rest_root + url, headers=self.__door_service_headers,
+                                                timeout=self.get_timeout(url))
+
+    async def get_beamline_proposals(self, beamline):
+        r = await self.get_door_request("/proposals/beamline/{}".format(beamline))
+        return DesyDoorAPI.read_door_response(r, 'proposals')
+
+    async def get_beamline_proposals_by_year(self, beamline, year):
+        r = await self.get_door_request("/proposals/beamline/{}/year/{}".format(beamline, year))
+        return DesyDoorAPI.read_door_response(r, 'proposals')
+
+    async def get_beamline_proposals_by_date_range(self, beamline, start_date, end_date, window=None):
+        # date format YYYYMMDD, see DesyDoorAPI.get_by_date_windows for the window
+        return await self.get_by_date_windows("/proposals/beamline/" + str(beamline) + "/date/{}/{}", 'proposals',
+                                              start_date, end_date, window)
+
+    async def get_proposal(self, proposal_id):
+        return await self.get_cached("proposal", proposal_id, self._fetch_proposal)
+
+    async def _fetch_proposal(self, proposal_id):
+        r = await self.get_door_request("/proposals/propid/{}".format(proposal_id))
+        return DesyDoorAPI.read_door_response(r, 'proposals', proposal_id)
+
+    async def get_proposal_model(self, proposal_id):
+        return await self.get_cached("proposal model", proposal_id, self._fetch_proposal_model)
+
+    async def _fetch_proposal_model(self, proposal_id):
+        door_proposal = await self._fetch_proposal(proposal_id)
+        return None if door_proposal is None else DoorProposal.from_door(proposal_id, door_proposal)
+
+    async def get_proposal_sessions(self, proposal_id, beamline, start_date=None, end_date=None, strategy="auto"):
+        """
+           Get the sessions of a proposal on a beamline, see DesyDoorAPI.get_proposal_sessions
+
+           :param str proposal_id: The DOOR proposal id
+           :param str beamline: the beamline name. Ex: P11
+           :param str start_date (%Y-%m-%d): the start date range to find sessions
+           :param str end_date (%Y-%m-%d): the end date range to find sessions
+           :param str strategy: "auto", "proposal" or "beamline", see DesyDoorAPI.get_sessions_strategy
+        """
+        date_range = DesyDoorAPI.parse_date_range(start_date, end_date)
+        door_sessions, session_proposal_id = await self._fetch_sessions(proposal_id, beamline, date_range, strategy)
+        if door_sessions is None:
+            return None
+        return DesyDoorAPI.filter_sessions(door_sessions, beamline, start_date, end_date, session_proposal_id)
+
+    async def get_session_models(self, proposal_id, beamline, start_date=None, end_date=None, strategy="auto"):
+        """
+           Same sessions as get_proposal_sessions, as DoorSession. The DOOR dates are parsed once per session.
+        """
+        date_range = DesyDoorAPI.parse_date_range(start_date, end_date)
+        door_sessions, session_proposal_id = await self._fetch_sessions(proposal_id, beamline, date_range, strategy)
+        if door_sessions is None:
+            return None
+        return DoorSession.select(door_sessions, beamline, date_range, session_proposal_id)
+
+    async def _fetch_sessions(self, proposal_id, beamline, date_range, strategy="auto"):
+        if DesyDoorAPI.get_sessions_strategy(date_range, strategy) == "beamline":
+            r = await self.get_door_request(DesyDoorAPI.get_beamline_window_url(beamline, date_range))
+            door_sessions = DesyDoorAPI.read_door_response(r, 'experiment metadata')
+            if DesyDoorAPI.has_proposal_ids(door_sessions):
+                return door_sessions, proposal_id
+        r = await self.get_door_request("/experiments/propid/{}".format(proposal_id))
+        return DesyDoorAPI.read_door_response(r, 'experiment metadata'), None
+
+    async def get_beamline_sessions(self, beamline):
+        r = await self.get_door_request("/experiments/beamline/{}".format(beamline))
+        return DesyDoorAPI.read_door_response(r, 'experiment metadata')
+
+    async def get_beamline_sessions_by_year(self, beamline, year):
+        r = await self.get_door_request("/experiments/beamline/{}/year/{}".format(beamline, year))
+        return DesyDoorAPI.read_door_response(r, 'experiment metadata')
+
+    async def get_beamline_sessions_by_date_range(self, beamline, start_date, end_date, window=None):
+        # date format YYYYMMDD, see DesyDoorAPI.get_by_date_windows for the window
+        return await self.get_by_date_windows("/experiments/beamline/" + str(beamline) + "/date/{}/{}",
+                                              'experiment metadata', start_date, end_date, window)
+
+    async def get_by_date_windows(self, url, key, start_date, end_date, window=None):
+        """
+           Get the items of a DOOR date range listing, the windows are fetched concurrently (up to
+           max_concurrency). See DesyDoorAPI.get_by_date_windows
+        """
+        windows = [(start_date, end_date)] if window is None else DesyDoorAPI.split_date_range(start_date, end_date,
+                                                                                               window)
+        responses = await asyncio.gather(*[self.get_door_request(url.format(*dates)) for dates in windows])
+        results = [DesyDoorAPI.read_door_response(r, key) for r in responses]
+        return results[0] if window is None else DesyDoorAPI.merge_windows(results)
+
+    async def get_session(self, session_id):
+        r = await self.get_door_request("/experiments/expid/{}".format(session_id))
+        return DesyDoorAPI.read_door_response(r, 'experiment metadata', session_id)
+
+    async def get_user(self, user_id):
+        return await self.get_cached("user", user_id, self._fetch_user)
+
+    async def _fetch_user(self, user_id):
+        r = await self.get_door_request("/users/id/{}".format(user_id))
+        return DesyDoorAPI.read_door_response(r, 'user metadata', str(user_id))
+
+    async def get_user_model(self, user_id):
+        return await self.get_cached("user model", user_id, self._fetch_user_model)
+
+    async def _fetch_user_model(self, user_id):
+        door_user = await self._fetch_user(user_id)
+        return None if door_user is None else DoorUser.from_door(user_id, door_user)
+
+    async def get_user_roles(self, user_id):
+        r = await self.get_door_request("/roles/userid/{}".format(user_id))
+        return DesyDoorAPI.read_user_roles(r, user_id)
+
+    async def get_institute(self, institute_id):
+        return await self.get_cached("institute", institute_id, self._fetch_institute)
+
+    async def _fetch_institute(self, institute_id):
+        r = await self.get_door_request("/institutes/id/{}".format(institute_id))
+        return DesyDoorAPI.read_institute(r, institute_id)
+
+    async def get_institute_model(self, institute_id):
+        return await self.get_cached("institute model", institute_id, self._fetch_institute_model)
+
+    async def _fetch_institute_model(self, institute_id):
+        door_institute = await self._fetch_institute(institute_id)
+        return None if door_institute is None else DoorInstitute.from_door(institute_id, door_institute)
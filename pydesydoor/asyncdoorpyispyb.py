@@ -0,0 +1,124 @@
+import asyncio
+from pydesydoor.asyncdoorapi import AsyncDesyDoorAPI
+from pydesydoor.doorpyispyb import DoorPyISPyB, DEFAULT_PERSON_ID
+from pydesydoor.doorplan import ProposalPlan
+
+
+class AsyncDoorPyISPyB(AsyncDesyDoorAPI):
+    """
+    Asyncio version of DoorPyISPyB. Independent DOOR lookups (the proposal and its sessions,
+    the users of the proposal and of its sessions, their institutes) are awaited together, and
+    the output is the same as the one of DoorPyISPyB.
+    """
+
+    async def get_full_proposal_to_pyispyb(self, door_proposal_id, with_leader=True, with_cowriters=True,
+                                           with_sessions=True, with_session_participants=True, start_date=None,
+                                           end_date=None):
+        """
+           Get the full proposal data (sessions, etc) from DOOR in format for py-ispyb
+
+           :param str door_proposal_id: The DOOR proposal id
+           :param boolean with_leader: True/False depending if the proposal leader data is needed
+           :param boolean with_cowriters: True/False depending if the proposal cowriters data is needed
+           :param boolean with_sessions: True/False depending if the proposal sessions data is needed
+           :param boolean with_session_participants: True/False depending if the session participants data is needed
+           :param string start_date (%Y-%m-%d): the start date range to find proposal sessions
+           :param string end_date (%Y-%m-%d): the end date range to find proposal sessions
+        """
+        plan = await self.plan_full_proposal(door_proposal_id, with_leader, with_cowriters, with_sessions,
+                                             with_session_participants, start_date, end_date)
+        await self.resolve_plan(plan)
+        return self.serialize(DoorPyISPyB.build_full_proposal(plan))
+
+    async def plan_full_proposal(self, door_proposal_id, with_leader=True, with_cowriters=True, with_sessions=True,
+                                 with_session_participants=True, start_date=None, end_date=None):
+        """
+           Get the proposal and its sessions from DOOR and plan the lookups of their users and institutes
+        """
+        fetches = [self.get_proposal_model(door_proposal_id)]
+        if with_sessions:
+            fetches.append(self.get_session_models(door_proposal_id, "P11", start_date, end_date))
+        door_proposal, *door_sessions = await asyncio.gather(*fetches)
+        person_ids, cowriters_start = DoorPyISPyB.get_proposal_user_ids(door_proposal, with_leader, with_cowriters)
+        sessions, lookups = None, ()
+        if with_sessions:
+            sessions, lookups = DoorPyISPyB.format_sessions(door_sessions[0], with_session_participants)
+        return ProposalPlan(door_proposal, person_ids, cowriters_start, DEFAULT_PERSON_ID, sessions, lookups)
+
+    async def resolve_plan(self, plan):
+        """
+           Get the users of a plan from DOOR all together, then the institutes of those users
+        """
+        user_ids = plan.get_user_ids()
+        plan.set_users(user_ids, await asyncio.gather(*[self.get_user_model(user_id) for user_id in user_ids]))
+        institute_ids = plan.get_institute_ids()
+        plan.set_institutes(institute_ids, await asyncio.gather(*[self.get_institute_model(institute_id)
+                                                                  for institute_id in institute_ids]))
+
+    async def explain_full_proposal(self, door_proposal_id, with_leader=True, with_cowriters=True, with_sessions=True,
+                                    with_session_participants=True, start_date=None, end_date=None):
+        """
+           Plan the export of a proposal and tell how many DOOR calls it makes, see ProposalPlan.explain
+        """
+        plan = await self.plan_full_proposal(door_proposal_id, with_leader, with_cowriters, with_sessions,
+                                             with_session_participants, start_date, end_date)
+        return plan.explain()
+
+    async def get_proposal_to_pyispyb(self, door_proposal_id, with_leader=True, with_cowriters=True):
+        """
+           Get the proposal data from DOOR in format for py-ispyb
+
+           :param str door_proposal_id: The DOOR proposal id
+           :param boolean with_leader: True/False depending if the leader data is needed
+           :param boolean with_cowriters: True/False depending if the cowriters data is needed
+        """
+        door_proposal = await self.get_proposal_model(door_proposal_id)
+        user_ids, cowriters_start = DoorPyISPyB.get_proposal_user_ids(door_proposal, with_leader, with_cowriters)
+        persons = list(await asyncio.gather(*[self.get_user_to_pyispyb(user_id) for user_id in user_ids]))
+        DoorPyISPyB.set_cowriter_types(door_proposal, persons, cowriters_start)
+        if not persons:
+            persons.append(await self.get_user_to_pyispyb(DEFAULT_PERSON_ID))
+        return DoorPyISPyB.format_proposal(door_proposal, persons)
+
+    async def get_user_to_pyispyb(self, door_user_id, with_laboratory=True):
+        """
+           Get the user data from DOOR in format for py-ispyb
+
+           :param str door_user_id: The DOOR user id
+           :param boolean with_laboratory: True/False depending if the Laboratory/Institute data is needed
+        """
+        door_user = await self.get_user_model(door_user_id)
+        laboratory = None
+        if with_laboratory:
+            laboratory = await self.get_laboratory_to_pyispyb(door_user.laboratory_id)
+        return DoorPyISPyB.format_user(door_user, with_laboratory, laboratory)
+
+    async def get_laboratory_to_pyispyb(self, laboratory_id):
+        door_laboratory = await self.get_institute_model(laboratory_id)
+        return None if door_laboratory is None else door_laboratory.data
+
+    async def get_sessions_to_pyispyb(self, door_proposal_id, beamline, with_persons=True, start_date=None,
+                                      end_date=None):
+        """
+           Get the proposal sessions data from DOOR in format for py-ispyb
+
+           :param str door_proposal_id: The DOOR proposal id
+           :param str beamline: The beamline name (to filter sessions from commisioning proposals)
+           :param boolean with_persons: True/False depending if the session participants data is needed
+        """
+        door_sessions = await self.get_session_models(door_proposal_id, beamline, start_date, end_date)
+        sessions, lookups = DoorPyISPyB.format_sessions(door_sessions, with_persons)
+        users = await asyncio.gather(*[self.get_user_to_pyispyb(user_id, participant_type is not None)
+                                       for _, participant_type, user_id in lookups])
+        DoorPyISPyB.add_session_users(lookups, users)
+        return sessions
+
+    async def get_participants(self, participants, participant_type):
+        """
+           Helper function to setup the session participants data
+        """
+        if not participants[participant_type]:
+            return None
+        participant_ids = self.get_participant_ids(participants, participant_type)
+        users = await asyncio.gather(*[self.get_user_to_pyispyb(participant_id, True) for participant_id in participant_ids])
+        return [DoorPyISPyB.set_participant_options(user, participant_type) for user in users]
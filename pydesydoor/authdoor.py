@@ -0,0 +1,67 @@
+import sys
+from argparse import ArgumentParser
+
+
+def create_arg_parser():
+    parser = ArgumentParser(description="Local DOOR login and roles service, sharing pooled DOOR connections and a "
+                                        "role cache between the services of a host (ISPyB, beamline GUIs).")
+    parser.add_argument("--host", help="Address to listen on (default 127.0.0.1)", required=False, default="127.0.0.1")
+    parser.add_argument("-p", "--port", help="Port to listen on (default 8765)", required=False, type=int, default=8765)
+    parser.add_argument("-u", "--unix-socket", help="Listen on this Unix socket instead of a TCP port", required=False)
+    parser.add_argument("-c", "--concurrency", help="Requests handled at the same time (default 32)", required=False,
+                        type=int, default=32)
+    parser.add_argument("--queue-timeout", help="Seconds a request waits for a slot before a 503 (default 5)",
+                        required=False, type=float, default=5.0)
+    parser.add_argument("--token-file", help="File holding the shared token that the callers of GET /roles send in the "
+                                             "X-Auth-Token header. Without it, GET /roles is only answered on a Unix "
+                                             "socket", required=False)
+    parser.add_argument("--door-concurrency", help="Maximum number of DOOR requests in flight (default no limit)",
+                        required=False, type=int)
+    parser.add_argument("--roles-ttl", help="Seconds the roles of a user are cached (default 300)", required=False,
+                        type=float, default=300)
+    parser.add_argument("--no-roles-ttl", help="Seconds the absence of roles is cached (default 60)", required=False,
+                        type=float, default=60)
+    parser.add_argument("--log-file", help="Append the logs to this file instead of stderr", required=False)
+    parser.add_argument("--log-level", help="Lowest level logged (default WARNING)", required=False,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="WARNING")
+    parser.add_argument("--log-json", help="Log one JSON object per line", required=False, action="store_true")
+    return parser
+
+
+def create_server(parsed_args):
+    from pydesydoor.desydoorauth import DesyDoorAuth
+    from pydesydoor.doorauthserver import DoorAuthServer
+    from pydesydoor.doorcache import DoorCache
+    from pydesydoor.doorlimit import AdaptiveConcurrencyLimit, DoorRateLimiter
+    rate_limiter, token = None, None
+    if parsed_args.token_file:
+        with open(parsed_args.token_file) as f:
+            token = f.read().strip()
+    if parsed_args.door_concurrency:
+        limit = AdaptiveConcurrencyLimit(initial=parsed_args.door_concurrency, max_limit=parsed_args.door_concurrency)
+        rate_limiter = DoorRateLimiter(concurrency=limit)
+    role_cache = DoorCache(max_size=16384, ttl=parsed_args.roles_ttl, negative_ttl=parsed_args.no_roles_ttl)
+    # A worker and a pooled connection for the roles of every request handled at the same time
+    client = DesyDoorAuth(role_cache=role_cache, max_workers=parsed_args.concurrency,
+                          pool_maxsize=2 * parsed_args.concurrency, rate_limiter=rate_limiter)
+    return DoorAuthServer(client, parsed_args.host, parsed_args.port, parsed_args.unix_socket,
+                          max_concurrency=parsed_args.concurrency, queue_timeout=parsed_args.queue_timeout, token=token)
+
+
+def main(argv):
+    from pydesydoor.doorlog import configure_logging
+    parsed_args = create_arg_parser().parse_args(argv)
+    server = create_server(parsed_args)
+    print(f"Listening on {server.url}")
+    with configure_logging(parsed_args.log_file, parsed_args.log_level, parsed_args.log_json):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            server.client.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
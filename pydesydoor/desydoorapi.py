@@ -1,15 +1,28 @@
-import os
+import time
 import logging
-import logging.handlers
-from datetime import datetime
+import threading
+import contextvars
+from datetime import date, datetime, timedelta
 import requests.packages.urllib3
-from requests import post, get, exceptions
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
 from functools import wraps
-from dotenv import load_dotenv
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from pydesydoor.jsonstream import iter_object_items
+from pydesydoor.doormodel import DoorProposal, DoorSession, DoorUser, DoorInstitute
+from pydesydoor.serializer import PrettyJSONSerializer
+from pydesydoor.doorcache import get_id_key
+from pydesydoor.doorflight import SingleFlight
+from pydesydoor.doorlog import log_request
+from pydesydoor.doorretry import RetryPolicy, get_timeouts, get_url_family, get_deadline
+from pydesydoor.doorsettings import get_settings
 
-requests.packages.urllib3.disable_warnings()
-logging.basicConfig(filename='desydoorapi.log', filemode='a', format='%(asctime)s - %(levelname)s - %(message)s',
-                    level=logging.DEBUG)
+# Size of the chunks read from the streamed DOOR responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Nothing is logged unless the caller configures logging, see pydesydoor.doorlog.configure_logging
+logger = logging.getLogger(__name__)
 
 """
     Decorator for requests exception handling.
@@ -23,28 +36,256 @@ def requests_exceptions(func):
         try:
             func(*args, **kwargs)
         except exceptions.HTTPError as e:
-            logging.warning(e)
+            logger.warning(e)
 
     return wrapper
 
 
+def close_response(future):
+    # Release the connection of a request whose response is not used (Ex: the loser of a hedged request)
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
 class DesyDoorAPI(object):
     """
     RESTful Web-service API client for DESY Door user portal.
+
+    Every client owns a pooled keep-alive HTTP session, so consecutive calls reuse the
+    same TCP/TLS connections instead of paying a new handshake per request. The session
+    is only created by the first request, so a client is cheap to construct.
+
+       :param int pool_connections: Number of connection pools (one per host) to keep
+       :param int pool_maxsize: Maximum number of connections kept alive per host
+       :param bool pool_block: True to block when all the connections of a pool are in use
+       :param requests.Session http_session: An already configured session to share between clients
+       :param DoorCache cache: Optional entity cache for users, institutes and proposals
+       :param DoorResponseCache response_cache: Optional persistent cache of the DOOR GET responses
+       :param int max_workers: Maximum number of DOOR lookups run in parallel (1 runs them one after another)
+       :param serializer: Serializer of the generated payloads (see pydesydoor.serializer), pretty JSON str by default
+       :param DoorTracer tracer: Optional tracer recording the DOOR calls and the operations they belong to
+       :param timeout: (connect, read) timeouts of the DOOR requests: seconds, a tuple, or a dict of them by
+                       endpoint family (Ex: {"experiments": (3.05, 120)}). See pydesydoor.doorretry.DEFAULT_TIMEOUTS
+       :param RetryPolicy retry: Retries of the failed GETs, RetryPolicy() by default, False for none
+       :param HedgePolicy hedge: Optional hedging of the GETs slower than a latency percentile
+       :param DoorRateLimiter rate_limiter: Optional rate and concurrency limits, can be shared between clients
+       :param boolean coalesce: True to share one request between the concurrent identical GETs (same url)
+       :param DoorSettings settings: The DOOR settings, the ones of the environment (and .env file) by default
+       :param DoorSnapshot snapshot: Answer the DOOR requests from a snapshot (read-only), without any network call
     """
 
-    def __init__(self):
-        load_dotenv()
-        self.__door_rest_root = os.environ["DOOR_REST_ROOT"] or None
-        self.__door_rest_token = os.environ["DOOR_REST_TOKEN"] or None
-        self.__door_rest_service_account = os.environ["DOOR_SERVICE_ACCOUNT"] or None
-        self.__door_rest_service_password = os.environ["DOOR_SERVICE_PASSWORD"] or None
+    # Longest date range (in days) for which the sessions of a proposal are taken from the beamline sessions
+    BEAMLINE_WINDOW_MAX_DAYS = 92
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, pool_block=False, http_session=None, cache=None,
+                 response_cache=None, max_workers=1, serializer=None, tracer=None, timeout=None, retry=None,
+                 hedge=None, rate_limiter=None, coalesce=True, settings=None, snapshot=None):
+        # Read once per process, see pydesydoor.doorsettings
+        settings = settings or get_settings()
+        self.__door_rest_root = settings.get("DOOR_REST_ROOT")
+        self.__door_rest_token = settings.get("DOOR_REST_TOKEN")
+        self.__door_rest_service_account = settings.get("DOOR_SERVICE_ACCOUNT")
+        self.__door_rest_service_password = settings.get("DOOR_SERVICE_PASSWORD")
         # Set required door token header for any HTTP call
         self.__door_header_token = {"x-door-token": self.__door_rest_token}
         # Set door service account headers
         self.__door_service_headers = {"x-door-token": self.__door_rest_token,
                                        "x-door-service-account": self.__door_rest_service_account,
                                        "x-door-service-auth": self.__door_rest_service_password}
+        # A shared session is owned by whoever created it, so it is not closed by this client
+        self.__owns_http_session = http_session is None
+        self.__http_session = http_session
+        # Keep at least one connection alive per worker
+        self.__pool_options = (pool_connections, max(pool_maxsize, max_workers), pool_block)
+        self.__http_session_lock = threading.Lock()
+        self.__cache = cache
+        self.__response_cache = response_cache
+        self.__max_workers = max_workers
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+        self.__worker_state = threading.local()
+        self.__serializer = serializer or PrettyJSONSerializer()
+        self.__tracer = tracer
+        self.__timeouts = get_timeouts(timeout)
+        self.__retry = RetryPolicy() if retry is None else retry or None
+        self.__hedge = hedge
+        self.__hedge_executor = None
+        self.__rate_limiter = rate_limiter
+        self.__single_flight = SingleFlight() if coalesce else None
+        self.__snapshot = snapshot
+
+    @staticmethod
+    def create_http_session(pool_connections=4, pool_maxsize=10, pool_block=False):
+        """
+           Create a keep-alive HTTP session backed by a thread-safe urllib3 connection pool.
+           The TLS connections stay open in the pool and are reused by the next request.
+
+           :param int pool_connections: Number of connection pools (one per host) to keep
+           :param int pool_maxsize: Maximum number of connections kept alive per host
+           :param bool pool_block: True to block when all the connections of a pool are in use
+        """
+        session = Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = False
+        # The DOOR certificates are not verified, so do not warn about it on every request
+        requests.packages.urllib3.disable_warnings()
+        return session
+
+    def get_http_session(self):
+        """
+           The HTTP session of the client, created on first use
+        """
+        session = self.__http_session
+        if session is None:
+            with self.__http_session_lock:
+                if self.__http_session is None:
+                    self.__http_session = self.create_http_session(*self.__pool_options)
+                session = self.__http_session
+        return session
+
+    def get_cache(self):
+        return self.__cache
+
+    def get_response_cache(self):
+        return self.__response_cache
+
+    def get_cached(self, entity_type, entity_id, fetch):
+        """
+           Return an entity from the cache (when the client has one) or fetch it from DOOR.
+           Cached entities are shared between callers and must not be modified.
+        """
+        if self.__cache is None:
+            return fetch(entity_id)
+        if self.__tracer is None:
+            return self.__cache.get_or_fetch(entity_type, entity_id, lambda: fetch(entity_id))
+        fetched = []
+        value = self.__cache.get_or_fetch(entity_type, entity_id, lambda: fetched.append(True) or fetch(entity_id))
+        if not fetched:
+            self.__tracer.add_cache_hit(entity_type, entity_id)
+        return value
+
+    def get_tracer(self):
+        return self.__tracer
+
+    def trace(self, *name):
+        """
+           Context of a traced operation (Ex: self.trace("user", 12)), nothing is done without a tracer
+        """
+        if self.__tracer is None:
+            return nullcontext()
+        return self.__tracer.operation(" ".join(str(part) for part in name))
+
+    def get_serializer(self):
+        return self.__serializer
+
+    def get_retry_policy(self):
+        return self.__retry
+
+    def get_hedge_policy(self):
+        return self.__hedge
+
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def get_snapshot(self):
+        return self.__snapshot
+
+    def get_single_flight(self):
+        """
+           The coalescing of the identical GETs, with its counters (get_stats()), None when disabled
+        """
+        return self.__single_flight
+
+    def send_request(self, method, url, send):
+        """
+           Send a request within the limits of the rate limiter of the client (if any) and log it
+
+           :param str method: The HTTP method. Ex: "GET"
+           :param str url: The url of the request
+           :param callable send: Function sending the request and returning its response
+        """
+        if self.__rate_limiter is None:
+            return log_request(method, url, send)
+        return self.__rate_limiter.call(lambda: log_request(method, url, send), get_url_family(url))
+
+    def get_timeout(self, url):
+        """
+           The (connect, read) timeout of a DOOR url, capped by the deadline of the running operation if any
+        """
+        timeout = self.__timeouts.get(get_url_family(url), self.__timeouts["default"])
+        current = get_deadline()
+        return timeout if current is None else current.cap_timeout(timeout)
+
+    def serialize(self, data):
+        """
+           Serialize a generated payload with the serializer of the client (str or bytes)
+        """
+        return self.__serializer.dumps(data)
+
+    def get_max_workers(self):
+        return self.__max_workers
+
+    def map_concurrent(self, func, items):
+        """
+           Apply func to every item and return the results in the same order as the items.
+           With max_workers > 1 the calls run in a bounded thread pool, otherwise one after another.
+           Calls made from inside a worker run serially, so nested lookups cannot exhaust the pool.
+
+           :param callable func: Function doing the (DOOR) lookup for one item
+           :param iterable items: The items to look up. Ex: a list of user ids
+        """
+        items = list(items)
+        if self.__max_workers <= 1 or len(items) <= 1 or getattr(self.__worker_state, "active", False):
+            return [func(item) for item in items]
+        # Every call runs in a copy of the caller context, so it stays within the traced operation of the caller
+        contexts = [contextvars.copy_context() for _ in items]
+        return list(self.__get_executor().map(lambda context, item: context.run(self.__run_in_worker, func, item),
+                                              contexts, items))
+
+    def __run_in_worker(self, func, item):
+        self.__worker_state.active = True
+        try:
+            return func(item)
+        finally:
+            self.__worker_state.active = False
+
+    def __get_executor(self):
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers,
+                                                     thread_name_prefix=type(self).__name__)
+            return self.__executor
+
+    def __get_hedge_executor(self):
+        # Apart from the lookup pool, so a hedged request never waits for a busy lookup worker
+        with self.__executor_lock:
+            if self.__hedge_executor is None:
+                self.__hedge_executor = ThreadPoolExecutor(max_workers=2 * max(1, self.__max_workers),
+                                                           thread_name_prefix=type(self).__name__ + "Hedge")
+            return self.__hedge_executor
+
+    def close(self):
+        """
+           Close the pooled connections of this client (shared sessions are left open).
+        """
+        with self.__executor_lock:
+            if self.__executor is not None:
+                self.__executor.shutdown()
+                self.__executor = None
+            if self.__hedge_executor is not None:
+                self.__hedge_executor.shutdown()
+                self.__hedge_executor = None
+        if self.__owns_http_session and self.__http_session is not None:
+            self.__http_session.close()
+            self.__http_session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def get_door_rest_root(self):
         return self.__door_rest_root
@@ -52,54 +293,176 @@ class DesyDoorAPI(object):
     def get_door_header_token(self):
         return self.__door_header_token
 
-    def get_door_request(self, url):
-        r = get(self.__door_rest_root + url, headers=self.__door_service_headers, verify=False)
+    def get_door_request(self, url, stream=False):
+        if self.__tracer is None:
+            r = self.__get_coalesced(url, stream)
+        else:
+            with self.__tracer.call("GET", url) as span:
+                r = self.__get_coalesced(url, stream, span)
+                self.__tracer.record_response(span, r)
         r.raise_for_status()
         return r
 
+    def __get_coalesced(self, url, stream=False, span=None):
+        if self.__snapshot is not None:
+            if span is not None:
+                span.cache = "snapshot"
+            return self.__snapshot.get_response(url)
+        # A streamed body can only be read once, so streamed GETs are never shared
+        if self.__single_flight is None or stream:
+            return self.__get(url, stream, span)
+        r, shared = self.__single_flight.do(url, lambda: self.__get(url, span=span))
+        if shared and span is not None:
+            span.cache = "coalesced"
+        return r
+
+    def __get(self, url, stream=False, span=None):
+        # Streamed responses are read incrementally, so they are not stored in the response cache
+        if self.__response_cache is None or stream:
+            return self.__send_get(url, stream=stream)
+        if span is None:
+            return self.__response_cache.get_response(url, lambda headers: self.__send_get(url, headers))
+        sent = []
+        r = self.__response_cache.get_response(url, lambda headers: sent.append(self.__send_get(url, headers)) or sent[0])
+        if self.__response_cache.get_max_age(url) is not None:
+            span.cache = "miss" if sent and sent[0].status_code != 304 else ("revalidated" if sent else "hit")
+        return r
+
+    def __send_get(self, url, extra_headers=None, stream=False):
+        headers = self.__door_service_headers
+        if extra_headers:
+            headers = dict(headers, **extra_headers)
+        if self.__retry is None:
+            return self.__send_hedged(url, headers, stream)
+        return self.__retry.run(lambda: self.__send_hedged(url, headers, stream), url)
+
+    def __send_hedged(self, url, headers, stream=False):
+        # Streamed responses hold their connection while they are read, so they are never hedged
+        delay = None if self.__hedge is None or stream else self.__hedge.get_delay(get_url_family(url))
+        if delay is None:
+            return self.__send_once(url, headers, stream)
+        executor = self.__get_hedge_executor()
+        first = executor.submit(contextvars.copy_context().run, self.__send_once, url, headers)
+        try:
+            return first.result(timeout=delay)
+        except FuturesTimeoutError:
+            pass
+        self.__hedge.add_hedge()
+        second = executor.submit(contextvars.copy_context().run, self.__send_once, url, headers)
+        return self.get_first_response([first, second])
+
+    def __send_once(self, url, headers, stream=False):
+        start_time = time.perf_counter()
+        r = self.send_request("GET", url, lambda: self.get_http_session().get(self.__door_rest_root + url,
+                                                                              headers=headers, stream=stream,
+                                                                              timeout=self.get_timeout(url)))
+        if self.__hedge is not None and r.status_code < 500:
+            self.__hedge.add_latency(get_url_family(url), time.perf_counter() - start_time)
+        return r
+
+    @staticmethod
+    def get_first_response(futures):
+        """
+           The response of the first request to succeed, the others are closed when they are done.
+           The error of the last request is raised when they all failed.
+        """
+        error = None
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                continue
+            for other in futures:
+                if other is not future:
+                    other.add_done_callback(close_response)
+            return future.result()
+        raise error
+
+    def iter_door_items(self, url, key):
+        """
+           Iterate over the (id, data) items of a DOOR response (Ex: the sessions under "experiment metadata")
+           while the response body is downloaded and parsed, without holding the whole document in memory.
+
+           :param str url: The DOOR url relative to the REST root
+           :param str key: The key of the items in the DOOR response. Ex: "experiment metadata"
+        """
+        r = self.get_door_request(url, stream=True)
+        try:
+            for item in iter_object_items(r.iter_content(chunk_size=STREAM_CHUNK_SIZE), key):
+                yield item
+        finally:
+            r.close()
+
     def post_door_request(self, url):
-        r = post(self.__door_rest_root + url, headers=self.__door_service_headers, verify=False)
+        if self.__snapshot is not None:
+            r = self.__snapshot.get_response(url, "POST")
+        elif self.__tracer is None:
+            r = self.send_request("POST", url, lambda: self.get_http_session().post(self.__door_rest_root + url,
+                                                                                    headers=self.__door_service_headers,
+                                                                                    timeout=self.get_timeout(url)))
+        else:
+            with self.__tracer.call("POST", url) as span:
+                r = self.send_request("POST", url,
+                                      lambda: self.get_http_session().post(self.__door_rest_root + url,
+                                                                           headers=self.__door_service_headers,
+                                                                           timeout=self.get_timeout(url)))
+                self.__tracer.record_response(span, r)
         r.raise_for_status()
         return r
 
-    def get_beamline_proposals(self, beamline):
-        r = self.get_door_request("/proposals/beamline/{}".format(beamline))
+    @staticmethod
+    def read_door_response(r, *keys):
+        """
+           Read the data under the given keys from a DOOR JSON response.
+           Returns None (and logs the DOOR message) when the data is not there.
+
+           :param r: The DOOR response
+           :param keys: The keys to follow in the JSON document. Ex: "user metadata", "1"
+        """
         if r.status_code == 200:
             try:
-                return r.json()['proposals']
+                data = r.json()
+                for key in keys:
+                    data = data[key]
+                return data
             except KeyError:
-                logging.warning(r.json()['message'])
+                logger.warning(r.json()['message'])
         return None
 
+    def get_beamline_proposals(self, beamline):
+        r = self.get_door_request("/proposals/beamline/{}".format(beamline))
+        return self.read_door_response(r, 'proposals')
+
     def get_beamline_proposals_by_year(self, beamline, year):
         r = self.get_door_request("/proposals/beamline/{}/year/{}".format(beamline, year))
-        if r.status_code == 200:
-            try:
-                return r.json()['proposals']
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'proposals')
 
-    def get_beamline_proposals_by_date_range(self, beamline, start_date, end_date):
-        # date format YYYYMMDD
-        r = self.get_door_request("/proposals/beamline/{}/date/{}/{}".format(beamline, start_date, end_date))
-        if r.status_code == 200:
-            try:
-                return r.json()['proposals']
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+    def get_beamline_proposals_by_date_range(self, beamline, start_date, end_date, window=None):
+        """
+           Get the proposals of a beamline with sessions within a date range (date format YYYYMMDD)
+
+           :param window: Split the range into windows fetched in parallel, see get_by_date_windows. Ex: "month"
+        """
+        return self.get_by_date_windows("/proposals/beamline/" + str(beamline) + "/date/{}/{}", 'proposals',
+                                        start_date, end_date, window)
 
     def get_proposal(self, proposal_id):
+        return self.get_cached("proposal", proposal_id, self._fetch_proposal)
+
+    def _fetch_proposal(self, proposal_id):
         r = self.get_door_request("/proposals/propid/{}".format(proposal_id))
-        if r.status_code == 200:
-            try:
-                return r.json()['proposals'][proposal_id]
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'proposals', proposal_id)
+
+    def get_proposal_model(self, proposal_id):
+        """
+           Get a proposal as DoorProposal, built once and cached like the DOOR entities
+        """
+        return self.get_cached("proposal model", proposal_id, self._fetch_proposal_model)
 
-    def get_proposal_sessions(self, proposal_id, beamline, start_date=None, end_date=None):
+    def _fetch_proposal_model(self, proposal_id):
+        door_proposal = self._fetch_proposal(proposal_id)
+        return None if door_proposal is None else DoorProposal.from_door(proposal_id, door_proposal)
+
+    def get_proposal_sessions(self, proposal_id, beamline, start_date=None, end_date=None, strategy="auto"):
         '''
             Commisioning proposals contains sessions from different beamlines. Ex: C-20010001
             Here we filter by beamline to make sure we get sessions from a specific beamline
@@ -108,107 +471,341 @@ class DesyDoorAPI(object):
            :param str beamline: the beamline name. Ex: P11
            :param str start_date (%Y-%m-%d): the start date range to find sessions
            :param str end_date (%Y-%m-%d): the end date range to find sessions
+           :param str strategy: "proposal" to get all the proposal sessions from DOOR and filter them,
+                                "beamline" to get the beamline sessions of the date range and keep the ones of the proposal,
+                                "auto" to use the cheaper one (see get_sessions_strategy). Both return the same sessions.
         '''
+        date_range = self.parse_date_range(start_date, end_date)
+        door_sessions, session_proposal_id = self._fetch_sessions(proposal_id, beamline, date_range, strategy)
+        if door_sessions is None:
+            return None
+        return self.filter_sessions(door_sessions, beamline, start_date, end_date, session_proposal_id)
+
+    def get_session_models(self, proposal_id, beamline, start_date=None, end_date=None, strategy="auto"):
+        """
+           Same sessions as get_proposal_sessions, as DoorSession. The DOOR dates are parsed once per session.
+        """
+        date_range = self.parse_date_range(start_date, end_date)
+        door_sessions, session_proposal_id = self._fetch_sessions(proposal_id, beamline, date_range, strategy)
+        if door_sessions is None:
+            return None
+        return DoorSession.select(door_sessions, beamline, date_range, session_proposal_id)
+
+    def _fetch_sessions(self, proposal_id, beamline, date_range, strategy="auto"):
+        """
+           Get the DOOR sessions document to filter for the sessions of a proposal, and the proposal id
+           to filter them by (None when all the sessions are from the proposal)
+        """
+        if self.get_sessions_strategy(date_range, strategy) == "beamline":
+            r = self.get_door_request(self.get_beamline_window_url(beamline, date_range))
+            door_sessions = self.read_door_response(r, 'experiment metadata')
+            if self.has_proposal_ids(door_sessions):
+                return door_sessions, proposal_id
         r = self.get_door_request("/experiments/propid/{}".format(proposal_id))
-        date_range = False
+        return self.read_door_response(r, 'experiment metadata'), None
+
+    @staticmethod
+    def has_proposal_ids(door_sessions):
+        """
+           True when every session of a DOOR "experiment metadata" document tells its proposal, so the sessions of
+           a proposal can be picked from it. Otherwise (Ex: a window without sessions, which only has a message),
+           the beamline strategy falls back to the proposal sessions.
+        """
+        return door_sessions is not None and all(session.get("proposalId") not in (None, "")
+                                                 for session in door_sessions.values())
+
+    @classmethod
+    def get_sessions_strategy(cls, date_range, strategy="auto"):
+        """
+           Choose how the sessions of a proposal are retrieved. Without a date range only the proposal
+           endpoint can be used. With a short date range (up to BEAMLINE_WINDOW_MAX_DAYS) the beamline
+           sessions of the window are fewer than the whole session history of a long running proposal
+           (Ex: commissioning), otherwise the proposal endpoint is cheaper.
+
+           :param tuple date_range: The (start, end) dates, see parse_date_range
+           :param str strategy: "auto", "proposal" or "beamline"
+        """
+        if strategy not in ("auto", "proposal", "beamline"):
+            raise ValueError("Unknown sessions strategy: {}".format(strategy))
+        if strategy == "beamline" and not date_range:
+            raise ValueError("The beamline sessions strategy requires a date range")
+        if strategy == "auto":
+            if date_range and (date_range[1] - date_range[0]).days <= cls.BEAMLINE_WINDOW_MAX_DAYS:
+                return "beamline"
+            return "proposal"
+        return strategy
+
+    @staticmethod
+    def get_beamline_window_url(beamline, date_range):
+        # date format YYYYMMDD
+        start_date, end_date = date_range[0].strftime('%Y%m%d'), date_range[1].strftime('%Y%m%d')
+        return "/experiments/beamline/{}/date/{}/{}".format(beamline, start_date, end_date)
+
+    @classmethod
+    def filter_sessions(cls, proposal_sessions, beamline, start_date=None, end_date=None, proposal_id=None):
+        """
+           Keep the sessions of a beamline, and within a date range when both dates are given.
+           The sessions are sorted by id, so the result does not depend on the DOOR endpoint used.
+
+           :param dict proposal_sessions: The DOOR sessions by session id
+           :param str beamline: the beamline name. Ex: P11
+           :param str start_date (%Y-%m-%d): the start date range to find sessions
+           :param str end_date (%Y-%m-%d): the end date range to find sessions
+           :param str proposal_id: Only keep the sessions of a proposal
+        """
+        date_range = cls.parse_date_range(start_date, end_date)
+        sessions = [session for session in proposal_sessions.values() if cls.is_session_in(session, beamline, date_range)]
+        if proposal_id is not None:
+            sessions = [session for session in sessions if get_id_key(session["proposalId"]) == get_id_key(proposal_id)]
+        return sorted(sessions, key=lambda session: int(session["expSessionPk"]))
+
+    @staticmethod
+    def parse_date_range(start_date=None, end_date=None):
+        """
+           Parse a (%Y-%m-%d) date range, None if one of the dates is missing
+        """
         if (start_date is not None) and (end_date is not None):
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            date_range = True
-        if r.status_code == 200:
-            try:
-                sessions = []
-                proposal_sessions = r.json()['experiment metadata']
-                for session in proposal_sessions:
-                    # First filter by beamline name
-                    if proposal_sessions[session]["beamlineName"] == beamline.upper():
-                        # Second filter by date range
-                        if date_range:
-                            session_start_date = datetime.strptime(proposal_sessions[session]["startDate"], '%Y-%m-%d %H:%M:%S').date()
-                            session_end_date = datetime.strptime(proposal_sessions[session]["endDate"], '%Y-%m-%d %H:%M:%S').date()
-                            if (session_start_date >= start_date) and (session_end_date <= end_date):
-                                sessions.append(proposal_sessions[session])
-                        else:
-                            # If there is no date range just append all the sessions
-                            sessions.append(proposal_sessions[session])
-
-                return sessions
-            except KeyError:
-                logging.warning(r.json()['message'])
+            return datetime.strptime(start_date, '%Y-%m-%d').date(), datetime.strptime(end_date, '%Y-%m-%d').date()
         return None
 
+    @staticmethod
+    def is_session_in(session, beamline, date_range=None):
+        """
+           True when the session is on the beamline and, if a date range is given, within it
+
+           :param dict session: The DOOR session
+           :param str beamline: the beamline name. Ex: P11
+           :param tuple date_range: The (start, end) dates, see parse_date_range
+        """
+        # First filter by beamline name
+        if beamline is not None and session["beamlineName"] != beamline.upper():
+            return False
+        # Second filter by date range
+        if date_range:
+            session_start_date = datetime.strptime(session["startDate"], '%Y-%m-%d %H:%M:%S').date()
+            session_end_date = datetime.strptime(session["endDate"], '%Y-%m-%d %H:%M:%S').date()
+            return (session_start_date >= date_range[0]) and (session_end_date <= date_range[1])
+        # If there is no date range just keep all the sessions
+        return True
+
+    def iter_proposal_sessions(self, proposal_id, beamline, start_date=None, end_date=None):
+        """
+           Streaming version of get_proposal_sessions: the sessions are yielded one at a time while
+           the DOOR response is parsed, and filtered by beamline and date range on the way.
+
+           :param str proposal_id: The DOOR proposal id
+           :param str beamline: the beamline name. Ex: P11
+           :param str start_date (%Y-%m-%d): the start date range to find sessions
+           :param str end_date (%Y-%m-%d): the end date range to find sessions
+        """
+        date_range = self.parse_date_range(start_date, end_date)
+        for _, session in self.iter_door_items("/experiments/propid/{}".format(proposal_id), 'experiment metadata'):
+            if self.is_session_in(session, beamline, date_range):
+                yield session
+
+    def iter_beamline_sessions(self, beamline, start_date=None, end_date=None, year=None):
+        """
+           Streaming version of get_beamline_sessions(_by_year): the sessions are yielded one at a time
+           while the DOOR response is parsed, and filtered by date range on the way.
+
+           :param str beamline: the beamline name. Ex: P11
+           :param str start_date (%Y-%m-%d): the start date range to find sessions
+           :param str end_date (%Y-%m-%d): the end date range to find sessions
+           :param int year: Only ask DOOR for the sessions of a year
+        """
+        url = "/experiments/beamline/{}".format(beamline)
+        if year is not None:
+            url += "/year/{}".format(year)
+        date_range = self.parse_date_range(start_date, end_date)
+        for _, session in self.iter_door_items(url, 'experiment metadata'):
+            if self.is_session_in(session, None, date_range):
+                yield session
+
+    def iter_beamline_proposals(self, beamline, year=None):
+        """
+           Streaming version of get_beamline_proposals(_by_year): yields (proposal id, proposal)
+           one at a time while the DOOR response is parsed.
+
+           :param str beamline: the beamline name. Ex: P11
+           :param int year: Only ask DOOR for the proposals of a year
+        """
+        url = "/proposals/beamline/{}".format(beamline)
+        if year is not None:
+            url += "/year/{}".format(year)
+        return self.iter_door_items(url, 'proposals')
+
     def get_beamline_sessions(self, beamline):
         r = self.get_door_request("/experiments/beamline/{}".format(beamline))
-        if r.status_code == 200:
-            try:
-                return r.json()['experiment metadata']
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'experiment metadata')
 
     def get_beamline_sessions_by_year(self, beamline, year):
         r = self.get_door_request("/experiments/beamline/{}/year/{}".format(beamline, year))
-        if r.status_code == 200:
-            try:
-                return r.json()['experiment metadata']
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'experiment metadata')
 
-    def get_beamline_sessions_by_date_range(self, beamline, start_date, end_date):
-        # date format YYYYMMDD
-        r = self.get_door_request("/experiments/beamline/{}/date/{}/{}".format(beamline, start_date, end_date))
-        if r.status_code == 200:
-            try:
-                return r.json()['experiment metadata']
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+    def get_beamline_sessions_by_date_range(self, beamline, start_date, end_date, window=None):
+        """
+           Get the sessions of a beamline within a date range (date format YYYYMMDD)
+
+           :param window: Split the range into windows fetched in parallel, see get_by_date_windows. Ex: "month"
+        """
+        return self.get_by_date_windows("/experiments/beamline/" + str(beamline) + "/date/{}/{}", 'experiment metadata',
+                                        start_date, end_date, window)
+
+    def get_by_date_windows(self, url, key, start_date, end_date, window=None):
+        """
+           Get the items of a DOOR date range listing. With a window the range is split (see split_date_range),
+           the windows are fetched in parallel (up to max_workers) and merged by id (see merge_windows), so a
+           multi-year backfill is many small responses instead of a huge one.
+
+           :param str url: The url with {} for the start and end dates. Ex: "/experiments/beamline/P11/date/{}/{}"
+           :param str key: The key of the items in the DOOR response. Ex: "experiment metadata"
+           :param str start_date: The first day of the range, format YYYYMMDD
+           :param str end_date: The last day of the range, format YYYYMMDD
+           :param window: Days per window, "month" or "year". None for a single request
+        """
+        if window is None:
+            return self.read_door_response(self.get_door_request(url.format(start_date, end_date)), key)
+        windows = self.split_date_range(start_date, end_date, window)
+        with self.trace("windows", len(windows)):
+            results = self.map_concurrent(lambda dates: self.read_door_response(self.get_door_request(url.format(*dates)),
+                                                                                key), windows)
+        return self.merge_windows(results)
+
+    @staticmethod
+    def split_date_range(start_date, end_date, window):
+        """
+           Split a date range into consecutive windows covering it, the last one ends with the range.
+           Returns the (start, end) dates of the windows, format YYYYMMDD, the end day included.
+
+           :param str start_date: The first day of the range, format YYYYMMDD
+           :param str end_date: The last day of the range, format YYYYMMDD
+           :param window: Days per window, "month" or "year" (calendar months or years)
+        """
+        start = datetime.strptime(str(start_date), '%Y%m%d').date()
+        end = datetime.strptime(str(end_date), '%Y%m%d').date()
+        if window not in ("month", "year") and not (isinstance(window, int) and window > 0):
+            raise ValueError("Unknown date window: {}".format(window))
+        windows = []
+        while start <= end:
+            if window == "month":
+                next_start = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            elif window == "year":
+                next_start = date(start.year + 1, 1, 1)
+            else:
+                next_start = start + timedelta(days=window)
+            window_end = min(next_start - timedelta(days=1), end)
+            windows.append((start.strftime('%Y%m%d'), window_end.strftime('%Y%m%d')))
+            start = next_start
+        # DOOR answers an empty range like the single request does
+        return windows or [(str(start_date), str(end_date))]
+
+    @staticmethod
+    def merge_windows(results):
+        """
+           Merge the items (by id) of the windows of a date range listing. DOOR lists the items overlapping
+           a window, so an item across two windows (Ex: a session over the end of a month) comes twice and is
+           kept once. The result is equal to the listing of the whole range, None when no window has items.
+
+           :param list results: The items by id of every window, None for the windows without items
+        """
+        merged = None
+        for items in results:
+            if items is not None:
+                if merged is None:
+                    merged = {}
+                for item_id, item in items.items():
+                    merged.setdefault(item_id, item)
+        return merged
 
     def get_session(self, session_id):
         r = self.get_door_request("/experiments/expid/{}".format(session_id))
-        if r.status_code == 200:
-            try:
-                return r.json()['experiment metadata'][session_id]
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'experiment metadata', session_id)
 
     def get_user(self, user_id):
+        return self.get_cached("user", user_id, self._fetch_user)
+
+    def _fetch_user(self, user_id):
         r = self.get_door_request("/users/id/{}".format(user_id))
-        if r.status_code == 200:
-            try:
-                return r.json()['user metadata'][str(user_id)]
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_door_response(r, 'user metadata', str(user_id))
+
+    def get_user_model(self, user_id):
+        """
+           Get a user as DoorUser, built once and cached like the DOOR entities
+        """
+        return self.get_cached("user model", user_id, self._fetch_user_model)
+
+    def _fetch_user_model(self, user_id):
+        door_user = self._fetch_user(user_id)
+        return None if door_user is None else DoorUser.from_door(user_id, door_user)
 
     def get_user_roles(self, user_id):
         r = self.get_door_request("/roles/userid/{}".format(user_id))
+        return self.read_user_roles(r, user_id)
+
+    @staticmethod
+    def read_user_roles(r, user_id):
         if r.status_code == 200:
             try:
                 roles = r.json()['roles']
                 return roles
             except KeyError:
-                logging.warning('No roles assigned to userid: %s', user_id)
+                logger.warning('No roles assigned to userid: %s', user_id)
                 return False
         else:
-            logging.warning('Roles could not be checked for userid: %s', user_id)
+            logger.warning('Roles could not be checked for userid: %s', user_id)
         return False
 
     def get_institute(self, institute_id):
+        return self.get_cached("institute", institute_id, self._fetch_institute)
+
+    def _fetch_institute(self, institute_id):
         r = self.get_door_request("/institutes/id/{}".format(institute_id))
-        if r.status_code == 200:
-            try:
-                json_institute = r.json()['institute metadata'][str(institute_id)]
-                # ISPyB only accepts 45 chars as institute name
-                if len(json_institute["name"]) > 45:
-                    json_institute["name"] = json_institute["name"][:45]
-                return json_institute
-            except KeyError:
-                logging.warning(r.json()['message'])
-        return None
+        return self.read_institute(r, institute_id)
+
+    def get_institute_model(self, institute_id):
+        """
+           Get an institute as DoorInstitute, built once and cached like the DOOR entities
+        """
+        return self.get_cached("institute model", institute_id, self._fetch_institute_model)
 
-    def split_multiple_by_comma(self, multiple_values):
+    def _fetch_institute_model(self, institute_id):
+        door_institute = self._fetch_institute(institute_id)
+        return None if door_institute is None else DoorInstitute.from_door(institute_id, door_institute)
+
+    @classmethod
+    def read_institute(cls, r, institute_id):
+        json_institute = cls.read_door_response(r, 'institute metadata', str(institute_id))
+        if json_institute is not None:
+            # ISPyB only accepts 45 chars as institute name
+            if len(json_institute["name"]) > 45:
+                json_institute["name"] = json_institute["name"][:45]
+        return json_institute
+
+    @staticmethod
+    def split_multiple_by_comma(multiple_values):
         data = [x.strip() for x in multiple_values.split(',')]
         return data
+
+    @classmethod
+    def get_cowriter_ids(cls, door_proposal):
+        """
+           Get the proposal co-writer ids. DOOR returns an int for a single co-writer
+           and a comma separated string for more than one.
+        """
+        if not door_proposal["proposalCowriters"]:
+            return []
+        if isinstance(door_proposal["proposalCowriters"], int):
+            return [door_proposal["proposalCowriters"]]
+        return cls.split_multiple_by_comma(door_proposal["proposalCowriters"])
+
+    @classmethod
+    def get_participant_ids(cls, participants, participant_type):
+        """
+           Get the user ids of the session participants of a type. Ex: "remote", "on-site", "data-only"
+        """
+        if not participants[participant_type]:
+            return []
+        # Already parsed participant ids. Ex: DoorSession.participants
+        if isinstance(participants[participant_type], (list, tuple)):
+            return list(participants[participant_type])
+        return [x for x in cls.split_multiple_by_comma(str(participants[participant_type])) if x]
@@ -1,23 +1,50 @@
 import json
 import base64
 import logging
-import logging.handlers
-from requests import post, get
+from requests.exceptions import RequestException
 from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doorcache import DoorCache
+
+logger = logging.getLogger(__name__)
 
 
 class DesyDoorAuth(DesyDoorAPI):
     """
     RESTful Web-service user authentication client for DESY Door user portal.
+
+    The roles of the users are cached: the roles found for ROLES_TTL seconds, "no roles" for NO_ROLES_TTL
+    seconds. The passwords are never cached, every login is checked by DOOR.
+
+       :param DoorCache role_cache: Cache of the user roles (and of the user ids of the logins), False for none
+       :param int max_workers: Parallel DOOR requests, 2 or more to check a password while the roles are fetched.
+                              Shared by the concurrent logins, Ex: as many as the concurrent logins expected
+       :param kwargs: The options of DesyDoorAPI. Ex: pool_maxsize, timeout, rate_limiter
     """
 
-    def get_door_request(self, url):
-        r = get(url, headers=self.get_door_header_token(), verify=False)
+    # Seconds the roles of a user are cached, and the absence of roles
+    ROLES_TTL = 300
+    NO_ROLES_TTL = 60
+
+    def __init__(self, role_cache=None, max_workers=2, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        if role_cache is None:
+            role_cache = DoorCache(max_size=4096, ttl=self.ROLES_TTL, negative_ttl=self.NO_ROLES_TTL)
+        # An empty cache is falsy, so only False disables it
+        self.__role_cache = None if role_cache is False else role_cache
+
+    def get_role_cache(self):
+        return self.__role_cache
+
+    def get_door_request(self, url, stream=False):
+        r = self.send_request("GET", url, lambda: self.get_http_session().get(url, headers=self.get_door_header_token(),
+                                                                              timeout=self.get_timeout(url),
+                                                                              stream=stream))
         r.raise_for_status()
         return r
 
     def post_door_request(self, url):
-        r = post(url, headers=self.get_door_header_token(), verify=False)
+        r = self.send_request("POST", url, lambda: self.get_http_session().post(url, headers=self.get_door_header_token(),
+                                                                                timeout=self.get_timeout(url)))
         r.raise_for_status()
         return r
 
@@ -27,25 +54,94 @@ class DesyDoorAuth(DesyDoorAPI):
         base64_bytes = base64.b64encode(message_bytes)
         base64_password = base64_bytes.decode('ascii')
         # Make an HTTP post request with username and encoded password
-        r = post(self.get_door_rest_root() + "/doorauth/auth",
-                 data={'user': username, 'pass': base64_password}, headers=self.get_door_header_token(), verify=False)
+        r = self.send_request("POST", "/doorauth/auth",
+                              lambda: self.get_http_session().post(self.get_door_rest_root() + "/doorauth/auth",
+                                                                   data={'user': username, 'pass': base64_password},
+                                                                   headers=self.get_door_header_token(),
+                                                                   timeout=self.get_timeout("/doorauth/auth")))
         if r.status_code == 200:
             # status 200 means user authenticated
-            logging.info('Username has been succesfully authenticated: %s', username)
+            logger.info('Username has been succesfully authenticated: %s', username)
             return True, r.json()['userdata']['userid']
         elif r.status_code == 401:
             # status 401 means unauthorized for different reasons: wrong password, wrong token,
             # server not allowed to connect to
             try:
                 json_response = json.loads(r.text)
-                logging.warning('%s - %s', json_response["message"], username)
+                logger.warning('%s - %s', json_response["message"], username)
             except json.decoder.JSONDecodeError:
-                logging.warning("Error decoding JSON response %s", r.status_code)
-                logging.warning(r.text)
+                logger.warning("Error decoding JSON response %s", r.status_code)
+                logger.warning(r.text)
         elif r.status_code == 404:
             # status 404 means username does not exist
-            logging.warning('Username does not exist: %s', username)
+            logger.warning('Username does not exist: %s', username)
         elif r.status_code == 400:
             # status 400 means no valid api call
-            logging.error('%s - %s', r.text, r.url)
+            logger.error('%s - %s', r.text, r.url)
         return False
+
+    def get_user_roles(self, user_id):
+        """
+           Get the roles of a user from the role cache, or from DOOR with the service account
+        """
+        if self.__role_cache is None:
+            return self._fetch_user_roles(user_id)
+        found, roles, _ = self.__role_cache.get("roles", user_id)
+        if found:
+            return roles
+        roles = self._fetch_user_roles(user_id)
+        # No roles is cached for a shorter time, so newly granted roles show up soon
+        self.__role_cache.set("roles", user_id, roles, None if roles else self.__role_cache.negative_ttl)
+        return roles
+
+    def _fetch_user_roles(self, user_id):
+        # Unlike the authentication, the roles need the service account headers of DesyDoorAPI
+        r = super().get_door_request("/roles/userid/{}".format(user_id))
+        return self.read_user_roles(r, user_id)
+
+    def authenticate_and_authorize(self, username, password):
+        """
+           Authenticate a user and get their roles in a single call. The password is always checked by DOOR.
+           For a user who logged in before, the roles are fetched at the same time as the password is checked,
+           and only returned when the authentication succeeds with the same user id.
+
+           :param str username: The DOOR username
+           :param str password: The DOOR password
+           :return: (True, user_id, roles) with roles False when the user has none, or False when not authenticated
+        """
+        user_id = self.get_known_user_id(username)
+        if user_id is None or self.__role_cache.get("roles", user_id)[0]:
+            # Unknown user, or roles already cached: nothing to fetch in parallel
+            auth, roles = self.login(username, password), None
+        else:
+            auth, roles = self.map_concurrent(lambda call: call(), [lambda: self.login(username, password),
+                                                                    lambda: self.__prefetch_user_roles(user_id)])
+        if not auth:
+            return False
+        if roles is None or str(auth[1]) != str(user_id):
+            roles = self.get_user_roles(auth[1])
+        if self.__role_cache is not None:
+            self.__role_cache.set("login", username, auth[1])
+        return True, auth[1], roles
+
+    def get_known_user_id(self, username):
+        """
+           The user id of the last successful login of a username, None when unknown or without role cache
+        """
+        if self.__role_cache is None:
+            return None
+        return self.__role_cache.get("login", username)[1]
+
+    def __prefetch_user_roles(self, user_id):
+        # Fetched on a guess, so a failure is only retried once the user is authenticated
+        try:
+            return self.get_user_roles(user_id)
+        except RequestException:
+            return None
+
+    def invalidate_user_roles(self, user_id=None):
+        """
+           Forget the cached roles of a user, or of every user. Ex: after a change of roles in DOOR
+        """
+        if self.__role_cache is not None:
+            self.__role_cache.invalidate("roles", user_id)
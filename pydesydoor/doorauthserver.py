@@ -0,0 +1,309 @@
+import os
+import json
+import hmac
+import stat
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+# Largest request body read, credentials are much smaller
+MAX_BODY_SIZE = 8192
+
+
+class LatencyMetrics(object):
+    """
+    Thread-safe request counters and latency percentiles by endpoint, over the last window requests.
+
+       :param int window: Latencies kept by endpoint for the percentiles
+    """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.__endpoints = {}
+        self.__lock = threading.Lock()
+
+    def add(self, endpoint, latency, error=False):
+        with self.__lock:
+            metrics = self.__endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self.__endpoints[endpoint] = {"count": 0, "errors": 0, "latencies": deque(maxlen=self.window)}
+            metrics["count"] += 1
+            metrics["errors"] += int(error)
+            metrics["latencies"].append(latency)
+
+    @staticmethod
+    def get_percentile(latencies, percentile):
+        # Nearest rank of sorted latencies
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))]
+
+    def get_stats(self):
+        """
+           Count, errors and p50/p95/p99/max latencies (in milliseconds) by endpoint. Ex: "POST /auth"
+        """
+        with self.__lock:
+            endpoints = {endpoint: (metrics["count"], metrics["errors"], sorted(metrics["latencies"]))
+                         for endpoint, metrics in self.__endpoints.items()}
+        stats = {}
+        for endpoint, (count, errors, latencies) in endpoints.items():
+            stats[endpoint] = {"count": count, "errors": errors}
+            if latencies:
+                stats[endpoint].update({"p{}".format(percentile): round(1000 * self.get_percentile(latencies, percentile), 3)
+                                        for percentile in (50, 95, 99)})
+                stats[endpoint]["max"] = round(1000 * latencies[-1], 3)
+        return stats
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class DoorAuthServer(object):
+    """
+    Local HTTP service checking DOOR logins and roles for other services (ISPyB, beamline GUIs), so they all share
+    the pooled DOOR connections and the role cache of one DesyDoorAuth client. It listens on a TCP port of
+    localhost or on a Unix socket:
+
+    - POST /auth with username and password (form or JSON): 200 {"userid", "roles"} or 401
+    - GET /roles/<userid>: 200 {"userid", "roles"}, 403 without the shared token, 400 for a non numeric user id
+    - GET /metrics: request counts and latencies by endpoint, requests in flight and rejected, role cache stats
+    - GET /health
+
+    The roles are looked up with the DOOR service account, without the password of the user: GET /roles requires
+    the shared token in the X-Auth-Token header. Without a token, it is only answered on a Unix socket, whose
+    permissions restrict the callers.
+
+       :param DesyDoorAuth client: The DOOR client, shared by all the requests
+       :param str host: Address to listen on, localhost by default
+       :param int port: Port to listen on, 0 for any free port
+       :param str unix_socket: Path of a Unix socket to listen on instead of a TCP port
+       :param int socket_mode: Permissions of the Unix socket
+       :param int max_concurrency: Requests handled at the same time, the next ones wait for a slot
+       :param float queue_timeout: Seconds a request waits for a slot before being rejected (503)
+       :param str token: Shared secret of the callers of GET /roles
+    """
+
+    def __init__(self, client, host="127.0.0.1", port=0, unix_socket=None, socket_mode=0o660, max_concurrency=32,
+                 queue_timeout=5.0, token=None):
+        self.client = client
+        self.unix_socket = unix_socket
+        self.__token = token
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.metrics = LatencyMetrics()
+        self.in_flight = 0
+        self.rejected = 0
+        self.__slots = threading.BoundedSemaphore(max_concurrency)
+        self.__lock = threading.Lock()
+        if unix_socket is None:
+            self.__server = ThreadingHTTPServer((host, port), DoorAuthRequestHandler)
+            self.__server.daemon_threads = True
+        else:
+            self.remove_socket(unix_socket)
+            # Created with its final permissions, so it is never reachable by the other users
+            umask = os.umask(0o777 & ~socket_mode)
+            try:
+                self.__server = ThreadingUnixHTTPServer(unix_socket, UnixDoorAuthRequestHandler)
+            finally:
+                os.umask(umask)
+        self.__server.auth = self
+        self.__thread = None
+
+    @staticmethod
+    def remove_socket(path):
+        """
+           Remove a socket left over by a previous run. Any other file at the path is kept, and the bind fails.
+        """
+        try:
+            if stat.S_ISSOCK(os.lstat(path).st_mode):
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def url(self):
+        if self.unix_socket is not None:
+            return "unix://" + self.unix_socket
+        host, port = self.__server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="DoorAuthServer", daemon=True)
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        self.__server.serve_forever()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+        if self.unix_socket is not None:
+            self.remove_socket(self.unix_socket)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, method, path, headers, body):
+        """
+           Answer a request within the concurrency limit, returns (status, JSON body)
+        """
+        if path in ("/health", "/metrics"):
+            # Always answered, even when every slot is busy
+            return 200, self.get_metrics() if path == "/metrics" else {"status": "ok"}
+        if not self.__slots.acquire(timeout=self.queue_timeout):
+            with self.__lock:
+                self.rejected += 1
+            return 503, {"message": "Too many requests"}
+        with self.__lock:
+            self.in_flight += 1
+        start_time = time.perf_counter()
+        endpoint, status = "{} {}".format(method, path), 500
+        try:
+            endpoint, status, data = self.route(method, path, headers, body)
+            return status, data
+        finally:
+            with self.__lock:
+                self.in_flight -= 1
+            self.__slots.release()
+            self.metrics.add(endpoint, time.perf_counter() - start_time, status >= 500)
+
+    def route(self, method, path, headers, body):
+        """
+           Returns (endpoint, status, JSON body)
+        """
+        if method == "POST" and path == "/auth":
+            endpoint, answer = "POST /auth", lambda: self.authenticate(headers, body)
+        elif method == "GET" and path.startswith("/roles/"):
+            if not self.is_trusted(headers):
+                return "GET /roles", 403, {"message": "X-Auth-Token is missing or wrong"}
+            user_id = path[len("/roles/"):]
+            if not (user_id.isascii() and user_id.isdigit()):
+                # Only a DOOR user id goes into the DOOR url, Ex: not "../proposals/propid/1"
+                return "GET /roles", 400, {"message": "The user id must be numeric"}
+            endpoint, answer = "GET /roles", lambda: self.get_roles(user_id)
+        else:
+            return "unknown", 404, {"message": "Unknown endpoint {} {}".format(method, path)}
+        try:
+            return (endpoint,) + answer()
+        except RequestException as e:
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code == 404:
+                return endpoint, 404, {"message": "Not found in DOOR"}
+            logger.warning("DOOR request failed: %s", e)
+            return endpoint, 502, {"message": "DOOR request failed"}
+        except Exception:
+            # A JSON answer and a kept connection instead of a dropped one, Ex: an unexpected DOOR answer
+            logger.exception("%s failed", endpoint)
+            return endpoint, 500, {"message": "Internal error"}
+
+    def is_trusted(self, headers):
+        """
+           True when the caller sent the shared token, or when there is none and the service listens on a Unix socket
+        """
+        if self.__token is None:
+            return self.unix_socket is not None
+        return hmac.compare_digest((headers.get("X-Auth-Token") or "").encode(), self.__token.encode())
+
+    def authenticate(self, headers, body):
+        try:
+            if (headers.get("Content-Type") or "").startswith("application/json"):
+                form = json.loads(body or b"{}")
+            else:
+                form = {name: values[0] for name, values in parse_qs(body.decode()).items()}
+        except ValueError:
+            return 400, {"message": "Invalid request body"}
+        if not isinstance(form, dict) or not form.get("username") or not form.get("password"):
+            return 400, {"message": "username and password are required"}
+        auth = self.client.authenticate_and_authorize(form["username"], form["password"])
+        if not auth:
+            return 401, {"message": "Not authenticated"}
+        return 200, {"userid": auth[1], "roles": auth[2] or []}
+
+    def get_roles(self, user_id):
+        return 200, {"userid": user_id, "roles": self.client.get_user_roles(user_id) or []}
+
+    def get_metrics(self):
+        with self.__lock:
+            in_flight, rejected = self.in_flight, self.rejected
+        role_cache = self.client.get_role_cache()
+        return {"endpoints": self.metrics.get_stats(), "in_flight": in_flight, "rejected": rejected,
+                "max_concurrency": self.max_concurrency,
+                "role_cache": None if role_cache is None else role_cache.get_stats()}
+
+
+class DoorAuthRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the services reuse their connection to the local service
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.answer("GET")
+
+    def do_POST(self):
+        self.answer("POST")
+
+    def answer(self, method):
+        length = self.headers.get("Content-Length") or "0"
+        if not (length.isascii() and length.isdigit()):
+            # The body cannot be skipped, so the connection is closed
+            return self.send_json(400, {"message": "Invalid Content-Length"}, close=True)
+        if int(length) > MAX_BODY_SIZE:
+            return self.send_json(413, {"message": "Request body larger than {} bytes".format(MAX_BODY_SIZE)}, close=True)
+        body = self.rfile.read(int(length))
+        self.send_json(*self.server.auth.handle(method, self.path.split("?")[0], self.headers, body))
+
+    def send_json(self, status, data, close=False):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if close:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self):
+        # No client address on a Unix socket
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        # The passwords are in the bodies, the request lines are only logged at debug level
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class UnixDoorAuthRequestHandler(DoorAuthRequestHandler):
+    # TCP_NODELAY is not an option of Unix sockets
+    disable_nagle_algorithm = False
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    HTTP connection over a Unix socket, for the services calling a DoorAuthServer listening on one
+
+       :param str path: Path of the Unix socket
+       :param float timeout: Seconds of the socket timeout
+    """
+
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
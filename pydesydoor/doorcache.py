@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+def get_id_key(entity_id):
+    # Ids come as int or str depending on where they were read from in DOOR
+    return str(entity_id).strip()
+
+
+class DoorCache(object):
+    """
+    Thread-safe in-process cache for DOOR entities (users, institutes, proposals).
+
+    Entries are keyed by entity type and id, expire after a TTL and the least recently
+    used entry is evicted once the cache is full. Not found (404) lookups are cached as
+    well for a shorter time, so a missing user does not hit DOOR again and again.
+
+       :param int max_size: Maximum number of entries kept in the cache
+       :param float ttl: Seconds an entity is kept before fetching it again from DOOR
+       :param float negative_ttl: Seconds a not found (404) lookup is kept, 0 to disable it
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, negative_ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(entity_type, entity_id):
+        return entity_type, get_id_key(entity_id)
+
+    def get(self, entity_type, entity_id):
+        """
+           Return a tuple (found, value, error). error is the cached 404 exception
+           for negative entries.
+        """
+        key = self.make_key(entity_type, entity_id)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                expires, value, error = entry
+                if expires > time.monotonic():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value, error
+                del self.__entries[key]
+            self.misses += 1
+        return False, None, None
+
+    def set(self, entity_type, entity_id, value, ttl=None):
+        """
+           Cache an entity for the TTL of the cache, or for ttl seconds (0 does not cache it)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            self.__store(self.make_key(entity_type, entity_id), ttl, value, None)
+
+    def set_not_found(self, entity_type, entity_id, error):
+        if self.negative_ttl > 0:
+            self.__store(self.make_key(entity_type, entity_id), self.negative_ttl, None, error)
+
+    def __store(self, key, ttl, value, error):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + ttl, value, error)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_fetch(self, entity_type, entity_id, fetch):
+        """
+           Return the cached entity or call fetch() and cache its result.
+           A 404 raised by fetch() is cached and raised again on the next lookups.
+
+           :param str entity_type: The entity type. Ex: "user", "institute"
+           :param entity_id: The DOOR id of the entity
+           :param callable fetch: Function doing the DOOR call on a cache miss
+        """
+        found, value, error = self.get(entity_type, entity_id)
+        if found:
+            if error is not None:
+                raise error
+            return value
+        try:
+            value = fetch()
+        except Exception as e:
+            self.set_error(entity_type, entity_id, e)
+            raise
+        if value is not None:
+            self.set(entity_type, entity_id, value)
+        return value
+
+    def set_error(self, entity_type, entity_id, error):
+        """
+           Cache the error of a failed fetch when it is a not found (404) HTTP error
+        """
+        response = getattr(error, "response", None)
+        if response is not None and response.status_code == 404:
+            self.set_not_found(entity_type, entity_id, error)
+
+    def invalidate(self, entity_type=None, entity_id=None):
+        """
+           Drop a single entity, every entity of a type or (no arguments) the whole cache.
+        """
+        with self.__lock:
+            if entity_type is None:
+                self.__entries.clear()
+            elif entity_id is not None:
+                self.__entries.pop(self.make_key(entity_type, entity_id), None)
+            else:
+                for key in [key for key in self.__entries if key[0] == entity_type]:
+                    del self.__entries[key]
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
@@ -0,0 +1,116 @@
+import threading
+from pydesydoor.doorretry import DeadlineExceeded, get_deadline
+
+
+class _Flight(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical calls: while a call for a key is in flight, the other
+    callers of the same key wait for it and get its result (or its error) instead of
+    making their own. Nothing is kept once the call is done, this is not a cache.
+    The callers wait at most until the deadline of their operation (see pydesydoor.doorretry.deadline).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.__lock = threading.Lock()
+        self.__flights = {}
+
+    def do(self, key, func):
+        """
+           Call func() once for all the concurrent callers of a key.
+           Returns a tuple (result, shared), shared is True for the callers that got the result of another one.
+
+           :param key: Key of the call. Ex: the url of a GET
+           :param callable func: Function doing the call
+        """
+        with self.__lock:
+            self.calls += 1
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            current = get_deadline()
+            if not flight.done.wait(None if current is None else max(current.remaining(), 0)):
+                raise DeadlineExceeded("The deadline of {} s has been exceeded".format(current.seconds))
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = func()
+        except BaseException as e:
+            # Also KeyboardInterrupt or SystemExit, the other callers must not get a None result
+            flight.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def get_stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight(object):
+    """
+    SingleFlight of the coroutines of an event loop.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.__flights = {}
+
+    async def do(self, key, func):
+        """
+           Await func() once for all the concurrent callers of a key.
+           Returns a tuple (result, shared), shared is True for the callers that got the result of another one.
+
+           :param key: Key of the call. Ex: the url of a GET
+           :param func: Coroutine function doing the call
+        """
+        # Only the async clients need asyncio, so the sync clients do not pay for importing it
+        import asyncio
+        self.calls += 1
+        future = self.__flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            current = get_deadline()
+            try:
+                # Shielded, so a cancelled follower does not cancel the call of the others
+                return await asyncio.wait_for(asyncio.shield(future),
+                                              None if current is None else max(current.remaining(), 0)), True
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("The deadline of {} s has been exceeded".format(current.seconds)) from None
+        future = self.__flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved, so asyncio does not warn about it when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self.__flights[key]
+
+    def get_stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,121 @@
+import time
+import sqlite3
+import threading
+from requests import Response
+from pydesydoor.doorretry import get_url_family
+from pydesydoor.doorsettings import DEFAULT_CACHE_FILE, create_private_file
+
+# Seconds a cached DOOR response is used without asking DOOR again, by endpoint family.
+# Families missing here (Ex: roles) are never stored on disk.
+DEFAULT_MAX_AGES = {
+    "users": 24 * 3600,
+    "institutes": 7 * 24 * 3600,
+    "proposals": 3600,
+    "experiments": 600,
+}
+
+
+class DoorResponseCache(object):
+    """
+    Persistent (SQLite) cache of DOOR GET responses shared between runs of short-lived
+    processes like syncdoor.
+
+    Responses are stored with their fetch timestamp and ETag/Last-Modified validators.
+    A fresh response is returned straight from disk; a stale one is revalidated with a
+    conditional request, so an unchanged entity only costs a 304 without body.
+
+       :param str path: The SQLite file where the responses are stored
+       :param dict max_ages: Seconds a response is fresh per endpoint family. Ex: {"users": 86400}
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_ages=None):
+        self.path = path
+        self.max_ages = dict(DEFAULT_MAX_AGES)
+        if max_ages:
+            self.max_ages.update(max_ages)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        create_private_file(path)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                      "url TEXT PRIMARY KEY, body BLOB NOT NULL, content_type TEXT, "
+                                      "etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)")
+
+    def get_max_age(self, url):
+        return self.max_ages.get(get_url_family(url))
+
+    def get_response(self, url, request):
+        """
+           Return the DOOR response for url, from disk when it is fresh enough.
+
+           :param str url: The DOOR url relative to the REST root. Ex: "/users/id/1"
+           :param callable request: Function doing the GET, called with the extra (conditional) headers
+        """
+        max_age = self.get_max_age(url)
+        if max_age is None:
+            return request({})
+        entry = self.__load(url)
+        if entry is not None and time.time() - entry["fetched_at"] < max_age:
+            self.hits += 1
+            return self.__to_response(entry)
+        self.misses += 1
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        r = request(headers)
+        if r.status_code == 304 and entry is not None:
+            # Not modified: the stored body is still valid, only renew its timestamp
+            self.revalidated += 1
+            with self.__lock, self.__connection:
+                self.__connection.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            return self.__to_response(entry)
+        if r.status_code == 200:
+            self.__store(url, r)
+        return r
+
+    def __load(self, url):
+        with self.__lock:
+            row = self.__connection.execute("SELECT url, body, content_type, etag, last_modified, fetched_at "
+                                            "FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("url", "body", "content_type", "etag", "last_modified", "fetched_at"), row))
+
+    def __store(self, url, r):
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                      (url, r.content, r.headers.get("Content-Type"), r.headers.get("ETag"),
+                                       r.headers.get("Last-Modified"), time.time()))
+
+    @staticmethod
+    def __to_response(entry):
+        r = Response()
+        r.status_code = 200
+        r.url = entry["url"]
+        r._content = entry["body"]
+        r._content_consumed = True
+        if entry["content_type"]:
+            r.headers["Content-Type"] = entry["content_type"]
+        return r
+
+    def clear(self, family=None):
+        """
+           Remove every stored response, or only the ones of an endpoint family. Ex: "experiments"
+        """
+        with self.__lock, self.__connection:
+            if family is None:
+                self.__connection.execute("DELETE FROM responses")
+            else:
+                self.__connection.execute("DELETE FROM responses WHERE url LIKE ?", ("/" + family + "/%",))
+
+    def close(self):
+        self.__connection.close()
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
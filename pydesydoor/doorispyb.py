@@ -1,6 +1,5 @@
-import json
-from datetime import datetime
 from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doormodel import PARTICIPANT_TYPES, DoorSession
 
 
 class DoorISPyB(DesyDoorAPI):
@@ -26,7 +25,7 @@ class DoorISPyB(DesyDoorAPI):
         if with_sessions:
             sessions_data = self.get_sessions_to_ispyb(door_proposal_id, with_session_participants)
             ispyb_proposal["sessions"] = sessions_data
-        return json.dumps(ispyb_proposal, indent=4, sort_keys=True, default=str)
+        return self.serialize(ispyb_proposal)
 
     def get_proposal_to_ispyb(self, door_proposal_id, with_leader=True, with_cowriters=True):
         """
@@ -37,40 +36,32 @@ class DoorISPyB(DesyDoorAPI):
            :param boolean with_cowriters: True/False depending if the cowriters data is needed
         """
         data = {}
-        door_proposal = self.get_proposal(door_proposal_id)
-        data["title"] = door_proposal["title"]
-        data["proposalNumber"] = door_proposal["proposalNumber"]
-        data["proposalCode"] = door_proposal["proposalCode"]
+        door_proposal = self.get_proposal_model(door_proposal_id)
+        data["title"] = door_proposal.title
+        data["proposalNumber"] = door_proposal.proposal_number
+        data["proposalCode"] = door_proposal.proposal_code
         data["proposalType"] = "MX"
         data["bltimeStamp"] = None
         data["state"] = "Open"
-        participants = []
+        user_ids = []
+        user_types = []
         # Set the PI
-        if door_proposal["proposalPI"]:
-            pi = self.get_user_to_ispyb(door_proposal["proposalPI"])
-            pi["type"] = "pi"
-            participants.append(pi)
+        if door_proposal.pi_id:
+            user_ids.append(door_proposal.pi_id)
+            user_types.append("pi")
         if with_leader:
             # Set the Leader
-            if door_proposal["proposalLeader"]:
-                leader = self.get_user_to_ispyb(door_proposal["proposalLeader"])
-                leader["type"] = "leader"
-                participants.append(leader)
+            if door_proposal.leader_id:
+                user_ids.append(door_proposal.leader_id)
+                user_types.append("leader")
         if with_cowriters:
             # Set the co-writers
-            if door_proposal["proposalCowriters"]:
-                if not isinstance(door_proposal["proposalCowriters"], int):
-                    # There is more than one co-writer
-                    cowriter_ids = self.split_multiple_by_comma(door_proposal["proposalCowriters"])
-                    for cowriter_id in cowriter_ids:
-                        cowriter = self.get_user_to_ispyb(cowriter_id)
-                        cowriter["type"] = "cowriter"
-                        participants.append(cowriter)
-                else:
-                    # There is only one co-writer
-                    cowriter = self.get_user_to_ispyb(door_proposal["proposalCowriters"])
-                    cowriter["type"] = "cowriter"
-                    participants.append(cowriter)
+            cowriter_ids = door_proposal.get_door_cowriter_ids()
+            user_ids += cowriter_ids
+            user_types += ["cowriter"] * len(cowriter_ids)
+        participants = self.map_concurrent(self.get_user_to_ispyb, user_ids)
+        for participant, user_type in zip(participants, user_types):
+            participant["type"] = user_type
         # Add participants
         data["participants"] = participants
         # Add proposal data
@@ -84,68 +75,80 @@ class DoorISPyB(DesyDoorAPI):
            :param boolean with_laboratory: True/False depending if the Laboratory/Institute data is needed
         """
         user = {}
-        door_user = self.get_user(door_user_id)
-        user["givenName"] = door_user["givenName"]
-        user["familyName"] = door_user["familyName"]
-        user["emailAddress"] = door_user["emailAddress"]
-        user["login"] = door_user["login"]
+        door_user = self.get_user_model(door_user_id)
+        user["givenName"] = door_user.given_name
+        user["familyName"] = door_user.family_name
+        user["emailAddress"] = door_user.email_address
+        user["login"] = door_user.login
         if with_laboratory:
-            user["laboratory"] = self.get_laboratory_to_ispyb(door_user["laboratoryId"])
-        user["phoneNumber"] = door_user["phoneNumber"]
+            user["laboratory"] = self.get_laboratory_to_ispyb(door_user.laboratory_id)
+        user["phoneNumber"] = door_user.phone_number
+        # The id as given, its type is part of the output
         user["siteId"] = door_user_id
         user["personUUID"] = None
         user["recordTimeStamp"] = None
         return user
 
     def get_laboratory_to_ispyb(self, laboratory_id):
-        door_laboratory = self.get_institute(laboratory_id)
-        return door_laboratory
+        door_laboratory = self.get_institute_model(laboratory_id)
+        return None if door_laboratory is None else door_laboratory.data
 
-    def get_sessions_to_ispyb(self, door_proposal_id, with_participants=True):
+    def get_sessions_to_ispyb(self, door_proposal_id, with_participants=True, beamline="P11"):
         """
            Get the proposal sessions data from DOOR in format for py-ispyb
 
            :param str door_proposal_id: The DOOR proposal id
            :param boolean with_participants: True/False depending if the session participants data is needed
+           :param str beamline: The beamline name (to filter sessions from commisioning proposals)
         """
-        sessions = self.get_proposal_sessions(door_proposal_id)
-        if sessions:
-            for session in sessions:
-                datetime_start = datetime.strptime(sessions[session]["startDate"], '%Y-%m-%d %H:%M:%S')
-                sessions[session]["startDate"] = datetime_start.isoformat()
-                datetime_end = datetime.strptime(sessions[session]["endDate"], '%Y-%m-%d %H:%M:%S')
-                sessions[session]["endDate"] = datetime_end.isoformat()
-                if sessions[session]["beamlineOperator"]:
-                    operator = self.get_user_to_ispyb(sessions[session]["beamlineOperator"], False)
-                    sessions[session]["beamlineOperator"] = operator
+        door_sessions = self.get_proposal_sessions(door_proposal_id, beamline)
+        if door_sessions:
+            sessions = []
+            # User lookups of all the sessions: (session, participant type or None for the operator, user id)
+            lookups = []
+            for door_session in door_sessions:
+                session_model = DoorSession.from_door(door_session)
+                session = self.format_session(door_session, session_model)
+                if session_model.operator_id:
+                    lookups.append((session, None, session_model.operator_id))
                 if with_participants:
-                    participants = []
-                    remotes = self.get_participants(sessions[session]["participants"], "remote")
-                    if remotes:
-                        participants += remotes
-                    on_sites = self.get_participants(sessions[session]["participants"], "on-site")
-                    if on_sites:
-                        participants += on_sites
-                    data_onlys = self.get_participants(sessions[session]["participants"], "data-only")
-                    if data_onlys:
-                        participants += data_onlys
+                    for participant_type in PARTICIPANT_TYPES:
+                        for participant_id in session_model.get_door_participant_ids(participant_type):
+                            lookups.append((session, participant_type, participant_id))
                     # Add session participants
-                    sessions[session]["participants"] = participants
+                    session["participants"] = []
+                sessions.append(session)
+            users = self.map_concurrent(lambda lookup: self.get_user_to_ispyb(lookup[2], False), lookups)
+            for (session, participant_type, _), user in zip(lookups, users):
+                if participant_type is None:
+                    session["beamlineOperator"] = user
+                else:
+                    user["type"] = participant_type
+                    session["participants"].append(user)
             return sessions
         return None
 
+    @staticmethod
+    def format_session(door_session, session_model):
+        """
+           Copy of a DOOR session with its dates in ISO format. The other DOOR fields are kept as they are.
+
+           :param dict door_session: The DOOR session
+           :param DoorSession session_model: The same session, with its dates parsed
+        """
+        session = dict(door_session)
+        session["startDate"] = session_model.start_date.isoformat()
+        session["endDate"] = session_model.end_date.isoformat()
+        return session
+
     def get_participants(self, participants, participant_type):
         """
            Helper function to setup the session participants data
         """
-        users = []
-        array_participants = None
-        if participants[participant_type]:
-            array_participants = self.split_multiple_by_comma(str(participants[participant_type]))
-        if array_participants:
-            for participant in array_participants:
-                if participant:
-                    participant = self.get_user_to_ispyb(participant, False)
-                    participant["type"] = participant_type
-                    users.append(participant)
-            return users
+        if not participants[participant_type]:
+            return None
+        participant_ids = self.get_participant_ids(participants, participant_type)
+        users = self.map_concurrent(lambda participant_id: self.get_user_to_ispyb(participant_id, False), participant_ids)
+        for user in users:
+            user["type"] = participant_type
+        return users
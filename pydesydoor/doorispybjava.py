@@ -1,4 +1,3 @@
-import json
 from pydesydoor.desydoorapi import DesyDoorAPI
 from datetime import datetime
 
@@ -11,35 +10,35 @@ class DoorISPyBJava(DesyDoorAPI):
 
            :param int door_user_id: The DOOR user id
            :param str user_type: The user type Ex: "proposalPI, proposalLeader or proposalCowriters"
-           :param array door_proposal: The user type Ex: "proposalPI"
+           :param DoorProposal door_proposal: The DOOR proposal
         """
         data = dict()
         # Set main proposal data
-        data["categoryCode"] = door_proposal["proposalCode"]
-        data["categoryCounter"] = door_proposal["proposalNumber"]
+        data["categoryCode"] = door_proposal.proposal_code
+        data["categoryCounter"] = door_proposal.proposal_number
         # Get Door user
-        door_user = self.get_user(door_user_id)
+        door_user = self.get_user_model(door_user_id)
         # Get Door Laboratory associated to user
-        door_laboratory = self.get_institute(door_user["laboratoryId"])
+        door_laboratory = self.get_institute_model(door_user.laboratory_id)
         # Set the lab / user data
-        data["labAddress"] = [None, door_laboratory["address"], None, None, None]
-        data["labAddress1"] = door_laboratory["address"]
+        data["labAddress"] = [None, door_laboratory.address, None, None, None]
+        data["labAddress1"] = door_laboratory.address
         data["labAddress2"] = None
-        data["labCity"] = door_laboratory["city"].upper()
-        data["labCountryCode"] = door_laboratory["country"]
-        data["labName"] = door_laboratory["name"]
+        data["labCity"] = door_laboratory.city.upper()
+        data["labCountryCode"] = door_laboratory.country
+        data["labName"] = door_laboratory.name
         data["labPostalCode"] = None
-        data["laboratoryPk"] = door_user["laboratoryId"]
-        data["scientistEmail"] = door_user["emailAddress"]
-        data["scientistFirstName"] = door_user["givenName"]
-        data["scientistName"] = door_user["familyName"]
-        data["scientistTitle"] = door_user["title"]
+        data["laboratoryPk"] = door_user.laboratory_id
+        data["scientistEmail"] = door_user.email_address
+        data["scientistFirstName"] = door_user.given_name
+        data["scientistName"] = door_user.family_name
+        data["scientistTitle"] = door_user.title
         data["scientistPk"] = door_user_id
         data["siteId"] = door_user_id
-        data["bllogin"] = door_user["login"]
-        data["userName"] = door_user["login"]
+        data["bllogin"] = door_user.login
+        data["userName"] = door_user.login
         # Set extra proposal data
-        data["proposalTitle"] = door_proposal["title"]
+        data["proposalTitle"] = door_proposal.title
         data["proposalType"] = 3
         data["proposalGroup"] = 103
         if user_type == "proposalPI":
@@ -53,109 +52,86 @@ class DoorISPyBJava(DesyDoorAPI):
         return data
 
     def get_proposers(self, door_proposal_id):
-        door_proposal = self.get_proposal(door_proposal_id)
-        if door_proposal["proposalPI"]:
-            pi_entry = self.get_ispyb_user(door_proposal["proposalPI"], "proposalPI", door_proposal)
+        door_proposal = self.get_proposal_model(door_proposal_id)
+        if door_proposal.pi_id:
+            pi_entry = self.get_ispyb_user(door_proposal.pi_id, "proposalPI", door_proposal)
             if pi_entry:
-                return json.dumps([pi_entry], indent=4, sort_keys=True, default=str)
+                return self.serialize([pi_entry])
         return None
 
     def get_labcontacts(self, door_proposal_id):
-        labcontacts = []
-        door_proposal = self.get_proposal(door_proposal_id)
-        pi_entry = self.get_ispyb_user(door_proposal["proposalPI"], "proposalPI", door_proposal)
-        if pi_entry:
-            labcontacts.append(pi_entry)
-        leader_entry = self.get_ispyb_user(door_proposal["proposalLeader"], "proposalLeader", door_proposal)
-        if leader_entry:
-            labcontacts.append(leader_entry)
-        # Check for co-writer
-        if door_proposal["proposalCowriters"]:
-            if isinstance(door_proposal["proposalCowriters"], int):
-                # Single co-writer
-                cowriter_entry = self.get_ispyb_user(door_proposal["proposalCowriters"],
-                                                     "proposalCowriters", door_proposal)
-                if cowriter_entry:
-                    labcontacts.append(cowriter_entry)
-            else:
-                # Multiple co-writers
-                cowriters = self.split_multiple_by_comma(door_proposal["proposalCowriters"])
-                for cowriter in cowriters:
-                    cowriter_entry = self.get_ispyb_user(cowriter,
-                                                         "proposalCowriters", door_proposal)
-                    if cowriter_entry:
-                        labcontacts.append(cowriter_entry)
+        door_proposal = self.get_proposal_model(door_proposal_id)
+        lookups = [(door_proposal.pi_id, "proposalPI"), (door_proposal.leader_id, "proposalLeader")]
+        # Check for co-writers
+        for cowriter in door_proposal.get_door_cowriter_ids():
+            lookups.append((cowriter, "proposalCowriters"))
+        entries = self.map_concurrent(lambda lookup: self.get_ispyb_user(lookup[0], lookup[1], door_proposal), lookups)
+        labcontacts = [entry for entry in entries if entry]
         if labcontacts:
-            return json.dumps(labcontacts, indent=4, sort_keys=True, default=str)
+            return self.serialize(labcontacts)
         return None
 
-    def get_sessions(self, door_proposal_id):
+    def get_sessions(self, door_proposal_id, beamline="P11"):
         sessions = []
-        door_proposal = self.get_proposal(door_proposal_id)
-        door_sessions = self.get_proposal_sessions(door_proposal_id)
+        door_proposal = self.get_proposal_model(door_proposal_id)
+        door_sessions = self.get_session_models(door_proposal_id, beamline)
         if door_sessions:
-            for session in door_sessions:
-                ispyb_session = self.get_ispyb_session(door_sessions[session], door_proposal)
-                if ispyb_session:
-                    sessions.append(ispyb_session)
-        return json.dumps(sessions, indent=4, sort_keys=True, default=str)
+            ispyb_sessions = self.map_concurrent(lambda door_session: self.get_ispyb_session(door_session, door_proposal),
+                                                 door_sessions)
+            sessions = [session for session in ispyb_sessions if session]
+        return self.serialize(sessions)
 
     def get_ispyb_session(self, door_session, door_proposal):
         session = dict()
         # Session data
-        session["pk"] = door_session["expSessionPk"]
-        session["experimentPk"] = door_session["expSessionPk"]
-        session["shifts"] = door_session["nbShifts"]
+        session["pk"] = door_session.session_id
+        session["experimentPk"] = door_session.session_id
+        session["shifts"] = door_session.nb_shifts
         # startShift is needed by default set to 1
         session["startShift"] = 1
         # The Java API will import only sessions which are not cancelled
         session["cancelled"] = False
-        # Start date
-        start_datetime = self.convert_date(door_session["startDate"])
-        start_date = self.get_ispyb_date(start_datetime)
-        session["startDate"] = start_date
-        # End date
-        end_datetime = self.convert_date(door_session["endDate"])
-        end_date = self.get_ispyb_date(end_datetime)
-        session["endDate"] = end_date
+        # Start and end dates, already parsed in DoorSession
+        session["startDate"] = self.get_ispyb_date(door_session.start_date)
+        session["endDate"] = self.get_ispyb_date(door_session.end_date)
         # Proposal data
         session["proposalType"] = 3
         session["proposalGroup"] = 103
-        session["proposalTitle"] = door_proposal["title"]
-        session["proposalPk"] = door_proposal["proposalNumber"]
-        session["categCode"] = door_proposal["proposalCode"]
-        session["categCounter"] = door_proposal["proposalNumber"]
+        session["proposalTitle"] = door_proposal.title
+        session["proposalPk"] = door_proposal.proposal_number
+        session["categCode"] = door_proposal.proposal_code
+        session["categCounter"] = door_proposal.proposal_number
         session["proposalGroupCode"] = "Crystallography"
-        session["name"] = self.get_session_name(door_proposal, door_session["beamlineName"],
-                                                start_datetime, end_datetime)
+        session["name"] = self.get_session_name(door_proposal, door_session.beamline_name,
+                                                door_session.start_date, door_session.end_date)
         # Beamline data
-        session["beamlineName"] = door_session["beamlineName"]
-        session["physicalBeamlineName"] = door_session["beamlineName"]
+        session["beamlineName"] = door_session.beamline_name
+        session["physicalBeamlineName"] = door_session.beamline_name
         # Main proposer and Local contact/s
-        if door_proposal["proposalPI"]:
-            session["mainProposer"] = self.get_session_user(door_proposal["proposalPI"])
+        if door_proposal.pi_id:
+            session["mainProposer"] = self.get_session_user(door_proposal.pi_id)
 
         # Get the local contact
-        if door_session["beamlineOperator"]:
-            session["firstLocalContact"] = self.get_session_user(door_session["beamlineOperator"])
+        if door_session.operator_id:
+            session["firstLocalContact"] = self.get_session_user(door_session.operator_id)
         return session
 
     @staticmethod
     def get_session_name(door_proposal, beamline_name, start, end):
         name = ""
-        proposal = door_proposal["proposalCode"]+"-"+str(door_proposal["proposalNumber"])+" "+beamline_name
+        proposal = door_proposal.proposal_code+"-"+str(door_proposal.proposal_number)+" "+beamline_name
         daterange = start.strftime("%d.%m.%Y")+"/"+end.strftime("%d.%m.%Y")
         name = proposal + " " + daterange
         return name
 
     def get_session_user(self, door_user_id):
         user = dict()
-        door_user = self.get_user(door_user_id)
-        user["name"] = door_user["familyName"]
-        user["realName"] = door_user["familyName"]
-        user["firstName"] = door_user["givenName"]
-        user["email"] = door_user["emailAddress"]
-        user["phone"] = door_user["phoneNumber"]
+        door_user = self.get_user_model(door_user_id)
+        user["name"] = door_user.family_name
+        user["realName"] = door_user.family_name
+        user["firstName"] = door_user.given_name
+        user["email"] = door_user.email_address
+        user["phone"] = door_user.phone_number
         user["scientistPk"] = door_user_id
         user["siteId"] = door_user_id
         return user
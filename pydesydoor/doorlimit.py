@@ -0,0 +1,233 @@
+import os
+import time
+import threading
+from requests import exceptions
+from pydesydoor.doorretry import DeadlineExceeded, get_deadline
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Statuses DOOR answers when it is overloaded or throttling the client
+OVERLOAD_STATUSES = (429, 503)
+
+
+class TokenBucket(object):
+    """
+    Token bucket of the DOOR requests of the threads of a process: requests take a token,
+    tokens come back at a constant rate and at most burst of them are kept.
+
+       :param float rate: Requests per second
+       :param int burst: Requests that can be sent at once after an idle period
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.__lock = threading.Lock()
+        self.__tokens = float(self.burst)
+        self.__updated = time.monotonic()
+
+    def _update(self, func):
+        """
+           Apply func(tokens) -> (tokens, result) to the refilled tokens, atomically, and return the result
+        """
+        with self.__lock:
+            now = time.monotonic()
+            tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__tokens, result = func(tokens)
+            self.__updated = now
+        return result
+
+    def take(self):
+        """
+           Take a token, return 0 when it was taken or the seconds to wait before trying again
+        """
+        def take(tokens):
+            if tokens >= 1:
+                return tokens - 1, 0.0
+            return tokens, (1 - tokens) / self.rate
+        return self._update(take)
+
+    def acquire(self):
+        """
+           Wait for a token. Raises DeadlineExceeded when the wait would pass the deadline of the operation.
+        """
+        while True:
+            wait = self.take()
+            if wait <= 0:
+                return
+            current = get_deadline()
+            if current is not None and current.remaining() < wait:
+                raise DeadlineExceeded("No DOOR request token before the deadline of {} s".format(current.seconds))
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+           Hold all the requests for some seconds. Ex: the Retry-After of a 429 answer
+        """
+        self._update(lambda tokens: (min(tokens, -seconds * self.rate), None))
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared by the processes of a host through a small locked file, so several
+    syncdoor workers stay together under one request rate. Requires fcntl (POSIX).
+
+       :param str path: File holding the state of the bucket, created if needed
+       :param float rate: Requests per second of all the processes together
+       :param int burst: Requests that can be sent at once after an idle period
+    """
+
+    def __init__(self, path, rate, burst=None):
+        if fcntl is None:
+            raise ImportError("FileTokenBucket requires fcntl, which is not available on this platform")
+        super().__init__(rate, burst)
+        self.path = path
+
+    def _update(self, func):
+        # Wall clock time, as the monotonic clocks of processes are not comparable everywhere
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            now = time.time()
+            state = f.read().split()
+            tokens, updated = (float(state[0]), float(state[1])) if len(state) == 2 else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            tokens, result = func(tokens)
+            f.seek(0)
+            f.truncate()
+            f.write("{!r} {!r}".format(tokens, now))
+        return result
+
+
+class ConcurrencyLimitTimeout(exceptions.Timeout):
+    """
+    No DOOR request slot was freed within the timeout of the concurrency limit
+    """
+
+
+class AdaptiveConcurrencyLimit(object):
+    """
+    Limit of the DOOR requests in flight, adapted with AIMD: it grows by one every limit
+    successful requests and is cut by a factor on overload (429/503, timeouts or a latency
+    rising above latency_ratio times the lowest latency seen for the endpoint family), at most
+    once per cooldown.
+
+       :param int initial: Requests in flight allowed at first
+       :param int min_limit: Lowest limit
+       :param int max_limit: Highest limit
+       :param float decrease: Factor applied to the limit on overload
+       :param float latency_ratio: Latency over the lowest one of the endpoint family that is taken as overload
+       :param float cooldown: Seconds between two decreases, so one burst of errors cuts the limit once
+       :param float timeout: Seconds a request waits for a slot before ConcurrencyLimitTimeout is raised
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, decrease=0.5, latency_ratio=4.0, cooldown=1.0,
+                 timeout=60.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_ratio = latency_ratio
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        # Lowest latency by endpoint family, as a session listing is always slower than a user lookup
+        self.min_latencies = {}
+        self.__last_decrease = None
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        """
+           Wait for a slot. Raises ConcurrencyLimitTimeout after timeout seconds, or DeadlineExceeded when the
+           deadline of the operation comes first.
+        """
+        current = get_deadline()
+        wait = self.timeout if current is None else min(self.timeout, current.remaining())
+        end = time.monotonic() + wait
+        with self.__condition:
+            while self.in_flight >= int(self.limit):
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    if current is not None and wait < self.timeout:
+                        raise DeadlineExceeded("No DOOR request slot before the deadline of {} s".format(current.seconds))
+                    raise ConcurrencyLimitTimeout("No DOOR request slot within {} s".format(self.timeout))
+                self.__condition.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, overloaded=False, latency=None, family="default"):
+        """
+           Give back a slot and adapt the limit with the outcome of the request
+
+           :param boolean overloaded: True when DOOR answered 429/503 or timed out
+           :param float latency: Seconds the request took, when it completed
+           :param str family: Endpoint family of the request, see pydesydoor.doorretry.get_url_family
+        """
+        with self.__condition:
+            self.in_flight -= 1
+            if latency is not None:
+                min_latency = min(self.min_latencies.get(family, latency), latency)
+                self.min_latencies[family] = min_latency
+                overloaded = overloaded or latency > self.latency_ratio * max(min_latency, 0.01)
+            now = time.monotonic()
+            if overloaded:
+                if self.__last_decrease is None or now - self.__last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.__last_decrease = now
+            elif latency is not None:
+                # Failures without an answer (Ex: connection refused) say nothing about the load
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.__condition.notify_all()
+
+
+class DoorRateLimiter(object):
+    """
+    Rate and concurrency limits of the requests of one or more DOOR clients.
+
+       :param TokenBucket bucket: Optional bucket of the request rate (FileTokenBucket to share it between processes)
+       :param AdaptiveConcurrencyLimit concurrency: Optional adaptive limit of the requests in flight
+       :param float max_pause: Longest pause of the bucket asked by a Retry-After header, in seconds
+    """
+
+    def __init__(self, bucket=None, concurrency=None, max_pause=60.0):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.max_pause = max_pause
+        self.throttled = 0
+
+    def call(self, send, family="default"):
+        """
+           Send a request within the limits and return its response. Overload answers slow down the next requests.
+
+           :param callable send: Function sending the request
+           :param str family: Endpoint family of the request, its latency is compared with the family's own
+        """
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        overloaded, latency = False, None
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            start_time = time.perf_counter()
+            try:
+                r = send()
+            except exceptions.Timeout:
+                # Unlike connection errors, timeouts tell that DOOR is overloaded
+                overloaded = True
+                raise
+            latency = time.perf_counter() - start_time
+            overloaded = r.status_code in OVERLOAD_STATUSES
+            if overloaded:
+                self.on_overload(r)
+            return r
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release(overloaded, latency, family)
+
+    def on_overload(self, r):
+        self.throttled += 1
+        retry_after = r.headers.get("Retry-After", "")
+        if self.bucket is not None and retry_after.isdigit():
+            self.bucket.pause(min(int(retry_after), self.max_pause))
@@ -0,0 +1,127 @@
+import sys
+import copy
+import json
+import time
+import queue
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+LOGGER_NAME = "pydesydoor"
+# One record per HTTP request sent to DOOR or py-ispyb, at INFO level
+REQUEST_LOGGER_NAME = "pydesydoor.requests"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+request_logger = logging.getLogger(REQUEST_LOGGER_NAME)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the fields of the request records (method, url, status, latency_ms, error).
+    """
+
+    def format(self, record):
+        data = {"time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(), "level": record.levelname,
+                "logger": record.name, "message": record.getMessage(), "thread": record.threadName}
+        data.update(getattr(record, "request", None) or {})
+        if record.exc_info or record.exc_text:
+            data["exception"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class DoorQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the records with their traceback rendered in exc_text. QueueHandler.prepare would drop it from the
+    record (only a formatted message is left), so the JSON records of the writer thread had no exception.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class DoorLogging(object):
+    """
+    The logging configured by configure_logging. stop() flushes the queued records, removes the handler and
+    restores the levels of the loggers.
+    """
+
+    def __init__(self, handler, listener=None, levels=None):
+        self.handler = handler
+        self.listener = listener
+        self.levels = levels or {}
+        self.__installed = handler if listener is None else listener.handlers[0]
+
+    def stop(self):
+        logging.getLogger(LOGGER_NAME).removeHandler(self.handler)
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+        if self.listener is not None:
+            self.listener.stop()
+        self.__installed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def configure_logging(filename=None, level=logging.WARNING, json_format=False, asynchronous=True, requests=False):
+    """
+       Send the pydesydoor logs to a file or stderr. Nothing is logged until a caller opts in with this
+       (or with its own handlers on the "pydesydoor" logger).
+
+       :param str filename: File the records are appended to, stderr if not given
+       :param int level: Lowest level logged. Ex: logging.INFO
+       :param boolean json_format: True for one JSON object per record
+       :param boolean asynchronous: True to only queue the records in the logging threads, a QueueListener
+                                    thread writes them, so a slow disk never blocks a request
+       :param boolean requests: True to log every HTTP request (method, url, status, latency) at INFO level
+    """
+    handler = logging.FileHandler(filename) if filename else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+    listener = None
+    if asynchronous:
+        # Unbounded, so logging never waits for the writer thread
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        handler = DoorQueueHandler(log_queue)
+    logger = logging.getLogger(LOGGER_NAME)
+    levels = {LOGGER_NAME: logger.level, REQUEST_LOGGER_NAME: request_logger.level}
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    request_logger.setLevel(logging.INFO if requests else logging.WARNING)
+    return DoorLogging(handler, listener, levels)
+
+
+def log_request(method, url, send):
+    """
+       Send a request and log it as a structured record when the request records are enabled
+
+       :param str method: The HTTP method. Ex: "GET"
+       :param str url: The url of the request
+       :param callable send: Function sending the request and returning its response
+    """
+    if not request_logger.isEnabledFor(logging.INFO):
+        return send()
+    start_time = time.perf_counter()
+    try:
+        r = send()
+    except Exception as e:
+        latency = (time.perf_counter() - start_time) * 1000
+        request_logger.info("%s %s failed after %.1f ms: %s", method, url, latency, e,
+                            extra={"request": {"method": method, "url": url, "latency_ms": round(latency, 3),
+                                               "error": str(e)}})
+        raise
+    latency = (time.perf_counter() - start_time) * 1000
+    request_logger.info("%s %s %s %.1f ms", method, url, r.status_code, latency,
+                        extra={"request": {"method": method, "url": url, "status": r.status_code,
+                                           "latency_ms": round(latency, 3)}})
+    return r
@@ -0,0 +1,189 @@
+import sys
+from datetime import datetime
+
+DOOR_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Session participant types, in the order they are added to the session persons
+PARTICIPANT_TYPES = ("remote", "on-site", "data-only")
+
+
+def parse_id(value):
+    """
+       Parse a DOOR id (int or str) to int. None for an empty id, the stripped str if it is not numeric.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value or None
+
+
+def parse_ids(value):
+    """
+       Parse DOOR ids given as an int or as a comma separated string. Ex: "1, 2" -> (1, 2)
+    """
+    if value is None or value == "":
+        return ()
+    if isinstance(value, int):
+        return (value,)
+    return tuple(parse_id(x) for x in str(value).split(',') if x.strip())
+
+
+class DoorEntity(object):
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(name, getattr(self, name))
+                                                              for name in self.__slots__))
+
+
+class DoorUser(DoorEntity):
+    """
+    A DOOR user (person), built once from the "user metadata" of DOOR.
+    """
+    __slots__ = ("user_id", "given_name", "family_name", "email_address", "login", "title", "phone_number",
+                 "laboratory_id")
+
+    def __init__(self, user_id, given_name, family_name, email_address, login, title=None, phone_number=None,
+                 laboratory_id=None):
+        self.user_id = user_id
+        self.given_name = given_name
+        self.family_name = family_name
+        self.email_address = email_address
+        self.login = login
+        self.title = title
+        self.phone_number = phone_number
+        self.laboratory_id = laboratory_id
+
+    @classmethod
+    def from_door(cls, user_id, door_user):
+        return cls(parse_id(user_id), door_user["givenName"], door_user["familyName"], door_user["emailAddress"],
+                   door_user["login"], door_user.get("title"), door_user.get("phoneNumber"),
+                   parse_id(door_user.get("laboratoryId")))
+
+
+class DoorInstitute(DoorEntity):
+    """
+    A DOOR institute (laboratory). The DOOR data is kept as it is sent to py-ispyb.
+    """
+    __slots__ = ("institute_id", "name", "address", "city", "country", "data")
+
+    def __init__(self, institute_id, name, address=None, city=None, country=None, data=None):
+        self.institute_id = institute_id
+        self.name = name
+        self.address = address
+        self.city = city
+        self.country = country
+        self.data = data
+
+    @classmethod
+    def from_door(cls, institute_id, door_institute):
+        return cls(parse_id(institute_id), door_institute["name"], door_institute.get("address"),
+                   door_institute.get("city"), door_institute.get("country"), door_institute)
+
+
+class DoorProposal(DoorEntity):
+    """
+    A DOOR proposal with its person ids already parsed.
+    single_cowriter tells that DOOR returned the co-writer as a single id instead of a list.
+    """
+    __slots__ = ("proposal_id", "proposal_number", "proposal_code", "title", "pi_id", "leader_id", "cowriter_ids",
+                 "single_cowriter")
+
+    def __init__(self, proposal_id, proposal_number, proposal_code, title, pi_id=None, leader_id=None, cowriter_ids=(),
+                 single_cowriter=False):
+        self.proposal_id = proposal_id
+        self.proposal_number = proposal_number
+        self.proposal_code = proposal_code
+        self.title = title
+        self.pi_id = pi_id
+        self.leader_id = leader_id
+        self.cowriter_ids = cowriter_ids
+        self.single_cowriter = single_cowriter
+
+    @classmethod
+    def from_door(cls, proposal_id, door_proposal):
+        return cls(parse_id(proposal_id), door_proposal["proposalNumber"], door_proposal["proposalCode"],
+                   door_proposal["title"], parse_id(door_proposal["proposalPI"]),
+                   parse_id(door_proposal["proposalLeader"]), parse_ids(door_proposal["proposalCowriters"]),
+                   isinstance(door_proposal["proposalCowriters"], int))
+
+    def get_door_cowriter_ids(self):
+        """
+           The co-writer ids typed as the exporters always gave them: the int of a single co-writer,
+           the str of the ids of a comma separated list
+        """
+        if self.single_cowriter:
+            return list(self.cowriter_ids)
+        return [str(cowriter_id) for cowriter_id in self.cowriter_ids]
+
+
+class DoorSession(DoorEntity):
+    """
+    A DOOR session (experiment) with its dates parsed and its participant ids by participant type.
+    """
+    __slots__ = ("session_id", "proposal_id", "beamline_name", "start_date", "end_date", "scheduled", "nb_shifts",
+                 "operator_id", "participants")
+
+    def __init__(self, session_id, proposal_id, beamline_name, start_date, end_date, scheduled=None, nb_shifts=None,
+                 operator_id=None, participants=None):
+        self.session_id = session_id
+        self.proposal_id = proposal_id
+        self.beamline_name = beamline_name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.scheduled = scheduled
+        self.nb_shifts = nb_shifts
+        self.operator_id = operator_id
+        self.participants = participants or {}
+
+    @classmethod
+    def from_door(cls, door_session):
+        participants = door_session.get("participants") or {}
+        return cls(parse_id(door_session["expSessionPk"]), parse_id(door_session.get("proposalId")),
+                   # Few beamline names are shared by many sessions
+                   sys.intern(door_session["beamlineName"]),
+                   datetime.strptime(door_session["startDate"], DOOR_DATETIME_FORMAT),
+                   datetime.strptime(door_session["endDate"], DOOR_DATETIME_FORMAT),
+                   door_session.get("scheduled"), door_session.get("nbShifts"),
+                   parse_id(door_session.get("beamlineOperator")),
+                   {participant_type: parse_ids(participants.get(participant_type))
+                    for participant_type in PARTICIPANT_TYPES})
+
+    def get_door_participant_ids(self, participant_type):
+        """
+           The participant ids of a type as str, as the exporters always split them from the DOOR list
+        """
+        return [str(participant_id) for participant_id in self.participants[participant_type]]
+
+    def is_in(self, beamline=None, date_range=None, proposal_id=None):
+        """
+           True when the session is on the beamline, within the (start, end) dates and of the proposal (if given)
+        """
+        if beamline is not None and self.beamline_name != beamline.upper():
+            return False
+        if date_range and not (self.start_date.date() >= date_range[0] and self.end_date.date() <= date_range[1]):
+            return False
+        return proposal_id is None or self.proposal_id == parse_id(proposal_id)
+
+    @classmethod
+    def select(cls, door_sessions, beamline=None, date_range=None, proposal_id=None):
+        """
+           Build the sessions of a DOOR "experiment metadata" document that are on the beamline,
+           within the date range and of the proposal (if given), sorted by id
+        """
+        sessions = []
+        for door_session in door_sessions.values():
+            # Cheap beamline check first, the dates are only parsed for the sessions of the beamline
+            if beamline is None or door_session["beamlineName"] == beamline.upper():
+                session = cls.from_door(door_session)
+                if session.is_in(None, date_range, proposal_id):
+                    sessions.append(session)
+        return sorted(sessions, key=lambda session: session.session_id)
@@ -0,0 +1,145 @@
+import io
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pydesydoor.serializer import get_serializer
+
+
+def iter_bounded_map(func, items, max_workers=1, buffer_size=None):
+    """
+       Lazy map of func over the items, the results are yielded in the order of the items.
+       With max_workers > 1 the calls run in a thread pool, but at most buffer_size items are taken from
+       the source ahead of the consumer, so a slow consumer (Ex: a py-ispyb POST) holds the source back
+       instead of letting the results pile up in memory.
+
+       :param callable func: Function applied to every item
+       :param iterable items: The items, read one at a time. Ex: a streamed DOOR listing
+       :param int max_workers: Maximum number of calls run in parallel
+       :param int buffer_size: Maximum number of items taken ahead of the consumer (default 2 * max_workers)
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    buffer_size = max(buffer_size or 2 * max_workers, 1)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="DoorPipeline") as executor:
+        try:
+            for item in items:
+                # In a copy of the caller context, so the calls stay within its traced operation
+                pending.append(executor.submit(contextvars.copy_context().run, func, item))
+                if len(pending) >= buffer_size:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # The consumer stopped early or a call failed: do not start the calls left
+            for future in pending:
+                future.cancel()
+
+
+class FileSink(object):
+    """
+    Writes every payload on its own line (JSON Lines with a compact serializer) to a file or a stream.
+
+       :param file: The path of the file (overwritten), or an open text or binary stream. Ex: sys.stdout
+    """
+
+    def __init__(self, file):
+        self.__owns_file = isinstance(file, str)
+        self.__file = open(file, "wb") if self.__owns_file else file
+        self.__text = isinstance(self.__file, io.TextIOBase)
+        self.written = 0
+
+    def write(self, payload):
+        if self.__text and isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        elif not self.__text and isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.__file.write(payload)
+        self.__file.write("\n" if self.__text else b"\n")
+        self.written += 1
+
+    def close(self):
+        """
+           Close the file opened by the sink, a stream given to it is only flushed
+        """
+        if self.__owns_file:
+            self.__file.close()
+        else:
+            self.__file.flush()
+
+
+class PyISPyBSink(object):
+    """
+    Posts every payload (a proposal in py-ispyb format) to py-ispyb as soon as it is built.
+
+       :param PyISPyBAPI pyispyb_client: The py-ispyb client, its session and token are reused for every post
+    """
+
+    def __init__(self, pyispyb_client):
+        self.__pyispyb_client = pyispyb_client
+        self.written = 0
+
+    def write(self, payload):
+        self.__pyispyb_client.sync_proposal(payload)
+        self.written += 1
+
+    def close(self):
+        pass
+
+
+class DoorPipeline(object):
+    """
+    Streaming export of DOOR data: iterate the items (proposals or sessions) -> transform -> serialize -> sink.
+
+    The items are processed while they arrive (Ex: from iter_beamline_proposals, which parses the DOOR
+    response while it is downloaded) and at most buffer_size of them are in flight, so the memory stays
+    flat however many items the source yields.
+
+       :param iterable items: The source of the items
+       :param callable transform: Builds the data exported for an item, None to skip the item.
+                                  Ex: DoorPyISPyB.get_full_proposal_data. The items are exported as they are by default
+       :param serializer: Serializer of the exported data (see pydesydoor.serializer), compact JSON by default
+       :param sink: Where the payloads go (FileSink, PyISPyBSink or any object with write and close),
+                    None to only iterate over them
+       :param int max_workers: Maximum number of items transformed in parallel
+       :param int buffer_size: Maximum number of items in flight (default 2 * max_workers)
+    """
+
+    def __init__(self, items, transform=None, serializer=None, sink=None, max_workers=1, buffer_size=None):
+        self.__items = items
+        self.__transform = transform
+        self.__serializer = serializer or get_serializer("compact")
+        self.__sink = sink
+        self.__max_workers = max_workers
+        self.__buffer_size = buffer_size
+        self.skipped = 0
+
+    def __iter__(self):
+        """
+           Iterate over the serialized payloads
+        """
+        data_items = self.__items
+        if self.__transform is not None:
+            data_items = iter_bounded_map(self.__transform, self.__items, self.__max_workers, self.__buffer_size)
+        for data in data_items:
+            if data is None:
+                self.skipped += 1
+                continue
+            yield self.__serializer.dumps(data)
+
+    def run(self):
+        """
+           Write every payload to the sink, then close it. Returns the number of payloads written.
+        """
+        if self.__sink is None:
+            raise ValueError("The pipeline has no sink")
+        written = 0
+        try:
+            for payload in self:
+                self.__sink.write(payload)
+                written += 1
+        finally:
+            self.__sink.close()
+        return written
@@ -0,0 +1,88 @@
+from pydesydoor.doorcache import get_id_key
+
+
+def get_unique_ids(entity_ids):
+    """
+       The ids without duplicates, in order of first appearance
+    """
+    unique_ids = {}
+    for entity_id in entity_ids:
+        unique_ids.setdefault(get_id_key(entity_id), entity_id)
+    return list(unique_ids.values())
+
+
+class ProposalPlan(object):
+    """
+    The DOOR documents of a proposal to export and the users and institutes they reference.
+
+    A plan is made from the proposal and its sessions only. The de-duplicated user ids are then
+    resolved in one batch, followed by the institute ids of those users, and the export is built from
+    memory. Until its users are resolved, a plan tells how many DOOR calls the export will make (explain).
+
+       :param DoorProposal proposal: The DOOR proposal
+       :param list person_ids: The ids of the proposal persons in order (PI, leader, co-writers)
+       :param int cowriters_start: Position of the first co-writer in person_ids
+       :param str default_person_id: Person of the proposals without persons
+       :param list sessions: The exported sessions without their users, None when the sessions are not exported
+       :param list lookups: The user lookups of the sessions: (session, participant type or None for the operator, user id)
+    """
+
+    def __init__(self, proposal, person_ids, cowriters_start, default_person_id, sessions=None, lookups=()):
+        self.proposal = proposal
+        self.person_ids = person_ids
+        self.cowriters_start = cowriters_start
+        self.default_person_id = default_person_id
+        self.sessions = sessions
+        self.lookups = list(lookups)
+        self.users = {}
+        self.institutes = {}
+
+    def get_proposal_person_ids(self):
+        return self.person_ids or [self.default_person_id]
+
+    def get_user_ids(self):
+        """
+           The ids of all the users of the export, without duplicates
+        """
+        return get_unique_ids(self.get_proposal_person_ids() + [user_id for _, _, user_id in self.lookups])
+
+    def get_laboratory_user_ids(self):
+        """
+           The ids of the users exported with their laboratory: the proposal persons and the session participants
+        """
+        participant_ids = [user_id for _, participant_type, user_id in self.lookups if participant_type is not None]
+        return get_unique_ids(self.get_proposal_person_ids() + participant_ids)
+
+    def set_users(self, user_ids, users):
+        self.users.update(zip(map(get_id_key, user_ids), users))
+
+    def get_user(self, user_id):
+        return self.users[get_id_key(user_id)]
+
+    def get_institute_ids(self):
+        """
+           The ids of the laboratories of the users exported with them, once the users are resolved
+        """
+        return get_unique_ids(self.get_user(user_id).laboratory_id for user_id in self.get_laboratory_user_ids())
+
+    def set_institutes(self, institute_ids, institutes):
+        self.institutes.update(zip(map(get_id_key, institute_ids), institutes))
+
+    def get_laboratory(self, institute_id):
+        institute = self.institutes[get_id_key(institute_id)]
+        return None if institute is None else institute.data
+
+    def explain(self):
+        """
+           The DOOR calls of the export: the ones made to plan it, the user calls, and at most one institute
+           call per user exported with a laboratory (several users often share one). Calls answered by
+           the caches of the client are counted as well.
+        """
+        planning_calls = 1 if self.sessions is None else 2
+        user_calls = len(self.get_user_ids())
+        max_institute_calls = len(self.get_laboratory_user_ids())
+        return {"proposal_id": self.proposal.proposal_id,
+                "sessions": None if self.sessions is None else len(self.sessions),
+                "user_references": len(self.get_proposal_person_ids()) + len(self.lookups),
+                "planning_calls": planning_calls, "user_calls": user_calls, "max_institute_calls": max_institute_calls,
+                "max_calls": planning_calls + user_calls + max_institute_calls}
@@ -1,6 +1,9 @@
-import json
-from datetime import datetime
 from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doormodel import PARTICIPANT_TYPES, DoorSession
+from pydesydoor.doorplan import ProposalPlan
+
+# DOOR user added to proposals without persons (commissioning), py-ispyb requires at least one
+DEFAULT_PERSON_ID = "5714"
 
 
 class DoorPyISPyB(DesyDoorAPI):
@@ -22,15 +25,79 @@ class DoorPyISPyB(DesyDoorAPI):
            :param string start_date (%Y-%m-%d): the start date range to find proposal sessions
            :param string end_date (%Y-%m-%d): the end date range to find proposal sessions
         """
-        ispyb_proposal = {}
-        # Getting the proposal data without leader and cowriters
-        proposal_data = self.get_proposal_to_pyispyb(door_proposal_id, with_leader, with_cowriters)
-        ispyb_proposal["proposal"] = proposal_data
+        return self.serialize(self.get_full_proposal_data(door_proposal_id, with_leader, with_cowriters, with_sessions,
+                                                          with_session_participants, start_date, end_date))
+
+    def get_full_proposal_data(self, door_proposal_id, with_leader=True, with_cowriters=True, with_sessions=True,
+                               with_session_participants=True, start_date=None, end_date=None):
+        """
+           Same as get_full_proposal_to_pyispyb, not serialized. Ex: the transform of a DoorPipeline
+        """
+        with self.trace("proposal", door_proposal_id):
+            plan = self.plan_full_proposal(door_proposal_id, with_leader, with_cowriters, with_sessions,
+                                           with_session_participants, start_date, end_date)
+            self.resolve_plan(plan)
+        return self.build_full_proposal(plan)
+
+    def plan_full_proposal(self, door_proposal_id, with_leader=True, with_cowriters=True, with_sessions=True,
+                           with_session_participants=True, start_date=None, end_date=None):
+        """
+           Get the proposal and its sessions from DOOR and plan the lookups of their users and institutes.
+           Takes the same parameters as get_full_proposal_to_pyispyb.
+        """
+        fetches = [lambda: self.get_proposal_model(door_proposal_id)]
+        if with_sessions:
+            fetches.append(lambda: self.get_session_models(door_proposal_id, "P11", start_date, end_date))
+        with self.trace("plan", door_proposal_id):
+            door_proposal, *door_sessions = self.map_concurrent(lambda fetch: fetch(), fetches)
+        person_ids, cowriters_start = self.get_proposal_user_ids(door_proposal, with_leader, with_cowriters)
+        sessions, lookups = None, ()
         if with_sessions:
-            sessions_data = self.get_sessions_to_pyispyb(door_proposal_id, "P11", with_session_participants, start_date,
-                                                         end_date)
-            ispyb_proposal["sessions"] = sessions_data
-        return json.dumps(ispyb_proposal, indent=4, sort_keys=True, default=str)
+            sessions, lookups = self.format_sessions(door_sessions[0], with_session_participants)
+        return ProposalPlan(door_proposal, person_ids, cowriters_start, DEFAULT_PERSON_ID, sessions, lookups)
+
+    def resolve_plan(self, plan):
+        """
+           Get the users of a plan from DOOR in one parallel batch, then the institutes of those users
+        """
+        user_ids = plan.get_user_ids()
+        with self.trace("users", len(user_ids)):
+            plan.set_users(user_ids, self.map_concurrent(self.get_user_model, user_ids))
+        institute_ids = plan.get_institute_ids()
+        with self.trace("institutes", len(institute_ids)):
+            plan.set_institutes(institute_ids, self.map_concurrent(self.get_institute_model, institute_ids))
+
+    def explain_full_proposal(self, door_proposal_id, with_leader=True, with_cowriters=True, with_sessions=True,
+                              with_session_participants=True, start_date=None, end_date=None):
+        """
+           Plan the export of a proposal and tell how many DOOR calls it makes, see ProposalPlan.explain
+        """
+        return self.plan_full_proposal(door_proposal_id, with_leader, with_cowriters, with_sessions,
+                                       with_session_participants, start_date, end_date).explain()
+
+    @classmethod
+    def build_full_proposal(cls, plan):
+        """
+           Build the py-ispyb proposal and sessions of a resolved plan, from memory
+        """
+        ispyb_proposal = {}
+        persons = [cls.get_planned_user(plan, user_id) for user_id in plan.person_ids]
+        cls.set_cowriter_types(plan.proposal, persons, plan.cowriters_start)
+        if not persons:
+            persons.append(cls.get_planned_user(plan, plan.default_person_id))
+        ispyb_proposal["proposal"] = cls.format_proposal(plan.proposal, persons)
+        if plan.sessions is not None:
+            users = [cls.get_planned_user(plan, user_id, participant_type is not None)
+                     for _, participant_type, user_id in plan.lookups]
+            cls.add_session_users(plan.lookups, users)
+            ispyb_proposal["sessions"] = plan.sessions
+        return ispyb_proposal
+
+    @classmethod
+    def get_planned_user(cls, plan, door_user_id, with_laboratory=True):
+        door_user = plan.get_user(door_user_id)
+        laboratory = plan.get_laboratory(door_user.laboratory_id) if with_laboratory else None
+        return cls.format_user(door_user, with_laboratory, laboratory)
 
     def get_proposal_to_pyispyb(self, door_proposal_id, with_leader=True, with_cowriters=True):
         """
@@ -40,12 +107,57 @@ class DoorPyISPyB(DesyDoorAPI):
            :param boolean with_leader: True/False depending if the leader data is needed
            :param boolean with_cowriters: True/False depending if the cowriters data is needed
         """
+        door_proposal = self.get_proposal_model(door_proposal_id)
+        user_ids, cowriters_start = self.get_proposal_user_ids(door_proposal, with_leader, with_cowriters)
+        persons = self.map_concurrent(self.get_user_to_pyispyb, user_ids)
+        self.set_cowriter_types(door_proposal, persons, cowriters_start)
+        if not persons:
+            persons.append(self.get_user_to_pyispyb(DEFAULT_PERSON_ID))
+        return self.format_proposal(door_proposal, persons)
+
+    @classmethod
+    def get_proposal_user_ids(cls, door_proposal, with_leader=True, with_cowriters=True):
+        """
+           Get the ids of the proposal persons in order (PI, leader, co-writers)
+           and the position where the co-writers start.
+
+           :param DoorProposal door_proposal: The DOOR proposal
+        """
+        user_ids = []
+        # Set the PI
+        if door_proposal.pi_id:
+            # First one in the list will be the PI
+            user_ids.append(door_proposal.pi_id)
+        if with_leader:
+            # Set the Leader
+            if door_proposal.leader_id:
+                user_ids.append(door_proposal.leader_id)
+        cowriters_start = len(user_ids)
+        if with_cowriters:
+            # Set the co-writers
+            user_ids += door_proposal.cowriter_ids
+        return user_ids, cowriters_start
+
+    @staticmethod
+    def set_cowriter_types(door_proposal, persons, cowriters_start):
+        if not door_proposal.single_cowriter:
+            # There is more than one co-writer
+            for cowriter in persons[cowriters_start:]:
+                cowriter["type"] = "cowriter"
+
+    @classmethod
+    def format_proposal(cls, door_proposal, persons):
+        """
+           Build the py-ispyb proposal from the DOOR proposal and its persons already in py-ispyb format
+
+           :param DoorProposal door_proposal: The DOOR proposal
+           :param list persons: The proposal persons (PI, leader, co-writers)
+        """
         # Add proposal data
         data = {}
-        door_proposal = self.get_proposal(door_proposal_id)
-        data["title"] = door_proposal["title"]
-        data["proposalNumber"] = str(door_proposal["proposalNumber"])
-        data["proposalCode"] = door_proposal["proposalCode"]
+        data["title"] = door_proposal.title
+        data["proposalNumber"] = str(door_proposal.proposal_number)
+        data["proposalCode"] = door_proposal.proposal_code
         data["proposalType"] = "MX"
         '''
         ExternalId field is not compatible with the JAVA API, can be used later
@@ -54,39 +166,10 @@ class DoorPyISPyB(DesyDoorAPI):
         # data["externalId"] = int(door_proposal["proposalNumber"])
         data["bltimeStamp"] = None
         data["state"] = "Open"
-        persons = []
-        # Set the PI
-        if door_proposal["proposalPI"]:
-            # First one in the list will be the PI
-            pi = self.get_user_to_pyispyb(door_proposal["proposalPI"])
-            persons.append(pi)
-        if with_leader:
-            # Set the Leader
-            if door_proposal["proposalLeader"]:
-                leader = self.get_user_to_pyispyb(door_proposal["proposalLeader"])
-                persons.append(leader)
-        if with_cowriters:
-            # Set the co-writers
-            if door_proposal["proposalCowriters"]:
-                if not isinstance(door_proposal["proposalCowriters"], int):
-                    # There is more than one co-writer
-                    cowriter_ids = self.split_multiple_by_comma(door_proposal["proposalCowriters"])
-                    for cowriter_id in cowriter_ids:
-                        cowriter = self.get_user_to_pyispyb(cowriter_id)
-                        cowriter["type"] = "cowriter"
-                        persons.append(cowriter)
-                else:
-                    # There is only one co-writer
-                    cowriter = self.get_user_to_pyispyb(door_proposal["proposalCowriters"])
-                    persons.append(cowriter)
-        if not persons:
-            # For commisioning proposal there are no persons. py-ispyb required at least one
-            default_person = self.get_user_to_pyispyb("5714")
-            persons.append(default_person)
         # Add proposal persons
         data["persons"] = persons
         # Add lab contacts
-        data["labcontacts"] = self.get_labcontacts_to_pyispyb(persons)
+        data["labcontacts"] = cls.get_labcontacts_to_pyispyb(persons)
         return data
 
     def get_user_to_pyispyb(self, door_user_id, with_laboratory=True):
@@ -96,15 +179,23 @@ class DoorPyISPyB(DesyDoorAPI):
            :param str door_user_id: The DOOR user id
            :param boolean with_laboratory: True/False depending if the Laboratory/Institute data is needed
         """
+        with self.trace("user", door_user_id):
+            door_user = self.get_user_model(door_user_id)
+            laboratory = None
+            if with_laboratory:
+                laboratory = self.get_laboratory_to_pyispyb(door_user.laboratory_id)
+        return self.format_user(door_user, with_laboratory, laboratory)
+
+    @staticmethod
+    def format_user(door_user, with_laboratory=True, laboratory=None):
         user = {}
-        door_user = self.get_user(door_user_id)
-        user["givenName"] = door_user["givenName"]
-        user["familyName"] = door_user["familyName"]
-        user["emailAddress"] = door_user["emailAddress"]
-        user["login"] = door_user["login"]
+        user["givenName"] = door_user.given_name
+        user["familyName"] = door_user.family_name
+        user["emailAddress"] = door_user.email_address
+        user["login"] = door_user.login
         if with_laboratory:
-            user["laboratory"] = self.get_laboratory_to_pyispyb(door_user["laboratoryId"])
-        user["phoneNumber"] = str(door_user["phoneNumber"])
+            user["laboratory"] = laboratory
+        user["phoneNumber"] = str(door_user.phone_number)
         '''
         ExternalId field is not compatible with the JAVA API, can be used later
         when full migration to py-ispyb is done and JAVA API is not used anymore.
@@ -113,8 +204,9 @@ class DoorPyISPyB(DesyDoorAPI):
         return user
 
     def get_laboratory_to_pyispyb(self, laboratory_id):
-        door_laboratory = self.get_institute(laboratory_id)
-        return door_laboratory
+        with self.trace("institute", laboratory_id):
+            door_laboratory = self.get_institute_model(laboratory_id)
+        return None if door_laboratory is None else door_laboratory.data
 
     def get_sessions_to_pyispyb(self, door_proposal_id, beamline, with_persons=True, start_date=None, end_date=None):
         """
@@ -124,67 +216,116 @@ class DoorPyISPyB(DesyDoorAPI):
            :param str beamline: The beamline name (to filter sessions from commisioning proposals)
            :param boolean with_persons: True/False depending if the session participants data is needed
         """
+        with self.trace("sessions", beamline):
+            door_sessions = self.get_session_models(door_proposal_id, beamline, start_date, end_date)
+            sessions, lookups = self.format_sessions(door_sessions, with_persons)
+            users = self.map_concurrent(self.get_session_user, lookups)
+        self.add_session_users(lookups, users)
+        return sessions
+
+    def iter_sessions_to_pyispyb(self, door_proposal_id, beamline, with_persons=True, start_date=None, end_date=None):
+        """
+           Streaming version of get_sessions_to_pyispyb: the sessions are yielded one at a time, in the
+           order of the DOOR response, while it is parsed. Takes the same parameters.
+        """
+        for door_session in self.iter_proposal_sessions(door_proposal_id, beamline, start_date, end_date):
+            yield self.get_session_to_pyispyb(door_session, with_persons)
+
+    def get_session_to_pyispyb(self, door_session, with_persons=True):
+        """
+           Get one session in format for py-ispyb with its users. Ex: the transform of a DoorPipeline
+           over iter_beamline_sessions
+
+           :param dict door_session: The DOOR session
+           :param boolean with_persons: True/False depending if the session participants data is needed
+        """
+        with self.trace("session", door_session["expSessionPk"]):
+            sessions, lookups = self.format_sessions([DoorSession.from_door(door_session)], with_persons)
+            users = self.map_concurrent(self.get_session_user, lookups)
+        self.add_session_users(lookups, users)
+        return sessions[0]
+
+    def get_session_user(self, lookup):
+        """
+           Get a user of a lookup of format_sessions in format for py-ispyb
+        """
+        add_session, participant_type, user_id = lookup
+        with self.trace("session", add_session["expSessionPk"], participant_type or "operator"):
+            # The operator is needed without laboratory, the participants with it
+            return self.get_user_to_pyispyb(user_id, participant_type is not None)
+
+    @classmethod
+    def format_sessions(cls, door_sessions, with_persons=True):
+        """
+           Build the py-ispyb sessions without their users. Returns the sessions and the user
+           lookups they need: (session, participant type or None for the operator, user id)
+        """
         sessions = []
-        door_sessions = self.get_proposal_sessions(door_proposal_id, beamline, start_date, end_date)
+        lookups = []
         if door_sessions:
             for session in door_sessions:
-                add_session = dict()
-                '''
-                ExternalId field is not compatible with the JAVA API, can be used later
-                when full migration to py-ispyb is done and JAVA API is not used anymore.
-                '''
-                # add_session["externalId"] = int(session["expSessionPk"])
-                add_session["expSessionPk"] = int(session["expSessionPk"])
-                datetime_start = datetime.strptime(session["startDate"], '%Y-%m-%d %H:%M:%S')
-                add_session["startDate"] = datetime_start.isoformat()
-                datetime_end = datetime.strptime(session["endDate"], '%Y-%m-%d %H:%M:%S')
-                add_session["endDate"] = datetime_end.isoformat()
-                add_session["beamLineName"] = session["beamlineName"]
-                add_session["scheduled"] = session["scheduled"]
-                add_session["nbShifts"] = session["nbShifts"]
-
-                if session["beamlineOperator"]:
-                    operator = self.get_user_to_pyispyb(session["beamlineOperator"], False)
-                    add_session["beamlineOperator"] = " ".join([operator["givenName"], operator["familyName"]])
+                add_session = cls.format_session(session)
+                if session.operator_id:
+                    lookups.append((add_session, None, session.operator_id))
                 if with_persons:
-                    persons = []
-                    remotes = self.get_participants(session["participants"], "remote")
-                    if remotes:
-                        persons += remotes
-                    on_sites = self.get_participants(session["participants"], "on-site")
-                    if on_sites:
-                        persons += on_sites
-                    data_onlys = self.get_participants(session["participants"], "data-only")
-                    if data_onlys:
-                        persons += data_onlys
                     # Add session participants
-                    add_session["persons"] = persons
+                    add_session["persons"] = []
+                    for participant_type in PARTICIPANT_TYPES:
+                        for participant_id in session.participants[participant_type]:
+                            lookups.append((add_session, participant_type, participant_id))
                 sessions.append(add_session)
-        return sessions
+        return sessions, lookups
+
+    @staticmethod
+    def format_session(session):
+        add_session = dict()
+        '''
+        ExternalId field is not compatible with the JAVA API, can be used later
+        when full migration to py-ispyb is done and JAVA API is not used anymore.
+        '''
+        # add_session["externalId"] = session.session_id
+        add_session["expSessionPk"] = session.session_id
+        add_session["startDate"] = session.start_date.isoformat()
+        add_session["endDate"] = session.end_date.isoformat()
+        add_session["beamLineName"] = session.beamline_name
+        add_session["scheduled"] = session.scheduled
+        add_session["nbShifts"] = session.nb_shifts
+        return add_session
+
+    @classmethod
+    def add_session_users(cls, lookups, users):
+        """
+           Add the users resolved for the lookups of format_sessions to their sessions
+        """
+        for (add_session, participant_type, _), user in zip(lookups, users):
+            if participant_type is None:
+                add_session["beamlineOperator"] = " ".join([user["givenName"], user["familyName"]])
+            else:
+                add_session["persons"].append(cls.set_participant_options(user, participant_type))
 
     def get_participants(self, participants, participant_type):
         """
            Helper function to setup the session participants data
         """
-        users = []
-        array_participants = None
-        if participants[participant_type]:
-            array_participants = self.split_multiple_by_comma(str(participants[participant_type]))
-        if array_participants:
-            for participant in array_participants:
-                if participant:
-                    participant = self.get_user_to_pyispyb(participant, True)
-                    # By now we consider only the remote option
-                    # the remote field in ISPyB Session_has_Person table is a tinyint
-                    # Door apparently is not storing the participant session role (Staff, Principal Investigator, etc)
-                    if participant_type == "remote":
-                        session_options = dict()
-                        session_options["remote"] = 1
-                        participant["session_options"] = session_options
-                    users.append(participant)
-            return users
-
-    def get_labcontacts_to_pyispyb(self, persons):
+        if not participants[participant_type]:
+            return None
+        participant_ids = self.get_participant_ids(participants, participant_type)
+        users = self.map_concurrent(lambda participant_id: self.get_user_to_pyispyb(participant_id, True), participant_ids)
+        return [self.set_participant_options(user, participant_type) for user in users]
+
+    @staticmethod
+    def set_participant_options(participant, participant_type):
+        # By now we consider only the remote option
+        # the remote field in ISPyB Session_has_Person table is a tinyint
+        # Door apparently is not storing the participant session role (Staff, Principal Investigator, etc)
+        if participant_type == "remote":
+            session_options = dict()
+            session_options["remote"] = 1
+            participant["session_options"] = session_options
+        return participant
+
+    @staticmethod
+    def get_labcontacts_to_pyispyb(persons):
         """
            The lab contact will be basically the same proposers (Pi, co-writers, etc).
            If needed, we could add later also the session participants.
@@ -0,0 +1,243 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from requests import exceptions
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds by DOOR endpoint family. The listings of sessions can be large.
+DEFAULT_TIMEOUTS = {
+    "default": (3.05, 30),
+    "experiments": (3.05, 120),
+    "proposals": (3.05, 60),
+}
+
+# The deadline of the running operation (Ex: the sync of a proposal)
+_current_deadline = contextvars.ContextVar("pydesydoor_current_deadline", default=None)
+
+
+def get_url_family(url):
+    # "/users/id/1" -> "users"
+    return url.lstrip("/").split("/", 1)[0]
+
+
+def get_timeouts(timeout=None):
+    """
+       Normalize the timeout of a client to (connect, read) timeouts by endpoint family.
+
+       :param timeout: None for DEFAULT_TIMEOUTS, seconds or a (connect, read) tuple for every endpoint,
+                       or a dict of them by endpoint family with a "default" entry
+    """
+    if timeout is None:
+        return dict(DEFAULT_TIMEOUTS)
+    if not isinstance(timeout, dict):
+        timeout = {"default": timeout}
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for family, value in timeout.items():
+        timeouts[family] = value if isinstance(value, (tuple, list)) else (value, value)
+    return timeouts
+
+
+class DeadlineExceeded(exceptions.Timeout):
+    """
+    The deadline of the operation passed before the DOOR request could be done.
+    """
+
+
+class Deadline(object):
+    """
+    A point in time the running operation must be done by.
+
+       :param float seconds: Seconds from now
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def cap_timeout(self, timeout):
+        """
+           Cap a (connect, read) timeout to the remaining time, raise DeadlineExceeded if there is none left.
+           The read timeout applies to every read, so a slow response can still overrun the deadline a bit.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("The deadline of {} s has been exceeded".format(self.seconds))
+        return min(timeout[0], remaining), min(timeout[1], remaining)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+       Run the DOOR requests of the block (and of the workers it starts) within a deadline.
+       Ex: with deadline(60): client.get_full_proposal_to_pyispyb(...)
+
+       :param float seconds: Seconds the block has, None for no deadline
+    """
+    if seconds is None:
+        yield None
+        return
+    current = Deadline(seconds)
+    token = _current_deadline.set(current)
+    try:
+        yield current
+    finally:
+        _current_deadline.reset(token)
+
+
+def get_deadline():
+    return _current_deadline.get()
+
+
+class RetryBudget(object):
+    """
+    Bound on the retries of all the requests sharing the budget: retries are allowed while they are
+    less than min_retries plus a ratio of the requests, so a DOOR outage does not multiply the load.
+
+       :param float ratio: Retries allowed per request. Ex: 0.1 for one retry every ten requests
+       :param int min_retries: Retries always allowed, so the first requests can be retried too
+    """
+
+    def __init__(self, ratio=0.1, min_retries=10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self.__lock = threading.Lock()
+
+    def add_request(self):
+        with self.__lock:
+            self.requests += 1
+
+    def withdraw(self):
+        """
+           Take a retry from the budget, False when it is exhausted
+        """
+        with self.__lock:
+            if self.retries >= self.min_retries + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+class RetryPolicy(object):
+    """
+    Retries of the idempotent DOOR requests after a connection error, a timeout or a transient
+    (429, 5xx) answer, with exponential backoff and full jitter, within a retry budget and the deadline.
+
+       :param int max_retries: Maximum retries of a request
+       :param float backoff: Base of the exponential backoff in seconds
+       :param float max_backoff: Longest wait between two attempts in seconds, a longer Retry-After is not waited for
+       :param RetryBudget budget: Budget shared by the requests, one is created if not given
+       :param tuple statuses: The HTTP statuses that are retried
+    """
+
+    def __init__(self, max_retries=2, backoff=0.5, max_backoff=10.0, budget=None, statuses=(429, 500, 502, 503, 504)):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget if budget is not None else RetryBudget()
+        self.statuses = statuses
+
+    def get_backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def can_retry(self, attempt, delay):
+        if attempt >= self.max_retries:
+            return False
+        current = get_deadline()
+        if current is not None and current.remaining() <= delay:
+            return False
+        return self.budget.withdraw()
+
+    @staticmethod
+    def get_retry_after(r):
+        """
+           The seconds of the Retry-After header of a response, None without it (or as an HTTP date)
+        """
+        if r is None or not r.headers.get("Retry-After", "").isdigit():
+            return None
+        return int(r.headers["Retry-After"])
+
+    def run(self, send, name=""):
+        """
+           Call send() until it returns a response that is not retried, or no retry is left.
+           The last response is returned (or the last error raised) when the retries are over.
+
+           :param callable send: Function doing one attempt of the request
+           :param str name: Name of the request in the log. Ex: the url
+        """
+        self.budget.add_request()
+        attempt = 0
+        while True:
+            r = error = None
+            try:
+                r = send()
+            except DeadlineExceeded:
+                raise
+            except (exceptions.ConnectionError, exceptions.Timeout) as e:
+                error = e
+            if error is None and r.status_code not in self.statuses:
+                return r
+            delay = self.get_backoff(attempt)
+            retry_after = self.get_retry_after(r)
+            if retry_after is not None:
+                # Throttled: DOOR tells when to come back
+                delay = max(delay, retry_after)
+            # Later than max_backoff, the throttled answer is returned rather than waiting that long
+            if delay > self.max_backoff or not self.can_retry(attempt, delay):
+                if error is not None:
+                    raise error
+                return r
+            if r is not None:
+                r.close()
+            logger.warning('Retrying %s in %.2f s after %s', name, delay, error or r.status_code)
+            time.sleep(delay)
+            attempt += 1
+
+
+class HedgePolicy(object):
+    """
+    Hedged requests: when a GET takes longer than a percentile of the latencies of its endpoint
+    family, a second identical GET is sent and the first answer wins. Only for idempotent requests.
+
+       :param float percentile: Latency percentile after which a request is hedged. Ex: 95
+       :param int min_samples: Latencies needed before hedging the requests of an endpoint family
+       :param int window: Number of latest latencies kept by endpoint family
+       :param float min_delay: Shortest wait in seconds before sending the hedged request
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=200, min_delay=0.01):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.hedges = 0
+        self.__latencies = {}
+        self.__lock = threading.Lock()
+
+    def add_latency(self, family, seconds):
+        with self.__lock:
+            self.__latencies.setdefault(family, deque(maxlen=self.window)).append(seconds)
+
+    def get_delay(self, family):
+        """
+           Seconds to wait for the first request before hedging it, None when there are not enough latencies
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies.get(family, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))
+        return max(self.min_delay, latencies[index])
+
+    def add_hedge(self):
+        with self.__lock:
+            self.hedges += 1
@@ -0,0 +1,84 @@
+import os
+import threading
+
+# Environment variables of the clients, they can also be set in a .env file
+DOOR_VARIABLES = ("DOOR_REST_ROOT", "DOOR_REST_TOKEN", "DOOR_SERVICE_ACCOUNT", "DOOR_SERVICE_PASSWORD")
+PYISPYB_VARIABLES = ("PYISPYB_API_ROOT", "PYISPYB_AUTH_PLUGIN", "PYISPYB_SERVICE_ACCOUNT", "PYISPYB_SERVICE_PASSWORD")
+
+# Directory of the persistent caches and of the sync state
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pydesydoor")
+DEFAULT_CACHE_FILE = os.path.join(CACHE_DIR, "door-responses.sqlite")
+DEFAULT_STATE_FILE = os.path.join(CACHE_DIR, "sync-state.sqlite")
+DEFAULT_SNAPSHOT_FILE = os.path.join(CACHE_DIR, "door-snapshot.sqlite")
+
+_lock = threading.Lock()
+_dotenv_loaded = False
+_settings = None
+
+
+class DoorSettings(object):
+    """
+    The settings of the DOOR and py-ispyb clients. They are shared by the clients and must not be modified.
+
+       :param dict values: The values of the environment variables that are set
+    """
+
+    def __init__(self, values):
+        self.values = dict(values)
+
+    def get(self, name):
+        """
+           The value of a setting, None when it is empty. Raises KeyError when it is not set, like os.environ
+        """
+        return self.values[name] or None
+
+
+def create_private_file(path):
+    """
+       Create a file only its owner can read, in a directory only its owner can enter when that directory does not
+       exist yet. Ex: the SQLite files holding DOOR personal data (names, emails, phone numbers). An existing file is
+       kept as it is.
+
+       :param str path: The file to create
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700)
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+
+def load_dotenv_once():
+    """
+       Load the .env file into the environment on the first call only. Variables already set win.
+    """
+    global _dotenv_loaded
+    with _lock:
+        if not _dotenv_loaded:
+            # Imported here, as nothing else needs it
+            from dotenv import load_dotenv
+            load_dotenv()
+            _dotenv_loaded = True
+
+
+def get_settings():
+    """
+       The settings of the environment. The .env file is read once, then the settings are only
+       built again when the environment variables changed (Ex: set by a test or a benchmark).
+    """
+    global _settings
+    load_dotenv_once()
+    values = {name: os.environ[name] for name in DOOR_VARIABLES + PYISPYB_VARIABLES if name in os.environ}
+    settings = _settings
+    if settings is None or settings.values != values:
+        settings = _settings = DoorSettings(values)
+    return settings
+
+
+def reload_settings():
+    """
+       Read the .env file again on the next get_settings. Ex: after it was edited by a long-running process
+    """
+    global _dotenv_loaded, _settings
+    with _lock:
+        _dotenv_loaded = False
+        _settings = None
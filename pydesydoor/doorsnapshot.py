@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from requests import Response, exceptions
+from pydesydoor.doormodel import DoorProposal, DoorSession, PARTICIPANT_TYPES, DOOR_DATETIME_FORMAT
+from pydesydoor.doorcache import get_id_key
+from pydesydoor.doorsettings import DEFAULT_SNAPSHOT_FILE, create_private_file
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS proposals (proposal_id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+    # The proposals of the beamline listings by year
+    "CREATE TABLE IF NOT EXISTS beamline_proposals (beamline TEXT NOT NULL, year INTEGER NOT NULL, "
+    "proposal_id TEXT NOT NULL, PRIMARY KEY (beamline, year, proposal_id))",
+    # Dates as YYYYMMDD, the year is the one of the listing the session comes from
+    "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, proposal_id TEXT NOT NULL, "
+    "beamline TEXT NOT NULL, year INTEGER NOT NULL, start_date TEXT NOT NULL, end_date TEXT NOT NULL, "
+    "data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sessions_beamline ON sessions (beamline, year)",
+    "CREATE INDEX IF NOT EXISTS sessions_proposal ON sessions (proposal_id)",
+    # The participant type is "operator" for the beamline operator
+    "CREATE TABLE IF NOT EXISTS participants (session_id TEXT NOT NULL, participant_type TEXT NOT NULL, "
+    "user_id TEXT NOT NULL, PRIMARY KEY (session_id, participant_type, user_id))",
+    "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, laboratory_id TEXT, data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS institutes (institute_id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS snapshot_years (beamline TEXT NOT NULL, year INTEGER NOT NULL, "
+    "refreshed_at REAL NOT NULL, PRIMARY KEY (beamline, year))",
+)
+TABLES = ("proposals", "beamline_proposals", "sessions", "participants", "users", "institutes", "snapshot_years")
+
+# Beamline listing urls: /<entity>/beamline/<beamline>[/year/<year>|/date/<start>/<end>]
+LISTING_URL = re.compile(r"^/(proposals|experiments)/beamline/([^/]+)(?:/year/(\d+)|/date/(\d{8})/(\d{8}))?$")
+ENTITY_URL = re.compile(r"^/(proposals/propid|experiments/propid|experiments/expid|users/id|institutes/id)/([^/]+)$")
+
+
+def fetch_or_none(fetch, entity_id):
+    # An entity missing from DOOR (404) is left out of the snapshot instead of failing the update
+    try:
+        return fetch(entity_id)
+    except exceptions.HTTPError:
+        return None
+
+
+def get_door_date(door_datetime):
+    # "2022-07-01 08:00:00" -> "20220701"
+    return datetime.strptime(door_datetime, DOOR_DATETIME_FORMAT).strftime('%Y%m%d')
+
+
+class DoorSnapshot(object):
+    """
+    Local (SQLite) snapshot of the DOOR data of beamlines: proposals, sessions, participants, users and
+    institutes, normalized in one table each.
+
+    update() takes the snapshot of a beamline year by year and refreshes it incrementally: a year already
+    taken after its end is final and not asked again, and only the users and institutes not in the
+    snapshot yet are fetched. get_response() answers the DOOR GETs from the snapshot, so a client created
+    with DesyDoorAPI(snapshot=...) works without any network call (Ex: reports, replaying a sync).
+
+       :param str path: The SQLite file of the snapshot
+       :param boolean read_only: True to open an existing snapshot without ever writing to it
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_FILE, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.__lock = threading.Lock()
+        if read_only:
+            self.__connection = sqlite3.connect("file:{}?mode=ro".format(os.path.abspath(path)), uri=True,
+                                                check_same_thread=False)
+            return
+        create_private_file(path)
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            for statement in SCHEMA:
+                self.__connection.execute(statement)
+
+    def __query(self, sql, parameters=()):
+        with self.__lock:
+            return self.__connection.execute(sql, parameters).fetchall()
+
+    def get_years_to_update(self, beamline, years, force=False):
+        """
+           The years of a beamline to take: the ones not in the snapshot, and the ones taken before their end
+        """
+        refreshed = dict(self.__query("SELECT year, refreshed_at FROM snapshot_years WHERE beamline = ?",
+                                      (beamline.upper(),)))
+        return [year for year in years
+                if force or year not in refreshed or datetime.fromtimestamp(refreshed[year]).year <= year]
+
+    def update(self, client, beamline, years, force=False, user_ids=()):
+        """
+           Take or refresh the snapshot of the years of a beamline, then fetch the users and institutes they
+           reference. Returns what was fetched: {"years", "proposals", "sessions", "users", "institutes"}
+
+           :param DesyDoorAPI client: The DOOR client, the years and the entities are fetched with its workers
+           :param str beamline: the beamline name. Ex: P11
+           :param list years: The years of the beamline to keep in the snapshot. Ex: range(2016, 2024)
+           :param boolean force: True to fetch every year and every user and institute again
+           :param list user_ids: Users to keep in the snapshot even if nothing references them
+        """
+        beamline = beamline.upper()
+        years = self.get_years_to_update(beamline, [int(year) for year in years], force)
+        listings = client.map_concurrent(lambda year: (client.get_beamline_proposals_by_year(beamline, year) or {},
+                                                       client.get_beamline_sessions_by_year(beamline, year) or {}),
+                                         years)
+        stats = {"years": len(years), "proposals": 0, "sessions": 0, "users": 0, "institutes": 0}
+        for year, (proposals, sessions) in zip(years, listings):
+            self.__set_year(beamline, year, proposals, sessions)
+            stats["proposals"] += len(proposals)
+            stats["sessions"] += len(sessions)
+        user_ids = self.__get_missing("users", "user_id", self.get_user_ids() | {str(i) for i in user_ids}, force)
+        users = client.map_concurrent(lambda user_id: fetch_or_none(client.get_user, user_id), user_ids)
+        self.__insert("users", [(user_id, self.get_laboratory_id(user), json.dumps(user))
+                                for user_id, user in zip(user_ids, users) if user is not None])
+        institute_ids = self.__get_missing("institutes", "institute_id", self.get_institute_ids(), force)
+        institutes = client.map_concurrent(lambda institute_id: fetch_or_none(client.get_institute, institute_id),
+                                           institute_ids)
+        self.__insert("institutes", [(institute_id, json.dumps(institute))
+                                     for institute_id, institute in zip(institute_ids, institutes) if institute is not None])
+        stats["users"], stats["institutes"] = len(user_ids), len(institute_ids)
+        return stats
+
+    def __set_year(self, beamline, year, proposals, sessions):
+        # Replaces the year, so the sessions removed from DOOR since the last refresh go away
+        with self.__lock, self.__connection:
+            self.__connection.execute("DELETE FROM participants WHERE session_id IN "
+                                      "(SELECT session_id FROM sessions WHERE beamline = ? AND year = ?)", (beamline, year))
+            self.__connection.execute("DELETE FROM sessions WHERE beamline = ? AND year = ?", (beamline, year))
+            self.__connection.execute("DELETE FROM beamline_proposals WHERE beamline = ? AND year = ?", (beamline, year))
+            self.__connection.executemany("INSERT OR REPLACE INTO proposals VALUES (?, ?)",
+                                          [(str(proposal_id), json.dumps(proposal))
+                                           for proposal_id, proposal in proposals.items()])
+            self.__connection.executemany("INSERT OR REPLACE INTO beamline_proposals VALUES (?, ?, ?)",
+                                          [(beamline, year, str(proposal_id)) for proposal_id in proposals])
+            for session_id, session in sessions.items():
+                self.__connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                          (str(session_id), get_id_key(session["proposalId"]), beamline, year,
+                                           get_door_date(session["startDate"]), get_door_date(session["endDate"]),
+                                           json.dumps(session)))
+                self.__connection.executemany("INSERT OR REPLACE INTO participants VALUES (?, ?, ?)",
+                                              [(str(session_id), participant_type, str(user_id))
+                                               for participant_type, user_id in self.get_session_users(session)])
+            self.__connection.execute("INSERT OR REPLACE INTO snapshot_years VALUES (?, ?, ?)",
+                                      (beamline, year, time.time()))
+
+    @staticmethod
+    def get_session_users(door_session):
+        """
+           The (participant type, user id) of the users of a DOOR session, "operator" for its beamline operator
+        """
+        session = DoorSession.from_door(door_session)
+        users = [("operator", session.operator_id)] if session.operator_id else []
+        for participant_type in PARTICIPANT_TYPES:
+            users += [(participant_type, user_id) for user_id in session.participants[participant_type]]
+        return users
+
+    @staticmethod
+    def get_laboratory_id(door_user):
+        laboratory_id = door_user.get("laboratoryId")
+        return None if laboratory_id in (None, "") else get_id_key(laboratory_id)
+
+    def __get_missing(self, table, column, ids, force=False):
+        if force:
+            return sorted(ids)
+        present = {row[0] for row in self.__query("SELECT {} FROM {}".format(column, table))}
+        return sorted(entity_id for entity_id in ids if entity_id not in present)
+
+    def __insert(self, table, rows):
+        if rows:
+            with self.__lock, self.__connection:
+                self.__connection.executemany("INSERT OR REPLACE INTO {} VALUES ({})".format(
+                    table, ", ".join("?" * len(rows[0]))), rows)
+
+    def get_user_ids(self):
+        """
+           The ids of the users referenced by the proposals (PI, leader, co-writers) and the sessions
+        """
+        user_ids = {row[0] for row in self.__query("SELECT DISTINCT user_id FROM participants")}
+        for proposal_id, data in self.__query("SELECT proposal_id, data FROM proposals"):
+            proposal = DoorProposal.from_door(proposal_id, json.loads(data))
+            user_ids.update(str(user_id) for user_id in (proposal.pi_id, proposal.leader_id) + tuple(proposal.cowriter_ids)
+                            if user_id)
+        return user_ids
+
+    def get_institute_ids(self):
+        return {row[0] for row in self.__query("SELECT DISTINCT laboratory_id FROM users WHERE laboratory_id IS NOT NULL")}
+
+    def get_counts(self):
+        """
+           The number of rows of every table. Ex: {"sessions": 1200, ...}
+        """
+        return {table: self.__query("SELECT COUNT(*) FROM {}".format(table))[0][0] for table in TABLES}
+
+    def get_response(self, url, method="GET"):
+        """
+           Answer a DOOR request from the snapshot, like DOOR would: 200 with the DOOR JSON document,
+           404 when the snapshot does not have the data (Ex: roles) and 405 for the requests other than GET.
+
+           :param str url: The DOOR url relative to the REST root. Ex: "/users/id/1"
+           :param str method: The HTTP method
+        """
+        if method != "GET":
+            return self.__to_response(url, 405, {"message": "The DOOR snapshot is read-only"})
+        body = None
+        listing = LISTING_URL.match(url)
+        entity = ENTITY_URL.match(url)
+        if listing is not None:
+            body = self.__get_listing(*listing.groups())
+        elif entity is not None:
+            body = self.__get_entity(*entity.groups())
+        if body is None:
+            return self.__to_response(url, 404, {"message": "Not found in the DOOR snapshot"})
+        return self.__to_response(url, 200, body)
+
+    def __get_listing(self, entity, beamline, year=None, start_date=None, end_date=None):
+        where, parameters = "s.beamline = ?", [beamline.upper()]
+        if year is not None:
+            where += " AND s.year = ?"
+            parameters.append(int(year))
+        elif start_date is not None:
+            # The sessions overlapping the window
+            where += " AND s.start_date <= ? AND s.end_date >= ?"
+            parameters += [end_date, start_date]
+        if entity == "experiments":
+            rows = self.__query("SELECT s.session_id, s.data FROM sessions s WHERE {} "
+                                "ORDER BY CAST(s.session_id AS INTEGER)".format(where), parameters)
+            if start_date is not None and not rows:
+                # Like DOOR, a date window without sessions only has a message
+                return {"message": "No experiments found"}
+            return {"experiment metadata": {session_id: json.loads(data) for session_id, data in rows}}
+        if start_date is None:
+            # The proposals of the listings by year
+            sql = ("SELECT DISTINCT p.proposal_id, p.data FROM beamline_proposals s JOIN proposals p "
+                   "ON p.proposal_id = s.proposal_id WHERE " + where)
+        else:
+            sql = ("SELECT DISTINCT p.proposal_id, p.data FROM sessions s JOIN proposals p "
+                   "ON p.proposal_id = s.proposal_id WHERE " + where)
+        rows = self.__query(sql + " ORDER BY CAST(p.proposal_id AS INTEGER)", parameters)
+        return {"proposals": {proposal_id: json.loads(data) for proposal_id, data in rows}}
+
+    def __get_entity(self, endpoint, entity_id):
+        entity_id = entity_id.strip()
+        queries = {"proposals/propid": ("proposals", "SELECT proposal_id, data FROM proposals WHERE proposal_id = ?"),
+                   "experiments/propid": ("experiment metadata", "SELECT session_id, data FROM sessions WHERE "
+                                                                 "proposal_id = ? ORDER BY CAST(session_id AS INTEGER)"),
+                   "experiments/expid": ("experiment metadata", "SELECT session_id, data FROM sessions "
+                                                                "WHERE session_id = ?"),
+                   "users/id": ("user metadata", "SELECT user_id, data FROM users WHERE user_id = ?"),
+                   "institutes/id": ("institute metadata", "SELECT institute_id, data FROM institutes "
+                                                           "WHERE institute_id = ?")}
+        key, sql = queries[endpoint]
+        rows = self.__query(sql, (entity_id,))
+        if not rows and endpoint != "experiments/propid":
+            return None
+        return {key: {row_id: json.loads(data) for row_id, data in rows}}
+
+    @staticmethod
+    def __to_response(url, status_code, body):
+        r = Response()
+        r.status_code = status_code
+        r.url = url
+        r.reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}[status_code]
+        r._content = json.dumps(body).encode("utf-8")
+        r._content_consumed = True
+        r.headers["Content-Type"] = "application/json"
+        return r
+
+    def write_parquet(self, directory):
+        """
+           Write every table of the snapshot to a Parquet file (<table>.parquet) of a directory.
+           Requires pyarrow (pip install pydesydoor[parquet]).
+        """
+        if pyarrow is None:
+            raise ImportError("DoorSnapshot.write_parquet requires pyarrow. Ex: pip install pydesydoor[parquet]")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for table in TABLES:
+            with self.__lock:
+                cursor = self.__connection.execute("SELECT * FROM {}".format(table))
+                columns = [description[0] for description in cursor.description]
+                rows = cursor.fetchall()
+            data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            pyarrow.parquet.write_table(pyarrow.table(data), os.path.join(directory, table + ".parquet"))
+
+    def close(self):
+        self.__connection.close()
@@ -0,0 +1,231 @@
+import re
+import time
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The span (operation) the calls of the running thread or task belong to
+_current_span = contextvars.ContextVar("pydesydoor_current_span", default=None)
+
+# Parts of an url that are ids: numbers, beamlines (P11) or dates, but not API versions (v1)
+ID_PATTERN = re.compile(r"(?!v\d+$)[\w.-]*\d[\w.-]*")
+
+
+class TraceSpan(object):
+    """
+    A traced operation (Ex: "proposal 20210009") or HTTP call (Ex: "GET /users/id/1").
+
+    Calls have an endpoint, a status, the bytes received and how the caches answered it:
+    "hit" (not sent), "revalidated" (304) or "miss" for the DOOR response cache, "entity" for
+    an entity served by the entity cache, "coalesced" for a GET that shared the request of
+    an identical concurrent one, "snapshot" for a GET answered by a DOOR snapshot.
+    """
+    __slots__ = ("span_id", "parent_id", "kind", "name", "start", "end", "endpoint", "status", "bytes", "cache",
+                 "error")
+
+    def __init__(self, span_id, parent_id, kind, name, endpoint=None):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.kind = kind
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.endpoint = endpoint
+        self.status = None
+        self.bytes = None
+        self.cache = None
+        self.error = None
+
+    @property
+    def latency(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin=0.0):
+        data = {name: getattr(self, name) for name in self.__slots__ if name not in ("start", "end")}
+        data["start_ms"] = round((self.start - origin) * 1000, 3)
+        data["latency_ms"] = round(self.latency * 1000, 3)
+        return data
+
+
+def get_endpoint(method, url):
+    """
+       The endpoint of an url, with its ids replaced. Ex: ("GET", "/users/id/12") -> "GET /users/id/{}"
+    """
+    path = url.split("?")[0]
+    return "{} {}".format(method, "/".join("{}" if ID_PATTERN.fullmatch(part) else part for part in path.split("/")))
+
+
+class DoorTracer(object):
+    """
+    Records the DOOR and py-ispyb calls of the clients it is given to, with the operation
+    they belong to (proposal -> session -> participant -> institute), and reports the call
+    tree, the slowest endpoints and the critical path.
+
+    The operations are tracked with contextvars, so they follow the calls into the
+    workers of DesyDoorAPI.map_concurrent and into asyncio tasks.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__spans = []
+        self.__origin = time.perf_counter()
+
+    def get_spans(self):
+        with self.__lock:
+            return list(self.__spans)
+
+    def clear(self):
+        with self.__lock:
+            self.__spans = []
+            self.__origin = time.perf_counter()
+
+    def __start(self, kind, name, endpoint=None):
+        parent = _current_span.get()
+        with self.__lock:
+            span = TraceSpan(len(self.__spans) + 1, None if parent is None else parent.span_id, kind, name, endpoint)
+            self.__spans.append(span)
+        return span
+
+    @contextmanager
+    def operation(self, name):
+        """
+           Trace an operation, the calls and operations started inside it become its children.
+           Ex: with tracer.operation("proposal 20210009"): ...
+        """
+        span = self.__start("operation", name)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.perf_counter()
+
+    @contextmanager
+    def call(self, method, url):
+        """
+           Trace an HTTP call, the caller fills in its status, bytes and cache answer
+        """
+        span = self.__start("call", "{} {}".format(method, url), get_endpoint(method, url))
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.end = time.perf_counter()
+
+    def record_response(self, span, r):
+        span.status = r.status_code
+        span.bytes = len(r.content) if getattr(r, "_content_consumed", True) else None
+
+    def add_cache_hit(self, entity_type, entity_id):
+        """
+           Record an entity served by the entity cache (no call made)
+        """
+        span = self.__start("call", "{} {}".format(entity_type, entity_id), "cache " + entity_type)
+        span.cache = "entity"
+        span.end = span.start
+
+    def get_children(self):
+        children = {}
+        for span in self.get_spans():
+            children.setdefault(span.parent_id, []).append(span)
+        return children
+
+    def get_slowest_endpoints(self, limit=10):
+        """
+           The endpoints by total time: [{"endpoint", "calls", "total_ms", "mean_ms", "max_ms", "bytes", "cache_hits"}]
+        """
+        endpoints = {}
+        for span in self.get_spans():
+            # Only the calls that reached the HTTP layer
+            if span.kind != "call" or span.cache in ("entity", "coalesced"):
+                continue
+            stats = endpoints.setdefault(span.endpoint, {"endpoint": span.endpoint, "calls": 0, "total_ms": 0.0,
+                                                         "max_ms": 0.0, "bytes": 0, "cache_hits": 0})
+            latency = span.latency * 1000
+            stats["calls"] += 1
+            stats["total_ms"] += latency
+            stats["max_ms"] = max(stats["max_ms"], latency)
+            stats["bytes"] += span.bytes or 0
+            stats["cache_hits"] += span.cache == "hit"
+        for stats in endpoints.values():
+            stats["mean_ms"] = stats["total_ms"] / stats["calls"]
+        return sorted(endpoints.values(), key=lambda stats: stats["total_ms"], reverse=True)[:limit]
+
+    @staticmethod
+    def get_critical_spans(spans):
+        """
+           The spans of a level the total time waited for: the one that ended last, then going back
+           in time the one that ended last before it started, etc. Parallel spans that ended earlier are skipped.
+        """
+        critical = []
+        bound = None
+        for span in sorted(spans, key=lambda span: span.end or span.start, reverse=True):
+            if bound is None or (span.end or span.start) <= bound:
+                critical.append(span)
+                bound = span.start
+        return critical[::-1]
+
+    def get_critical_path(self):
+        """
+           The (depth, span) of the spans that determined the total time, in call tree order
+        """
+        children = self.get_children()
+        path = []
+
+        def add(spans, depth):
+            for span in self.get_critical_spans(spans):
+                path.append((depth, span))
+                add(children.get(span.span_id, []), depth + 1)
+        add(children.get(None, []), 0)
+        return path
+
+    def format_span(self, span):
+        text = "{} {:.1f} ms".format(span.name, span.latency * 1000)
+        if span.kind == "call" and span.cache != "entity":
+            text += " [{}{}{}]".format(span.status, "" if span.bytes is None else ", {} B".format(span.bytes),
+                                       "" if span.cache is None else ", cache " + span.cache)
+        elif span.cache == "entity":
+            text += " [entity cache]"
+        if span.error:
+            text += " ERROR: " + span.error
+        return text
+
+    def format_tree(self):
+        children = self.get_children()
+        lines = []
+
+        def add(span, depth):
+            lines.append("  " * depth + self.format_span(span))
+            for child in children.get(span.span_id, []):
+                add(child, depth + 1)
+        for root in children.get(None, []):
+            add(root, 0)
+        return lines
+
+    def format_report(self, limit=10):
+        """
+           The call tree, the slowest endpoints and the critical path as text
+        """
+        lines = ["Call tree:"] + ["  " + line for line in self.format_tree()]
+        lines.append("Slowest endpoints:")
+        for stats in self.get_slowest_endpoints(limit):
+            lines.append("  {endpoint:<50} {calls:>5} calls {total_ms:>10.1f} ms total {mean_ms:>8.1f} ms mean "
+                         "{max_ms:>8.1f} ms max {bytes:>9} B {cache_hits:>4} cache hits".format(**stats))
+        lines.append("Critical path:")
+        lines += ["  " * (depth + 1) + self.format_span(span) for depth, span in self.get_critical_path()]
+        return "\n".join(lines)
+
+    def to_dict(self, limit=10):
+        return {"spans": [span.to_dict(self.__origin) for span in self.get_spans()],
+                "slowest_endpoints": self.get_slowest_endpoints(limit),
+                "critical_path": [span.span_id for _, span in self.get_critical_path()]}
+
+    def write_json(self, path, limit=10):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(limit), f, indent=4)
@@ -0,0 +1,113 @@
+import json
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JSONStreamReader(object):
+    """
+    Incremental reader of a JSON document received in chunks (Ex: Response.iter_content).
+    Only the part of the document not parsed yet is kept in memory.
+
+       :param iterable chunks: The chunks (bytes or str) of the JSON document
+    """
+
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__json_decoder = json.JSONDecoder()
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self):
+        chunk = next(self.__chunks, None)
+        if chunk is None:
+            self.__eof = True
+            text = self.__text_decoder.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            text = self.__text_decoder.decode(chunk)
+        else:
+            text = chunk
+        # Drop what is already parsed
+        self.__buffer = self.__buffer[self.__pos:] + text
+        self.__pos = 0
+
+    def peek(self):
+        """
+           Return the next non whitespace character without consuming it, None at the end of the document
+        """
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in " \t\r\n":
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if self.__eof:
+                return None
+            self.__fill()
+
+    def next_char(self, expected=None):
+        char = self.peek()
+        if char is None or (expected is not None and char not in expected):
+            raise ValueError("Invalid JSON document: expected {} but found {!r}".format(expected, char))
+        self.__pos += 1
+        return char
+
+    def value(self):
+        """
+           Parse the next JSON value, reading more chunks until it is complete
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.__json_decoder.raw_decode(self.__buffer, self.__pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.__buffer) or self.__eof:
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            self.__fill()
+
+    def iter_object(self):
+        """
+           Iterate over the (name, value) members of the JSON object starting at the current position
+        """
+        self.next_char("{")
+        if self.peek() == "}":
+            self.next_char()
+            return
+        while True:
+            name = self.value()
+            self.next_char(":")
+            yield name
+            if self.next_char(",}") == "}":
+                return
+
+
+def iter_object_items(chunks, key):
+    """
+       Iterate over the (name, value) members of the object found under a top level key of a
+       JSON document, parsing the document incrementally. Ex: the sessions of a DOOR
+       {"experiment metadata": {"<id>": {...}, ...}} response, one at a time.
+       If the key is not in the document, the DOOR message is logged and nothing is yielded.
+
+       :param iterable chunks: The chunks (bytes or str) of the JSON document
+       :param str key: The top level key. Ex: "experiment metadata"
+    """
+    reader = JSONStreamReader(chunks)
+    found = False
+    message = None
+    for name in reader.iter_object():
+        if name == key and reader.peek() == "{":
+            found = True
+            for item_name in reader.iter_object():
+                yield item_name, reader.value()
+        else:
+            value = reader.value()
+            if name == "message":
+                message = value
+    if not found:
+        logger.warning(message)
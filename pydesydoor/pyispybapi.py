@@ -0,0 +1,169 @@
+import json
+import time
+import base64
+import logging
+import threading
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doorlog import log_request
+from pydesydoor.doorsettings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class PyISPyBError(Exception):
+    """
+    A py-ispyb call failed (login or request).
+    """
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class PyISPyBAPI(object):
+    """
+    RESTful Web-service API client for py-ISPyB.
+
+    The client keeps a pooled keep-alive HTTP session and caches the bearer token of the
+    service account until it expires, so many syncs only pay a single login. A request
+    answered with 401 logs in again and is retried once. The session is only created by the
+    first request.
+
+       :param int pool_maxsize: Maximum number of connections kept alive to py-ispyb
+       :param requests.Session http_session: An already configured session to share between clients
+       :param float token_lifetime: Seconds a token is used when its expiration can not be read from it
+       :param DoorTracer tracer: Optional tracer recording the py-ispyb calls
+       :param DoorSettings settings: The py-ispyb settings, the ones of the environment (and .env file) by default
+    """
+
+    # Renew the token a bit before it expires, so it does not expire while a request is in flight
+    TOKEN_EXPIRATION_MARGIN = 30
+
+    def __init__(self, pool_maxsize=10, http_session=None, token_lifetime=3600, tracer=None, settings=None):
+        # Get the environment variables from the .env file, read once per process
+        settings = settings or get_settings()
+        self.__api_root = settings.get("PYISPYB_API_ROOT")
+        self.__login = {"plugin": settings.get("PYISPYB_AUTH_PLUGIN"),
+                        "username": settings.get("PYISPYB_SERVICE_ACCOUNT"),
+                        "password": settings.get("PYISPYB_SERVICE_PASSWORD")}
+        self.__owns_http_session = http_session is None
+        self.__http_session = http_session
+        self.__pool_maxsize = pool_maxsize
+        self.__http_session_lock = threading.Lock()
+        self.__token_lifetime = token_lifetime
+        self.__token = None
+        self.__token_expires = 0
+        self.__token_lock = threading.Lock()
+        self.__tracer = tracer
+        self.logins = 0
+
+    def get_api_root(self):
+        return self.__api_root
+
+    def get_http_session(self):
+        """
+           The HTTP session of the client, created on first use
+        """
+        session = self.__http_session
+        if session is None:
+            with self.__http_session_lock:
+                if self.__http_session is None:
+                    self.__http_session = DesyDoorAPI.create_http_session(1, self.__pool_maxsize)
+                session = self.__http_session
+        return session
+
+    def close(self):
+        """
+           Close the pooled connections of this client (shared sessions are left open).
+        """
+        if self.__owns_http_session and self.__http_session is not None:
+            self.__http_session.close()
+            self.__http_session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def login(self):
+        """
+           Login to py-ispyb with the service account and cache the token
+        """
+        url = "/ispyb/api/v1/auth/login"
+        r = self.__traced("POST", url, lambda: self.get_http_session().post(self.__api_root + url,
+                                                                            json=self.__login))
+        if r.status_code != 201:
+            raise PyISPyBError(f"Could not login to py-ispyb with {self.__login['username']}. "
+                               f"Please check the credentials or the connection to py-ispyb.", r)
+        self.logins += 1
+        self.__token = r.json()['token']
+        self.__token_expires = self.get_token_expiration(self.__token) or time.time() + self.__token_lifetime
+        logger.info('Logged in to py-ispyb with %s', self.__login['username'])
+        return self.__token
+
+    def get_token(self):
+        """
+           Get the cached token, login first if there is none or it is about to expire
+        """
+        with self.__token_lock:
+            if self.__token is None or time.time() > self.__token_expires - self.TOKEN_EXPIRATION_MARGIN:
+                self.login()
+            return self.__token
+
+    def __renew_token(self, rejected_token):
+        with self.__token_lock:
+            # Another thread may have logged in again already
+            if self.__token == rejected_token:
+                self.login()
+            return self.__token
+
+    @staticmethod
+    def get_token_expiration(token):
+        """
+           Read the expiration ("exp" claim) of a JWT token, None if it is not a JWT token
+        """
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def request(self, method, url, **kwargs):
+        """
+           Authenticated request to py-ispyb, logging in again once if the token is rejected (401)
+
+           :param str method: The HTTP method. Ex: "POST"
+           :param str url: The url relative to the API root. Ex: "/ispyb/api/v1/userportalsync/sync_proposal"
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        token = self.get_token()
+        for retry in (True, False):
+            headers["Authorization"] = "Bearer " + token
+            r = self.__traced(method, url, lambda: self.get_http_session().request(method, self.__api_root + url,
+                                                                                   headers=headers, **kwargs))
+            if r.status_code != 401 or not retry:
+                return r
+            token = self.__renew_token(token)
+        return r
+
+    def __traced(self, method, url, send):
+        if self.__tracer is None:
+            return log_request(method, url, send)
+        with self.__tracer.call(method, url) as span:
+            r = log_request(method, url, send)
+            self.__tracer.record_response(span, r)
+        return r
+
+    def sync_proposal(self, payload):
+        """
+           Send a proposal in py-ispyb format (see DoorPyISPyB) to be synchronized and return the response text
+
+           :param payload: The proposal JSON (str or bytes)
+        """
+        headers = {"accept": "application/json", "Content-Type": "application/json"}
+        r = self.request("POST", "/ispyb/api/v1/userportalsync/sync_proposal", headers=headers, data=payload)
+        if r.status_code != 200:
+            raise PyISPyBError(r.text, r)
+        return r.text
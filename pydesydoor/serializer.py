@@ -0,0 +1,58 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PrettyJSONSerializer(object):
+    """
+    Indented JSON with sorted keys, as str. Meant to be read (Ex: syncdoor --door).
+    """
+    name = "pretty"
+
+    def dumps(self, data):
+        return json.dumps(data, indent=4, sort_keys=True, default=str)
+
+
+class CompactJSONSerializer(object):
+    """
+    Compact JSON (no indentation, keys in insertion order) as UTF-8 bytes, ready to be posted.
+    """
+    name = "compact"
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+class OrjsonSerializer(object):
+    """
+    Compact JSON as bytes with orjson (pip install pydesydoor[fast]).
+    The values orjson does not know and datetimes are written with str, like the stdlib serializers.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonSerializer requires orjson. Ex: pip install pydesydoor[fast]")
+        self.__options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=str, option=self.__options)
+
+
+SERIALIZERS = {"pretty": PrettyJSONSerializer, "compact": CompactJSONSerializer, "orjson": OrjsonSerializer}
+
+
+def get_serializer(name="auto"):
+    """
+       Get a serializer by name. "auto" is orjson when it is installed, else the compact stdlib one.
+
+       :param str name: "auto", "pretty", "compact" or "orjson"
+    """
+    if name == "auto":
+        name = "compact" if orjson is None else "orjson"
+    if name not in SERIALIZERS:
+        raise ValueError("Unknown serializer: {}".format(name))
+    return SERIALIZERS[name]()
@@ -0,0 +1,61 @@
+import sys
+from argparse import ArgumentParser
+from pydesydoor.doorsettings import DEFAULT_SNAPSHOT_FILE
+
+
+def create_arg_parser():
+    parser = ArgumentParser(description="Take or refresh a local snapshot of the DOOR data of a beamline. "
+                                        "syncdoor --snapshot then works from it without DOOR.")
+    parser.add_argument("-b", "--beamline", help="Beamline of the snapshot. Ex: P11", required=True)
+    parser.add_argument("-y", "--years", help="Years of the snapshot: 2022, 2016-2023 or 2021,2022", required=True)
+    parser.add_argument("--snapshot-file", help="SQLite file of the snapshot. It holds personal data of the DOOR users "
+                        "(names, emails, phone numbers) and is created readable by its owner only", required=False,
+                        default=DEFAULT_SNAPSHOT_FILE)
+    parser.add_argument("--force", help="Fetch every year, user and institute again, not only the missing or "
+                        "unfinished ones", required=False, action="store_true")
+    parser.add_argument("--parquet", help="Also write every table of the snapshot to a Parquet file of this "
+                        "directory (requires pyarrow)", required=False)
+    parser.add_argument("-c", "--concurrency", help="Maximum number of parallel DOOR requests (default 8)",
+                        required=False, type=int, default=8)
+    return parser
+
+
+def parse_years(years):
+    """
+       Parse the years of the command line. Ex: "2016-2018" -> [2016, 2017, 2018], "2021,2022" -> [2021, 2022]
+    """
+    parsed = []
+    for part in years.split(","):
+        first, _, last = part.strip().partition("-")
+        parsed += range(int(first), int(last or first) + 1)
+    return parsed
+
+
+def main(argv):
+    parsed_args = create_arg_parser().parse_args(argv)
+    try:
+        years = parse_years(parsed_args.years)
+    except ValueError:
+        print(f"Invalid years: {parsed_args.years}")
+        sys.exit(1)
+    from pydesydoor.desydoorapi import DesyDoorAPI
+    from pydesydoor.doorpyispyb import DEFAULT_PERSON_ID
+    from pydesydoor.doorsnapshot import DoorSnapshot
+    snapshot = DoorSnapshot(parsed_args.snapshot_file)
+    try:
+        with DesyDoorAPI(max_workers=parsed_args.concurrency) as client:
+            # The default person of the proposals without persons is needed to export them from the snapshot
+            stats = snapshot.update(client, parsed_args.beamline, years, parsed_args.force, [DEFAULT_PERSON_ID])
+        print("Fetched {years} years ({proposals} proposals, {sessions} sessions), {users} users and "
+              "{institutes} institutes".format(**stats))
+        print("Snapshot {}: {}".format(parsed_args.snapshot_file, ", ".join(
+            "{} {}".format(count, table) for table, count in snapshot.get_counts().items())))
+        if parsed_args.parquet:
+            snapshot.write_parquet(parsed_args.parquet)
+            print(f"Parquet files written to {parsed_args.parquet}")
+    finally:
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,11 +1,12 @@
-import os
 import sys
 import time
 from datetime import datetime
+from contextlib import nullcontext
 from argparse import ArgumentParser
-from requests import post
-from pydesydoor.doorpyispyb import DoorPyISPyB
-from dotenv import load_dotenv
+from pydesydoor.doorsettings import DEFAULT_CACHE_FILE, DEFAULT_STATE_FILE
+
+# The clients (and requests) are imported by the functions using them, so --help and the
+# argument errors answer without loading them. See benchmarks/coldstart.py
 
 
 def create_arg_parser():
@@ -14,91 +15,525 @@ def create_arg_parser():
         description="Command line tool to syncronize a DOOR proposal"
         "into an ISPyB."
     )
-    parser.add_argument("-p", "--proposal_id", help="Door proposal ID.", required=True)
+    parser.add_argument("-p", "--proposal_id", help="Door proposal ID.", required=False)
+    parser.add_argument("-f", "--proposals-file", help="File with one Door proposal ID per line, - to read from stdin",
+                        required=False)
+    parser.add_argument("-b", "--beamline", help="Synchronize the proposals of a beamline (with --year). Ex: P11",
+                        required=False)
+    parser.add_argument("-y", "--year", help="Year of the beamline proposals to synchronize. Ex: 2022", required=False)
+    parser.add_argument("-w", "--workers", help="Number of proposals synchronized in parallel (default 4)",
+                        required=False, type=int, default=4)
     parser.add_argument("-s", "--start", help="Session start date in format YYYY-MM-DD", required=False)
     parser.add_argument("-e", "--end", help="Session end date in format YYYY-MM-DD", required=False)
     parser.add_argument("-d", "--door", help="It will only get and show the proposal from DOOR",
                         required=False, action="store_true")
+    parser.add_argument("-c", "--concurrency", help="Maximum number of parallel DOOR lookups (default 8)",
+                        required=False, type=int, default=8)
+    parser.add_argument("--serializer", help="JSON serializer of the posted proposals (default auto: orjson if installed)",
+                        required=False, choices=["auto", "compact", "orjson"], default="auto")
+    parser.add_argument("--profile", help="Print the call tree, the slowest endpoints and the critical path of the "
+                        "DOOR and py-ispyb calls", required=False, action="store_true")
+    parser.add_argument("--profile-json", help="Write the profile of the DOOR and py-ispyb calls as JSON to a file",
+                        required=False)
+    parser.add_argument("--connect-timeout", help="Seconds to connect to DOOR (default 3.05)", required=False,
+                        type=float)
+    parser.add_argument("--read-timeout", help="Seconds to wait for DOOR data (default 30, more for the sessions)",
+                        required=False, type=float)
+    parser.add_argument("--retries", help="Retries of a failed DOOR request (default 2, 0 for none)", required=False,
+                        type=int, default=2)
+    parser.add_argument("--retry-budget", help="Retries allowed per DOOR request over the whole run (default 0.1)",
+                        required=False, type=float, default=0.1)
+    parser.add_argument("--deadline", help="Seconds to retrieve a proposal from DOOR before giving up on it",
+                        required=False, type=float)
+    parser.add_argument("--hedge", help="Send a second DOOR request when the first is slower than this latency "
+                        "percentile. Ex: 95", required=False, type=float)
+    parser.add_argument("--rate", help="Maximum DOOR requests per second", required=False, type=float)
+    parser.add_argument("--burst", help="DOOR requests sent at once after an idle period (default the rate)",
+                        required=False, type=int)
+    parser.add_argument("--rate-file", help="Share the --rate between the syncdoor processes of the host through "
+                        "this file", required=False)
+    parser.add_argument("--adaptive", help="Adapt the DOOR requests in flight to its answers (429/503, timeouts, "
+                        "latency), starting from --concurrency", required=False, action="store_true")
+    parser.add_argument("--explain", help="Only tell how many DOOR calls the sync of every proposal makes, "
+                        "without syncing it", required=False, action="store_true")
+    parser.add_argument("-o", "--output", help="Only export the proposals in py-ispyb format to this file, one JSON "
+                        "document per line (- for stdout), without syncing them", required=False)
+    parser.add_argument("--snapshot", help="Get the DOOR data from this snapshot (see pydesydoor.snapshotdoor) "
+                        "instead of DOOR", required=False)
+    parser.add_argument("--log-file", help="Append the logs to this file instead of stderr", required=False)
+    parser.add_argument("--log-level", help="Lowest level logged (default WARNING)", required=False,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="WARNING")
+    parser.add_argument("--log-json", help="Log one JSON object per line", required=False, action="store_true")
+    parser.add_argument("--log-requests", help="Log every DOOR and py-ispyb request with its status and latency",
+                        required=False, action="store_true")
+    parser.add_argument("--force", help="Post the proposals even if they did not change since their last sync",
+                        required=False, action="store_true")
+    parser.add_argument("--state-file", help="File where the last sync of every proposal is recorded (created "
+                        "readable by its owner only)",
+                        required=False, default=DEFAULT_STATE_FILE)
+    parser.add_argument("--cache-file", help="File of the persistent DOOR response cache. It holds personal data of "
+                        "the DOOR users (names, emails, phone numbers) and is created readable by its owner only",
+                        required=False, default=DEFAULT_CACHE_FILE)
+    parser.add_argument("--no-cache", help="Bypass the persistent DOOR response cache",
+                        required=False, action="store_true")
+    parser.add_argument("--clear-cache", help="Clear the persistent DOOR response cache",
+                        required=False, action="store_true")
     return parser
 
 
-def sync_proposal(proposal_id, door=False, start_date=None, end_date=None):
-    client = DoorPyISPyB()
+COMMISSIONING_PROPOSAL_ID = "20010001"
+
+
+class SyncError(Exception):
+    """
+    A proposal could not be retrieved from DOOR or synchronized with py-ispyb.
+    """
+
+
+def create_door_client(response_cache=None, max_workers=1, door=False, serializer="auto", tracer=None,
+                       request_options=None):
+    from pydesydoor.doorpyispyb import DoorPyISPyB
+    from pydesydoor.doorcache import DoorCache
+    from pydesydoor.serializer import get_serializer
+    # Compact JSON bytes are posted as they are, the pretty JSON is only for showing the proposals (--door)
+    serializer = get_serializer("pretty" if door else serializer)
+    # The same PI, operators and laboratories show up many times within a proposal
+    return DoorPyISPyB(cache=DoorCache(), response_cache=response_cache, max_workers=max_workers,
+                       serializer=serializer, tracer=tracer, **(request_options or {}))
+
+
+def get_request_options(parsed_args):
+    """
+       The timeouts, retries and hedging of the DOOR requests from the command line arguments, and the snapshot
+       answering them instead of DOOR
+    """
+    from pydesydoor.doorretry import RetryPolicy, RetryBudget, HedgePolicy, DEFAULT_TIMEOUTS
+    timeout = {family: (parsed_args.connect_timeout or connect, parsed_args.read_timeout or read)
+               for family, (connect, read) in DEFAULT_TIMEOUTS.items()}
+    retry = False
+    if parsed_args.retries > 0:
+        retry = RetryPolicy(max_retries=parsed_args.retries, budget=RetryBudget(ratio=parsed_args.retry_budget))
+    hedge = HedgePolicy(percentile=parsed_args.hedge) if parsed_args.hedge else None
+    options = {"timeout": timeout, "retry": retry, "hedge": hedge, "rate_limiter": get_rate_limiter(parsed_args)}
+    if parsed_args.snapshot:
+        from pydesydoor.doorsnapshot import DoorSnapshot
+        options["snapshot"] = DoorSnapshot(parsed_args.snapshot, read_only=True)
+    return options
+
+
+def get_rate_limiter(parsed_args):
+    """
+       The rate and concurrency limits of the DOOR requests from the command line arguments, None without limits
+    """
+    from pydesydoor.doorlimit import DoorRateLimiter, TokenBucket, FileTokenBucket, AdaptiveConcurrencyLimit
+    bucket = concurrency = None
+    if parsed_args.rate_file and not parsed_args.rate:
+        print("--rate-file requires --rate")
+        exit(1)
+    if parsed_args.rate:
+        bucket = (FileTokenBucket(parsed_args.rate_file, parsed_args.rate, parsed_args.burst) if parsed_args.rate_file
+                  else TokenBucket(parsed_args.rate, parsed_args.burst))
+    if parsed_args.adaptive:
+        concurrency = AdaptiveConcurrencyLimit(initial=parsed_args.concurrency,
+                                               max_limit=max(parsed_args.concurrency * parsed_args.workers, 1))
+    if bucket is None and concurrency is None:
+        return None
+    return DoorRateLimiter(bucket, concurrency)
+
+
+def sync_proposal(proposal_id, door=False, start_date=None, end_date=None, response_cache=None, max_workers=1,
+                  sync_state=None, force=False, pyispyb_client=None, serializer="auto", tracer=None,
+                  request_options=None, deadline_seconds=None):
+    from pydesydoor.doorretry import deadline
+    from pydesydoor.pyispybapi import PyISPyBAPI
+    with create_door_client(response_cache, max_workers, door, serializer, tracer, request_options) as client:
+        try:
+            start_time = time.time()
+            with deadline(deadline_seconds):
+                proposal = client.get_full_proposal_to_pyispyb(proposal_id, True, True, True, True, start_date,
+                                                               end_date)
+            if door:
+                '''
+                If --door option is passed only get the proposal from DOOR
+                and exit (do not sync with py-ispyb)
+                '''
+                print(proposal)
+                exit(1)
+            took = round(time.time() - start_time, 3)
+            print(f"Retrieving proposal {proposal_id} from the DOOR API took {took}")
+        except Exception as e:
+            print(f"There was an error retrieving proposal {proposal_id} from the DOOR API.")
+            print("Probably the proposal Id does not exist within the DOOR API environment.")
+            print(e)
+            sys.exit(1)
+
+    payload_hash = None
+    if sync_state is not None:
+        payload_hash = sync_state.get_payload_hash(proposal)
+        if not force and sync_state.is_unchanged(proposal_id, payload_hash, start_date, end_date):
+            print(f"Proposal {proposal_id} did not change since its last sync, skipping it (use --force to post it).")
+            return
+
+    # The client created here is closed, a given one belongs to the caller
+    with PyISPyBAPI(tracer=tracer) if pyispyb_client is None else nullcontext(pyispyb_client) as pyispyb_client:
+        post_proposal(pyispyb_client, proposal_id, proposal)
+    if sync_state is not None:
+        sync_state.set_synced(proposal_id, payload_hash, start_date, end_date)
+
+
+def post_proposal(pyispyb_client, proposal_id, proposal):
+    """
+       Post a proposal to py-ispyb and show the answer, exit if it fails
+    """
+    from pydesydoor.pyispybapi import PyISPyBError
     try:
-        start_time = time.time()
-        proposal = client.get_full_proposal_to_pyispyb(proposal_id, True, True, True, True, start_date, end_date)
-        if door:
-            '''
-            If --door option is passed only get the proposal from DOOR
-            and exit (do not sync with py-ispyb)
-            '''
-            print(proposal)
-            exit(1)
-        took = round(time.time() - start_time, 3)
-        print(f"Retrieving proposal {proposal_id} from the DOOR API took {took}")
-    except Exception as e:
-        print(f"There was an error retrieving proposal {proposal_id} from the DOOR API.")
-        print("Probably the proposal Id does not exist within the DOOR API environment.")
+        pyispyb_client.get_token()
+    except PyISPyBError as e:
+        print(e)
+        sys.exit(1)
+    try:
+        print(pyispyb_client.sync_proposal(proposal))
+    except PyISPyBError as e:
+        print(f"There was an error synchronizing proposal {proposal_id} with py-ispyb")
         print(e)
         sys.exit(1)
 
-    # Login to FastAPI and get the token
-    login = dict()
-    load_dotenv()
-    # Get the environment variables from the .env file
-    api_root = os.environ["PYISPYB_API_ROOT"] or None
-    login["plugin"] = os.environ["PYISPYB_AUTH_PLUGIN"] or None
-    login["username"] = os.environ["PYISPYB_SERVICE_ACCOUNT"] or None
-    login["password"] = os.environ["PYISPYB_SERVICE_PASSWORD"] or None
 
-    r = post(api_root + "/ispyb/api/v1/auth/login", json=login, verify=False)
+def sync_proposals(proposal_ids, door=False, start_date=None, end_date=None, response_cache=None, max_workers=1,
+                   workers=4, sync_state=None, force=False, pyispyb_client=None, serializer="auto", tracer=None,
+                   request_options=None, deadline_seconds=None):
+    """
+       Synchronize many proposals with a pool of workers sharing one DOOR client and one
+       py-ispyb login. Returns one result per proposal: (proposal id, status, error, seconds)
+       where the status is "synced", "unchanged", "shown" (--door) or "failed".
+
+       :param list proposal_ids: The DOOR proposal ids
+       :param boolean door: True to only get and show the proposals from DOOR
+       :param str start_date (%Y-%m-%d): the start date range to find proposal sessions
+       :param str end_date (%Y-%m-%d): the end date range to find proposal sessions
+       :param DoorResponseCache response_cache: Optional persistent DOOR response cache
+       :param int max_workers: Maximum number of parallel DOOR lookups within a proposal
+       :param int workers: Number of proposals synchronized in parallel
+       :param SyncStateStore sync_state: Optional store to skip the proposals that did not change
+       :param boolean force: True to post the proposals even if they did not change
+       :param PyISPyBAPI pyispyb_client: The py-ispyb client, one is created if not given
+       :param str serializer: The serializer of the posted proposals, see pydesydoor.serializer.get_serializer
+       :param DoorTracer tracer: Optional tracer of the DOOR and py-ispyb calls
+       :param dict request_options: The timeout, retry and hedge options of the DOOR client (see get_request_options)
+       :param float deadline_seconds: Optional time to retrieve every proposal from DOOR
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pydesydoor.pyispybapi import PyISPyBAPI, PyISPyBError
+    owned_client = None
+    if pyispyb_client is None and not door:
+        pyispyb_client = owned_client = PyISPyBAPI(tracer=tracer)
+    with nullcontext() if owned_client is None else owned_client, \
+            create_door_client(response_cache, max_workers, door, serializer, tracer, request_options) as client:
+        if not door:
+            # Fail fast on wrong credentials, the token is then shared by all the workers
+            try:
+                pyispyb_client.get_token()
+            except PyISPyBError as e:
+                raise SyncError(str(e))
+
+        def sync(proposal_id):
+            start_time = time.time()
+            try:
+                with client.trace("sync", proposal_id):
+                    status = sync_one(client, pyispyb_client, proposal_id, door, start_date, end_date, sync_state,
+                                      force, deadline_seconds)
+                error = None
+            except SyncError as e:
+                status, error = "failed", str(e)
+            return proposal_id, status, error, round(time.time() - start_time, 3)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(sync, proposal_ids))
+
+
+def sync_one(client, pyispyb_client, proposal_id, door=False, start_date=None, end_date=None, sync_state=None,
+             force=False, deadline_seconds=None):
+    """
+       Synchronize a proposal of a batch and return its status. Raises SyncError on failure.
+    """
+    from pydesydoor.doorretry import deadline
+    from pydesydoor.pyispybapi import PyISPyBError
+    if proposal_id == COMMISSIONING_PROPOSAL_ID and not (start_date and end_date):
+        raise SyncError("You must use a date range when syncronizing the commissioning proposal 20010001.")
+    try:
+        with deadline(deadline_seconds):
+            proposal = client.get_full_proposal_to_pyispyb(proposal_id, True, True, True, True, start_date, end_date)
+    except Exception as e:
+        raise SyncError(f"There was an error retrieving proposal {proposal_id} from the DOOR API: {e}")
+    if door:
+        print(proposal)
+        return "shown"
+    payload_hash = None
+    if sync_state is not None:
+        payload_hash = sync_state.get_payload_hash(proposal)
+        if not force and sync_state.is_unchanged(proposal_id, payload_hash, start_date, end_date):
+            return "unchanged"
+    try:
+        pyispyb_client.sync_proposal(proposal)
+    except PyISPyBError as e:
+        raise SyncError(f"There was an error synchronizing proposal {proposal_id} with py-ispyb\n{e}")
+    if sync_state is not None:
+        sync_state.set_synced(proposal_id, payload_hash, start_date, end_date)
+    return "synced"
+
+
+def explain_proposals(proposal_ids, start_date=None, end_date=None, response_cache=None, max_workers=1,
+                      request_options=None):
+    """
+       Plan the sync of the proposals without syncing them. Returns one result per proposal:
+       (proposal id, explanation of DoorPyISPyB.explain_full_proposal or None, error or None)
+    """
+    results = []
+    with create_door_client(response_cache, max_workers, request_options=request_options) as client:
+        for proposal_id in proposal_ids:
+            if proposal_id == COMMISSIONING_PROPOSAL_ID and not (start_date and end_date):
+                results.append((proposal_id, None, "The commissioning proposal 20010001 needs a date range."))
+                continue
+            try:
+                results.append((proposal_id, client.explain_full_proposal(proposal_id, True, True, True, True,
+                                                                          start_date, end_date), None))
+            except Exception as e:
+                results.append((proposal_id, None, f"There was an error retrieving proposal {proposal_id} "
+                                                   f"from the DOOR API: {e}"))
+    return results
+
+
+def export_proposals(proposal_ids, output, start_date=None, end_date=None, response_cache=None, max_workers=1,
+                     workers=4, serializer="auto", tracer=None, request_options=None):
+    """
+       Export the proposals in py-ispyb format as JSON Lines while they are retrieved, with at most
+       2 * workers proposals in memory. Returns the number of proposals exported and the errors.
+
+       :param proposal_ids: The DOOR proposal ids, or a function of the DOOR client returning them (Ex: a stream)
+       :param str output: The file the proposals are written to, - for stdout
+    """
+    from pydesydoor.doorpipeline import DoorPipeline, FileSink
+    errors = []
+
+    def export(proposal_id):
+        if proposal_id == COMMISSIONING_PROPOSAL_ID and not (start_date and end_date):
+            errors.append(f"{proposal_id}: The commissioning proposal 20010001 needs a date range.")
+            return None
+        try:
+            return client.get_full_proposal_data(proposal_id, True, True, True, True, start_date, end_date)
+        except Exception as e:
+            errors.append(f"{proposal_id}: There was an error retrieving proposal {proposal_id} from the DOOR API: {e}")
+            return None
+
+    with create_door_client(response_cache, max_workers, serializer=serializer, tracer=tracer,
+                            request_options=request_options) as client:
+        if callable(proposal_ids):
+            proposal_ids = proposal_ids(client)
+        sink = FileSink(sys.stdout if output == "-" else output)
+        exported = DoorPipeline(proposal_ids, export, client.get_serializer(), sink, workers).run()
+    return exported, errors
+
+
+def iter_export_proposal_ids(parsed_args, client):
+    """
+       The proposal ids to export, the ones of the beamline are read while the DOOR listing is downloaded
+    """
+    proposal_ids = [parsed_args.proposal_id] if parsed_args.proposal_id else []
+    if parsed_args.proposals_file:
+        proposal_ids += read_proposal_ids(parsed_args.proposals_file)
+    seen = set()
+    for proposal_id in proposal_ids:
+        if proposal_id not in seen:
+            seen.add(proposal_id)
+            yield proposal_id
+    if parsed_args.beamline:
+        for proposal_id, _ in client.iter_beamline_proposals(parsed_args.beamline, parsed_args.year):
+            if str(proposal_id) not in seen:
+                seen.add(str(proposal_id))
+                yield str(proposal_id)
+
+
+def print_explain(results):
+    for proposal_id, explanation, error in results:
+        if error is not None:
+            print(f"{proposal_id}: {error}")
+            continue
+        print(f"Proposal {proposal_id}: {explanation['sessions']} sessions, {explanation['user_references']} user "
+              f"references, {explanation['max_calls']} DOOR calls at most: {explanation['planning_calls']} to plan, "
+              f"{explanation['user_calls']} users, at most {explanation['max_institute_calls']} institutes")
+    total = sum(explanation["max_calls"] for _, explanation, _ in results if explanation is not None)
+    print(f"{total} DOOR calls at most for {len(results)} proposals")
+
 
-    token = None
-    if r.status_code == 201:
-        token = r.json()['token']
+def print_summary(results, took):
+    failures = [result for result in results if result[2] is not None]
+    unchanged = [result for result in results if result[1] == "unchanged"]
+    print(f"Synchronized {len(results)} proposals in {round(took, 3)} s: "
+          f"{len(results) - len(failures)} succeeded ({len(unchanged)} unchanged), {len(failures)} failed")
+    for proposal_id, status, error, proposal_took in results:
+        print(f"  {proposal_id:<10} {status:<10} {proposal_took:>8} s")
+    for proposal_id, _, error, _ in failures:
+        print(f"{proposal_id}: {error}")
+
+
+def read_proposal_ids(proposals_file):
+    """
+       Read the proposal ids, one per line, from a file or from stdin ("-").
+       Empty lines and lines starting with # are skipped.
+    """
+    if proposals_file == "-":
+        lines = sys.stdin.readlines()
     else:
-        print(
-            f"Could not login to py-ispyb with {login['username']}. "
-            f"Please check the credentials or the connection to py-ispyb.")
+        with open(proposals_file) as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def get_batch_proposal_ids(parsed_args, response_cache=None, request_options=None):
+    """
+       The proposal ids of -p, of the proposals file and of the beamline, in this order and without duplicates
+    """
+    proposal_ids = [parsed_args.proposal_id] if parsed_args.proposal_id else []
+    if parsed_args.proposals_file:
+        proposal_ids += read_proposal_ids(parsed_args.proposals_file)
+    if parsed_args.beamline:
+        with create_door_client(response_cache, request_options=request_options) as client:
+            proposals = client.get_beamline_proposals_by_year(parsed_args.beamline, parsed_args.year)
+        if proposals:
+            proposal_ids += [str(proposal_id) for proposal_id in proposals]
+    # Keep the order, but synchronize every proposal only once
+    return list(dict.fromkeys(proposal_ids))
+
+
+def open_response_cache(parsed_args):
+    """
+       Open the persistent DOOR response cache, clearing it first if requested.
+       Returns None when the cache is bypassed.
+    """
+    from pydesydoor.doorhttpcache import DoorResponseCache
+    if parsed_args.no_cache and not parsed_args.clear_cache:
+        return None
+    response_cache = DoorResponseCache(parsed_args.cache_file)
+    if parsed_args.clear_cache:
+        response_cache.clear()
+        print(f"The DOOR response cache {parsed_args.cache_file} has been cleared.")
+    if parsed_args.no_cache:
+        response_cache.close()
+        return None
+    return response_cache
+
+
+def has_date_range(parsed_args):
+    if parsed_args.start and parsed_args.end:
+        try:
+            datetime.strptime(parsed_args.start, '%Y-%m-%d')
+            datetime.strptime(parsed_args.end, '%Y-%m-%d')
+            return True
+        except ValueError as e:
+            print(e)
+            exit(1)
+    return False
+
+
+def sync_batch(parsed_args, response_cache=None, sync_state=None, tracer=None):
+    start_time = time.time()
+    request_options = get_request_options(parsed_args)
+    proposal_ids = get_batch_proposal_ids(parsed_args, response_cache, request_options)
+    try:
+        results = sync_proposals(proposal_ids, parsed_args.door, parsed_args.start, parsed_args.end, response_cache,
+                                 parsed_args.concurrency, parsed_args.workers, sync_state, parsed_args.force,
+                                 serializer=parsed_args.serializer, tracer=tracer, request_options=request_options,
+                                 deadline_seconds=parsed_args.deadline)
+    except SyncError as e:
+        print(e)
+        sys.exit(1)
+    print_summary(results, time.time() - start_time)
+    if any(error is not None for _, _, error, _ in results):
         sys.exit(1)
 
-    if token:
-        headers = {"Authorization": "Bearer " + token, "accept": "application/json", "Content-Type": "application/json"}
-        r = post(api_root + "/ispyb/api/v1/userportalsync/sync_proposal", headers=headers, data=proposal, verify=False)
-        if r.status_code == 200:
-            print(r.text)
-        else:
-            print(f"There was an error synchronizing proposal {proposal_id} with py-ispyb")
-            print(r.text)
-            sys.exit(1)
 
+def export_output(parsed_args, response_cache=None, tracer=None):
+    exported, errors = export_proposals(lambda client: iter_export_proposal_ids(parsed_args, client), parsed_args.output,
+                                        parsed_args.start, parsed_args.end, response_cache, parsed_args.concurrency,
+                                        parsed_args.workers, parsed_args.serializer, tracer,
+                                        get_request_options(parsed_args))
+    # On stderr, so the proposals written to stdout stay JSON Lines
+    print(f"Exported {exported} proposals, {len(errors)} failed", file=sys.stderr)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        sys.exit(1)
 
-if __name__ == "__main__":
+
+def report_profile(parsed_args, tracer):
+    if parsed_args.profile:
+        print(tracer.format_report())
+    if parsed_args.profile_json:
+        tracer.write_json(parsed_args.profile_json)
+
+
+def main(argv):
+    from pydesydoor.doorlog import configure_logging
+    from pydesydoor.doortrace import DoorTracer
     arg_parser = create_arg_parser()
-    parsed_args = arg_parser.parse_args(sys.argv[1:])
-    if parsed_args.proposal_id:
-        date_range = False
-        if parsed_args.start and parsed_args.end:
-            try:
-                datetime_start = datetime.strptime(parsed_args.start, '%Y-%m-%d')
-                datetime_end = datetime.strptime(parsed_args.end, '%Y-%m-%d')
-                date_range = True
-            except ValueError as e:
-                print(e)
-                exit(1)
+    parsed_args = arg_parser.parse_args(argv)
+    # Written by a background thread, so the sync threads never wait for the logs
+    with configure_logging(parsed_args.log_file, parsed_args.log_level, parsed_args.log_json,
+                           requests=parsed_args.log_requests):
+        if not (parsed_args.profile or parsed_args.profile_json):
+            run(arg_parser, parsed_args)
+            return
+        tracer = DoorTracer()
+        try:
+            run(arg_parser, parsed_args, tracer)
+        finally:
+            # Also when the sync exits early (Ex: --door)
+            report_profile(parsed_args, tracer)
 
-        if parsed_args.proposal_id == "20010001":
-            '''
-            If it is the commissioning proposal force to sync using a date range
-            Otherwise it will retrieve too many sessions from the past
-            '''
-            if date_range:
-                sync_proposal(parsed_args.proposal_id, parsed_args.door, parsed_args.start, parsed_args.end)
-            else:
-                print("You must use a date range when syncronizing the commissioning proposal 20010001.")
-                exit(1)
-        else:
-            if date_range:
-                sync_proposal(parsed_args.proposal_id, parsed_args.door, parsed_args.start, parsed_args.end)
-            else:
-                sync_proposal(parsed_args.proposal_id, parsed_args.door)
+
+def run(arg_parser, parsed_args, tracer=None):
+    if parsed_args.beamline and not parsed_args.year:
+        arg_parser.error("--beamline requires --year")
+    batch = parsed_args.proposals_file or parsed_args.beamline
+    response_cache = open_response_cache(parsed_args)
+    if not parsed_args.proposal_id and not batch:
+        if parsed_args.clear_cache:
+            return
+        arg_parser.error("the following arguments are required: -p/--proposal_id, -f/--proposals-file or -b/--beamline")
+    date_range = has_date_range(parsed_args)
+    if parsed_args.explain:
+        request_options = get_request_options(parsed_args)
+        proposal_ids = get_batch_proposal_ids(parsed_args, response_cache, request_options)
+        print_explain(explain_proposals(proposal_ids, parsed_args.start, parsed_args.end, response_cache,
+                                        parsed_args.concurrency, request_options))
+        return
+    if parsed_args.output:
+        export_output(parsed_args, response_cache, tracer)
+        return
+    from pydesydoor.syncstate import SyncStateStore
+    sync_state = SyncStateStore(parsed_args.state_file)
+    if batch:
+        sync_batch(parsed_args, response_cache, sync_state, tracer)
+        return
+
+    if parsed_args.proposal_id == COMMISSIONING_PROPOSAL_ID and not date_range:
+        '''
+        If it is the commissioning proposal force to sync using a date range
+        Otherwise it will retrieve too many sessions from the past
+        '''
+        print("You must use a date range when syncronizing the commissioning proposal 20010001.")
+        exit(1)
+    if date_range:
+        sync_proposal(parsed_args.proposal_id, parsed_args.door, parsed_args.start, parsed_args.end, response_cache,
+                      parsed_args.concurrency, sync_state, parsed_args.force, serializer=parsed_args.serializer,
+                      tracer=tracer, request_options=get_request_options(parsed_args),
+                      deadline_seconds=parsed_args.deadline)
+    else:
+        sync_proposal(parsed_args.proposal_id, parsed_args.door, response_cache=response_cache,
+                      max_workers=parsed_args.concurrency, sync_state=sync_state, force=parsed_args.force,
+                      serializer=parsed_args.serializer, tracer=tracer, request_options=get_request_options(parsed_args),
+                      deadline_seconds=parsed_args.deadline)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,74 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pydesydoor.doorsettings import DEFAULT_STATE_FILE, create_private_file
+
+
+class SyncStateStore(object):
+    """
+    Local (SQLite) record of the last successful sync of every proposal with py-ispyb.
+
+    It keeps a canonical hash of the payload posted to py-ispyb, so a proposal whose
+    generated payload did not change since its last sync does not need to be posted again.
+    The sessions date range is part of the key, as it changes the payload of a proposal.
+
+       :param str path: The SQLite file where the sync state is stored
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        self.path = path
+        create_private_file(path)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS synced_proposals ("
+                                      "proposal_id TEXT NOT NULL, date_range TEXT NOT NULL, "
+                                      "payload_hash TEXT NOT NULL, synced_at REAL NOT NULL, "
+                                      "PRIMARY KEY (proposal_id, date_range))")
+
+    @staticmethod
+    def get_payload_hash(payload):
+        """
+           Hash of the payload independent of its formatting (indentation, key order)
+
+           :param payload: The payload as JSON str/bytes or as python object
+        """
+        if isinstance(payload, (str, bytes)):
+            payload = json.loads(payload)
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_date_range(start_date=None, end_date=None):
+        return "{}/{}".format(start_date or "", end_date or "")
+
+    def is_unchanged(self, proposal_id, payload_hash, start_date=None, end_date=None):
+        """
+           True when the payload hash is the one of the last successful sync of the proposal
+        """
+        with self.__lock:
+            row = self.__connection.execute("SELECT payload_hash FROM synced_proposals "
+                                            "WHERE proposal_id = ? AND date_range = ?",
+                                            (str(proposal_id), self.get_date_range(start_date, end_date))).fetchone()
+        return row is not None and row[0] == payload_hash
+
+    def set_synced(self, proposal_id, payload_hash, start_date=None, end_date=None):
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO synced_proposals VALUES (?, ?, ?, ?)",
+                                      (str(proposal_id), self.get_date_range(start_date, end_date), payload_hash,
+                                       time.time()))
+
+    def forget(self, proposal_id=None):
+        """
+           Forget the sync state of a proposal, or of every proposal
+        """
+        with self.__lock, self.__connection:
+            if proposal_id is None:
+                self.__connection.execute("DELETE FROM synced_proposals")
+            else:
+                self.__connection.execute("DELETE FROM synced_proposals WHERE proposal_id = ?", (str(proposal_id),))
+
+    def close(self):
+        self.__connection.close()
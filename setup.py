@@ -22,5 +22,10 @@ setup(
         'Programming Language :: Python :: 3.8',
     ],
     install_requires=['requests', 'python-dotenv'],
-    packages=find_packages(exclude=["examples"]),  # Don't include examples directory
+    extras_require={
+        'async': ['httpx'],
+        'fast': ['orjson'],
+        'parquet': ['pyarrow'],
+    },
+    packages=find_packages(exclude=["examples", "benchmarks"]),  # Don't include examples and benchmarks
 )
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import base64
+import random
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+from unittest.mock import patch
+from requests import Response, HTTPError
+from pydesydoor.doorsettings import load_dotenv_once
+
+DOOR_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+COMMISSIONING_PROPOSAL_ID = "20010001"
+# Added to every dataset, it is the default person of the proposals without persons
+DEFAULT_PERSON_ID = 5714
+# Password of every user of the datasets (DOOR receives it base64 encoded)
+USER_PASSWORD = "password"
+
+# Synthetic datasets, from a single small proposal to a commissioning proposal with thousands of sessions
+DATASETS = {
+    "small": dict(proposals=1, sessions=5, participants=3, users=20, institutes=5),
+    "medium": dict(proposals=20, sessions=40, participants=4, users=300, institutes=40),
+    "large": dict(proposals=100, sessions=100, participants=5, users=2000, institutes=200),
+    "commissioning": dict(proposals=1, sessions=5, participants=3, users=1000, institutes=100,
+                          commissioning_sessions=5000),
+}
+
+
+class DoorDataset(object):
+    """
+    DOOR data in the DOOR format, by id: proposals, sessions, users and institutes.
+    The dicts are used as they are, so a test can patch them.
+    """
+
+    def __init__(self, proposals=None, sessions=None, users=None, institutes=None):
+        self.proposals = {} if proposals is None else proposals
+        self.sessions = {} if sessions is None else sessions
+        self.users = {} if users is None else users
+        self.institutes = {} if institutes is None else institutes
+
+    @staticmethod
+    def get_roles(user_id):
+        # One user out of five has no roles
+        if int(user_id) % 5 == 0:
+            return None
+        return ["user"] if int(user_id) % 2 else ["user", "beamline-scientist"]
+
+
+class MockDataset(DoorDataset):
+    """
+    Synthetic DOOR data: proposals, their sessions, users and institutes, in the DOOR format.
+    The same parameters (and seed) always give the same data.
+
+       :param int proposals: Number of regular proposals (ids from 20220001)
+       :param int sessions: Number of sessions per regular proposal
+       :param int participants: Number of participants per session
+       :param int users: Number of users (ids from 1)
+       :param int institutes: Number of institutes (ids from 1)
+       :param int commissioning_sessions: Sessions of the commissioning proposal 20010001 (0 for none)
+       :param tuple beamlines: Beamlines of the sessions, the regular proposals are on the first one
+       :param int year: Year of the sessions of the regular proposals
+       :param int seed: Seed of the random data
+    """
+
+    def __init__(self, proposals=1, sessions=10, participants=3, users=50, institutes=10, commissioning_sessions=0,
+                 beamlines=("P11", "P14", "P13"), year=2022, seed=0):
+        super().__init__()
+        self.__random = random.Random(seed)
+        self.beamlines = beamlines
+        self.institutes.update({str(i): self.__make_institute(i) for i in range(1, institutes + 1)})
+        user_ids = list(range(1, users + 1)) + [DEFAULT_PERSON_ID]
+        self.users.update({str(i): self.__make_user(i, institutes) for i in user_ids})
+        self.__user_ids = user_ids[:-1]
+        self.__next_session_id = 11000001
+        for number in range(20220001, 20220001 + proposals):
+            self.proposals[str(number)] = self.__make_proposal(number)
+            self.__add_sessions(number, sessions, participants, beamlines[:1], datetime(year, 1, 3, 8), 365)
+        if commissioning_sessions:
+            self.proposals[COMMISSIONING_PROPOSAL_ID] = {"title": "Commissioning", "proposalNumber": 20010001,
+                                                         "proposalCode": "C", "proposalPI": None,
+                                                         "proposalLeader": None, "proposalCowriters": None}
+            # Years of commissioning sessions, on every beamline
+            self.__add_sessions(int(COMMISSIONING_PROPOSAL_ID), commissioning_sessions, participants, beamlines,
+                                datetime(2016, 1, 4, 8), 365 * 8)
+
+    @classmethod
+    def from_name(cls, name, **kwargs):
+        """
+           Build one of the DATASETS. Ex: MockDataset.from_name("commissioning")
+        """
+        return cls(**dict(DATASETS[name], **kwargs))
+
+    @staticmethod
+    def __make_institute(institute_id):
+        return {"name": "Institute {} of a rather long name for the ISPyB laboratory table".format(institute_id),
+                "address": "Notkestr. {}".format(institute_id), "city": "Hamburg", "country": "DE"}
+
+    def __make_user(self, user_id, institutes):
+        return {"givenName": "Given{}".format(user_id), "familyName": "Family{}".format(user_id), "title": "Dr.",
+                "emailAddress": "user{}@example.org".format(user_id), "login": "user{}".format(user_id),
+                "laboratoryId": self.__random.randint(1, institutes), "phoneNumber": 40000000 + user_id}
+
+    def __pick_users(self, count):
+        return self.__random.sample(self.__user_ids, min(count, len(self.__user_ids)))
+
+    def __make_proposal(self, number):
+        pi_id, leader_id, *cowriter_ids = self.__pick_users(2 + self.__random.randint(0, 3))
+        if len(cowriter_ids) == 1:
+            # DOOR returns an int for a single co-writer
+            cowriters = cowriter_ids[0]
+        else:
+            cowriters = ", ".join(str(i) for i in cowriter_ids) or None
+        return {"title": "Proposal {}".format(number), "proposalNumber": number, "proposalCode": "I",
+                "proposalPI": pi_id, "proposalLeader": leader_id, "proposalCowriters": cowriters}
+
+    def __add_sessions(self, proposal_number, count, participants, beamlines, first_date, days):
+        for _ in range(count):
+            start = first_date + timedelta(days=self.__random.randrange(days), hours=self.__random.choice((0, 12)))
+            end = start + timedelta(hours=12 * self.__random.randint(1, 4))
+            participant_ids = [str(i) for i in self.__pick_users(participants)]
+            third = max(1, len(participant_ids) // 3)
+            session_id = self.__next_session_id
+            self.__next_session_id += 1
+            self.sessions[str(session_id)] = {
+                "expSessionPk": session_id, "proposalId": proposal_number,
+                "startDate": start.strftime(DOOR_DATETIME_FORMAT), "endDate": end.strftime(DOOR_DATETIME_FORMAT),
+                "beamlineName": self.__random.choice(beamlines), "scheduled": 1,
+                "nbShifts": (end - start).days * 3 or 1, "beamlineOperator": self.__random.choice(self.__user_ids),
+                "participants": {"remote": ",".join(participant_ids[:third]) or None,
+                                 "on-site": ", ".join(participant_ids[third:2 * third]) or None,
+                                 "data-only": ",".join(participant_ids[2 * third:]) or None}}
+
+
+def make_token(lifetime=3600):
+    """
+       An unsigned JWT token, only its expiration ("exp") is read by the clients
+    """
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return ".".join([encode({"alg": "none"}), encode({"exp": time.time() + lifetime}), "mock"])
+
+
+# Small DOOR dataset used by the offline tests
+PROPOSALS = {
+    "20210009": {"title": "Test proposal", "proposalNumber": 20210009, "proposalCode": "I",
+                 "proposalPI": 1, "proposalLeader": 2, "proposalCowriters": "3, 1"},
+}
+SESSIONS = {
+    "11000001": {"expSessionPk": 11000001, "proposalId": 20210009, "startDate": "2022-07-01 08:00:00",
+                 "endDate": "2022-07-02 08:00:00", "beamlineName": "P11", "scheduled": 1, "nbShifts": 3,
+                 "beamlineOperator": 4, "participants": {"remote": "2,3", "on-site": 1, "data-only": None}},
+    "11000002": {"expSessionPk": 11000002, "proposalId": 20210009, "startDate": "2022-08-01 08:00:00",
+                 "endDate": "2022-08-01 20:00:00", "beamlineName": "P11", "scheduled": 1, "nbShifts": 1,
+                 "beamlineOperator": 4, "participants": {"remote": None, "on-site": "1, 2", "data-only": 3}},
+    "11000003": {"expSessionPk": 11000003, "proposalId": 20210009, "startDate": "2022-08-05 08:00:00",
+                 "endDate": "2022-08-06 08:00:00", "beamlineName": "P14", "scheduled": 1, "nbShifts": 3,
+                 "beamlineOperator": None, "participants": {"remote": None, "on-site": 2, "data-only": None}},
+}
+USERS = {
+    str(user_id): {"givenName": "Given%d" % user_id, "familyName": "Family%d" % user_id, "title": "Dr.",
+                   "emailAddress": "user%d@example.org" % user_id, "login": "user%d" % user_id,
+                   "laboratoryId": 10 + user_id % 2, "phoneNumber": 1000 + user_id}
+    for user_id in range(1, 5)
+}
+INSTITUTES = {
+    "10": {"name": "Deutsches Elektronen-Synchrotron", "address": "Notkestr. 85", "city": "Hamburg", "country": "DE"},
+    "11": {"name": "European Molecular Biology Laboratory", "address": "Notkestr. 85", "city": "Hamburg", "country": "DE"},
+}
+
+
+# The small DOOR dataset of the offline tests
+TEST_DATASET = DoorDataset(PROPOSALS, SESSIONS, USERS, INSTITUTES)
+
+
+def session_in(session, beamline=None, start=None, end=None):
+    """
+       True when a DOOR session is on the beamline and overlaps the (YYYYMMDD) window, like the DOOR listings
+    """
+    if beamline is not None and session["beamlineName"] != beamline.upper():
+        return False
+    if start is None:
+        return True
+    return start <= session["endDate"][:10].replace("-", "") and session["startDate"][:10].replace("-", "") <= end
+
+
+def get_window(year=None, start=None, end=None):
+    # Listings of a year are the listings of its window
+    if year is not None:
+        return year + "0101", year + "1231"
+    return start, end
+
+
+class FakeDoor(object):
+    """
+    The DOOR REST API answered from a dataset. The in-process fake of the tests (door_response) and the
+    HTTP mock server (tests.mockdoor.MockDoorServer) both route the DOOR requests here.
+
+       :param DoorDataset dataset: The DOOR data served
+    """
+    # Paths relative to the DOOR root, the endpoint of a route is its path up to the first group
+    ROUTES = [
+        ("GET", r"/proposals/propid/([^/]+)", "get_proposal"),
+        ("GET", r"/proposals/beamline/([^/]+)(?:/year/(\d+))?(?:/date/(\d+)/(\d+))?", "get_beamline_proposals"),
+        ("GET", r"/experiments/propid/([^/]+)", "get_proposal_sessions"),
+        ("GET", r"/experiments/expid/([^/]+)", "get_session"),
+        ("GET", r"/experiments/beamline/([^/]+)(?:/year/(\d+))?(?:/date/(\d+)/(\d+))?", "get_beamline_sessions"),
+        ("GET", r"/users/id/([^/]+)", "get_user"),
+        ("GET", r"/institutes/id/([^/]+)", "get_institute"),
+        ("GET", r"/roles/userid/([^/]+)", "get_roles"),
+        ("POST", r"/doorauth/auth", "door_login"),
+    ]
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def route(self, method, path, body=b""):
+        """
+           Answer a request, returns (endpoint, status, JSON body). Ex of endpoint: "GET /users/id"
+
+           :param str method: GET or POST
+           :param str path: The path relative to the DOOR root. Ex: "/users/id/1"
+           :param bytes body: The request body
+        """
+        for route_method, pattern, handler in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                endpoint = "{} {}".format(method, pattern.split("/(")[0])
+                return (endpoint,) + getattr(self, handler)(*match.groups(), body=body)
+        return "unknown", 404, {"message": "Unknown endpoint {}".format(path)}
+
+    @staticmethod
+    def found(key, data, entity_id=None, message="Not found"):
+        if data is None:
+            return 404, {"message": message}
+        return 200, {key: data if entity_id is None else {entity_id: data}}
+
+    def get_proposal(self, proposal_id, **kwargs):
+        return self.found("proposals", self.dataset.proposals.get(proposal_id), proposal_id)
+
+    def get_beamline_proposals(self, beamline, year=None, start=None, end=None, **kwargs):
+        numbers = {str(session["proposalId"]) for session in self.dataset.sessions.values()
+                   if session_in(session, beamline, *get_window(year, start, end))}
+        return 200, {"proposals": {number: proposal for number, proposal in self.dataset.proposals.items()
+                                   if number in numbers}}
+
+    def get_proposal_sessions(self, proposal_id, **kwargs):
+        return 200, {"experiment metadata": {key: session for key, session in self.dataset.sessions.items()
+                                             if str(session["proposalId"]) == proposal_id}}
+
+    def get_session(self, session_id, **kwargs):
+        return self.found("experiment metadata", self.dataset.sessions.get(session_id), session_id)
+
+    def get_beamline_sessions(self, beamline, year=None, start=None, end=None, **kwargs):
+        sessions = {key: session for key, session in self.dataset.sessions.items()
+                    if session_in(session, beamline, *get_window(year, start, end))}
+        if start is not None and not sessions:
+            # Like DOOR, a date window without sessions only has a message
+            return 200, {"message": "No experiments found"}
+        return 200, {"experiment metadata": sessions}
+
+    def get_user(self, user_id, **kwargs):
+        return self.found("user metadata", self.dataset.users.get(user_id), user_id)
+
+    def get_institute(self, institute_id, **kwargs):
+        return self.found("institute metadata", self.dataset.institutes.get(institute_id), institute_id)
+
+    def get_roles(self, user_id, **kwargs):
+        if user_id not in self.dataset.users:
+            return 404, {"message": "Unknown user"}
+        roles = self.dataset.get_roles(user_id)
+        return 200, {"roles": roles} if roles else {"message": "No roles assigned"}
+
+    def door_login(self, body=b"", **kwargs):
+        form = {name: values[0] for name, values in parse_qs(body.decode()).items()}
+        user_ids = [user_id for user_id, user in self.dataset.users.items() if user["login"] == form.get("user")]
+        if not user_ids:
+            return 404, {"message": "Username does not exist"}
+        if form.get("pass") != base64.b64encode(USER_PASSWORD.encode()).decode():
+            return 401, {"message": "Wrong password"}
+        return 200, {"userdata": {"userid": int(user_ids[0])}}
+
+
+# Settings of the offline tests, no request leaves the process
+TEST_ENVIRONMENT = dict({"DOOR_REST_ROOT": "http://door.test/api/v1.0", "PYISPYB_API_ROOT": "http://pyispyb.test"},
+                        **{name: "test" for name in ("DOOR_REST_TOKEN", "DOOR_SERVICE_ACCOUNT", "DOOR_SERVICE_PASSWORD",
+                                                     "PYISPYB_AUTH_PLUGIN", "PYISPYB_SERVICE_ACCOUNT",
+                                                     "PYISPYB_SERVICE_PASSWORD")})
+
+
+def set_test_environment(test_case, environment=None):
+    """
+       Set the DOOR and py-ispyb settings of a test, the environment is restored once the test is over
+
+       :param TestCase test_case: The running test
+       :param dict environment: The environment variables to set, TEST_ENVIRONMENT by default
+    """
+    # Read before patching, so the values of a real .env file are not dropped with the patch
+    load_dotenv_once()
+    patcher = patch.dict(os.environ, environment or TEST_ENVIRONMENT)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+def door_response(url):
+    """
+       Build the DOOR response of a GET of the test dataset, url relative to the REST root. Ex: "/users/id/1"
+    """
+    _, status, body = FakeDoor(TEST_DATASET).route("GET", url.split("?")[0])
+    r = Response()
+    r.url = url
+    r.status_code = status
+    r._content = json.dumps(body).encode()
+    r._content_consumed = True
+    r.headers["Content-Type"] = "application/json"
+    return r
+
+
+class FakeDoorMixin(object):
+    """
+    Serve the DOOR calls of a client from the test dataset and count them.
+    """
+    door_calls = None
+
+    def get_door_request(self, url, stream=False):
+        if self.door_calls is None:
+            self.door_calls = []
+        self.door_calls.append(url)
+        r = door_response(url)
+        if r.status_code == 404:
+            raise HTTPError("404 Client Error", response=r)
+        return r
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from tests.fakedoor import FakeDoor, MockDataset, make_token
+
+
+def start_mock_door(test_case, dataset="small", **kwargs):
+    """
+       Start a mock DOOR server and point the clients at it, both until the end of the test.
+       Returns the MockDoorServer.
+
+       :param TestCase test_case: The test using the server
+       :param dataset: MockDataset, or the name of one
+       :param kwargs: Other arguments of MockDoorServer. Ex: latency
+    """
+    if isinstance(dataset, str):
+        dataset = MockDataset.from_name(dataset)
+    server = MockDoorServer(dataset, **kwargs).start()
+    test_case.addCleanup(server.stop)
+    patcher = patch.dict(os.environ, server.get_environment())
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return server
+
+
+class MockDoorServer(object):
+    """
+    Local stand-in HTTP server for the DOOR REST API (answered by FakeDoor, like the in-process fake of the tests)
+    and the py-ispyb login and sync endpoints.
+    Every request waits for the configured latency, and the requests are counted by endpoint.
+
+       :param MockDataset dataset: The DOOR data served
+       :param float latency: Seconds every request waits before being answered
+       :param str host: Address to listen on
+       :param int port: Port to listen on, 0 for any free port
+       :param str door_root: Path of the DOOR API (the DOOR_REST_ROOT path)
+    """
+
+    def __init__(self, dataset=None, latency=0.0, host="127.0.0.1", port=0, door_root="/api/v1.0"):
+        self.dataset = dataset or MockDataset()
+        self.latency = latency
+        self.door_root = door_root
+        self.__door = FakeDoor(self.dataset)
+        self.__routes = [
+            ("POST", r"/ispyb/api/v1/auth/login", self.pyispyb_login),
+            ("POST", r"/ispyb/api/v1/userportalsync/sync_proposal", self.pyispyb_sync_proposal),
+        ]
+        self.__lock = threading.Lock()
+        self.__requests = Counter()
+        self.__bytes_sent = 0
+        self.__tokens = set()
+        self.__server = ThreadingHTTPServer((host, port), MockRequestHandler)
+        self.__server.daemon_threads = True
+        self.__server.mock = self
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def door_url(self):
+        return self.url + self.door_root
+
+    def get_environment(self):
+        """
+           Environment variables pointing the DOOR and py-ispyb clients at this server. They win over the .env file.
+        """
+        environment = {"DOOR_REST_ROOT": self.door_url, "PYISPYB_API_ROOT": self.url}
+        for name in ("DOOR_REST_TOKEN", "DOOR_SERVICE_ACCOUNT", "DOOR_SERVICE_PASSWORD", "PYISPYB_AUTH_PLUGIN",
+                     "PYISPYB_SERVICE_ACCOUNT", "PYISPYB_SERVICE_PASSWORD"):
+            environment[name] = "benchmark"
+        return environment
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="MockDoorServer", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__requests.clear()
+            self.__bytes_sent = 0
+
+    def get_stats(self):
+        """
+           Number of requests by endpoint (Ex: "GET /users/id"), in total, and bytes sent
+        """
+        with self.__lock:
+            return {"requests": sum(self.__requests.values()), "by_endpoint": dict(self.__requests),
+                    "bytes_sent": self.__bytes_sent}
+
+    def handle(self, method, path, headers, body):
+        """
+           Answer a request, returns (status, JSON body)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if path.startswith(self.door_root + "/"):
+            endpoint, status, data = self.__door.route(method, path[len(self.door_root):], body)
+            self.__count(endpoint)
+            return status, data
+        for route_method, pattern, handler in self.__routes:
+            if route_method == method and re.fullmatch(pattern, path):
+                self.__count("{} {}".format(method, pattern))
+                return handler(headers=headers, body=body)
+        self.__count("unknown")
+        return 404, {"message": "Unknown endpoint {}".format(path)}
+
+    def __count(self, endpoint):
+        with self.__lock:
+            self.__requests[endpoint] += 1
+
+    def add_bytes_sent(self, size):
+        with self.__lock:
+            self.__bytes_sent += size
+
+    def pyispyb_login(self, **kwargs):
+        token = make_token()
+        with self.__lock:
+            self.__tokens.add(token)
+        return 201, {"token": token}
+
+    def pyispyb_sync_proposal(self, headers=None, body=b"", **kwargs):
+        with self.__lock:
+            authorized = (headers.get("Authorization") or "")[len("Bearer "):] in self.__tokens
+        if not authorized:
+            return 401, {"message": "Unauthorized"}
+        proposal = json.loads(body)
+        return 200, {"message": "Proposal {} synchronized".format(proposal["proposal"]["proposalNumber"])}
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the pooled connections of the clients are reused like with the real servers
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written apart, do not let them wait for the ACK of each other
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.answer("GET")
+
+    def do_POST(self):
+        self.answer("POST")
+
+    def answer(self, method):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, data = self.server.mock.handle(method, self.path.split("?")[0], self.headers, body)
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.mock.add_bytes_sent(len(content))
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,45 @@
+import os
+import asyncio
+from unittest import TestCase, skipIf
+from pydesydoor.asyncdoorapi import httpx
+from pydesydoor.asyncdoorpyispyb import AsyncDoorPyISPyB
+from pydesydoor.doorcache import DoorCache
+from tests.fakedoor import door_response, set_test_environment
+from tests.test_doorpyispyb import FakeDoorPyISPyB
+
+
+def mock_door_transport(calls):
+    def handler(request):
+        url = str(request.url)[len(os.environ["DOOR_REST_ROOT"]):]
+        calls.append(url)
+        r = door_response(url)
+        return httpx.Response(r.status_code, content=r.content, headers={"Content-Type": "application/json"})
+    return httpx.MockTransport(handler)
+
+
+@skipIf(httpx is None, "httpx is not installed")
+class TestAsyncDoorPyISPyB(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.proposal_id = "20210009"
+        self.calls = []
+
+    async def get_full_proposal(self, **kwargs):
+        async with AsyncDoorPyISPyB(transport=mock_door_transport(self.calls), **kwargs) as client:
+            return await client.get_full_proposal_to_pyispyb(self.proposal_id)
+
+    def test_same_output_as_sync_client(self):
+        with FakeDoorPyISPyB() as client:
+            expected = client.get_full_proposal_to_pyispyb(self.proposal_id)
+        self.assertEqual(asyncio.run(self.get_full_proposal()), expected)
+
+    def test_get_user_not_found(self):
+        async def get_user():
+            async with AsyncDoorPyISPyB(transport=mock_door_transport(self.calls), cache=DoorCache()) as client:
+                for _ in range(2):
+                    with self.assertRaises(httpx.HTTPStatusError):
+                        await client.get_user(999)
+        asyncio.run(get_user())
+        # The 404 is cached
+        self.assertEqual(self.calls, ["/users/id/999"])
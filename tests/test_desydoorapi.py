@@ -1,5 +1,7 @@
 from unittest import TestCase
+from unittest.mock import Mock, patch
 from pydesydoor.desydoorapi import DesyDoorAPI
+from tests.fakedoor import door_response, set_test_environment
 
 
 class TestDesyDoorAPI(TestCase):
@@ -47,3 +49,51 @@ class TestDesyDoorAPI(TestCase):
     # Pending to test properly
     def test_get_beamline_sessions_by_date_range(self):
         self.get_beamline_sessions_by_date_range(self.beamline, self.start_date, self.end_date)
+
+
+class TestHTTPSession(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_pool_sizes(self):
+        session = DesyDoorAPI.create_http_session(pool_connections=2, pool_maxsize=7, pool_block=True)
+        adapter = session.get_adapter("https://door.test")
+        self.assertIs(session.get_adapter("http://door.test"), adapter)
+        self.assertEqual((adapter._pool_connections, adapter._pool_maxsize, adapter._pool_block), (2, 7, True))
+        self.assertFalse(session.verify)
+        # A pool is never smaller than the parallel lookups
+        with DesyDoorAPI(pool_maxsize=2, max_workers=6) as client:
+            self.assertEqual(client.get_http_session().get_adapter("https://door.test")._pool_maxsize, 6)
+
+    def test_one_session_per_client(self):
+        session = Mock()
+        session.get.side_effect = lambda url, **kwargs: door_response(url.split("/api/v1.0")[1])
+        with patch.object(DesyDoorAPI, "create_http_session", return_value=session) as create_http_session:
+            with DesyDoorAPI() as client:
+                client.get_user(1)
+                client.get_user(2)
+                client.get_institute(10)
+        create_http_session.assert_called_once()
+        self.assertEqual(session.get.call_count, 3)
+
+    def test_close(self):
+        client = DesyDoorAPI()
+        session = client.get_http_session()
+        with patch.object(session, "close") as close:
+            client.close()
+        close.assert_called_once()
+        # A new session is created by the next request
+        self.assertIsNot(client.get_http_session(), session)
+        client.close()
+
+    def test_context_manager(self):
+        shared = Mock()
+        with patch.object(DesyDoorAPI, "create_http_session", return_value=Mock()) as create_http_session:
+            with DesyDoorAPI() as client:
+                client.get_http_session()
+            with DesyDoorAPI(http_session=shared) as client:
+                client.get_http_session()
+        create_http_session.return_value.close.assert_called_once()
+        # A shared session belongs to the caller
+        shared.close.assert_not_called()
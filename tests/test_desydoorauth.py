@@ -1,7 +1,12 @@
 import os
+import time
 from unittest import TestCase
+from unittest.mock import Mock
+from tests.fakedoor import USER_PASSWORD, set_test_environment
 from pydesydoor.desydoorauth import DesyDoorAuth
+from pydesydoor.doorcache import DoorCache
 from dotenv import load_dotenv
+from tests.mockdoor import start_mock_door
 
 
 class TestDesyDoorAuth(TestCase):
@@ -15,3 +20,56 @@ class TestDesyDoorAuth(TestCase):
     def test_login(self):
         auth = self.client.login(self.test_username, self.test_password)
         self.assertTrue(auth[0], True)
+
+
+class TestDesyDoorAuthRequests(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_streamed_get(self):
+        session = Mock()
+        with DesyDoorAuth(http_session=session) as client:
+            client.get_door_request("http://door.test/api/v1.0/users/id/1", stream=True)
+            client.get_door_request("http://door.test/api/v1.0/users/id/2")
+        self.assertEqual([call.kwargs["stream"] for call in session.get.call_args_list], [True, False])
+
+
+class TestAuthenticateAndAuthorize(TestCase):
+
+    def setUp(self) -> None:
+        self.server = start_mock_door(self)
+
+    def get_requests(self):
+        by_endpoint = self.server.get_stats()["by_endpoint"]
+        return by_endpoint.get("POST /doorauth/auth", 0), by_endpoint.get("GET /roles/userid", 0)
+
+    def test_cached_roles(self):
+        with DesyDoorAuth() as client:
+            self.assertEqual(client.authenticate_and_authorize("user3", USER_PASSWORD), (True, 3, ["user"]))
+            self.assertEqual(client.authenticate_and_authorize("user3", USER_PASSWORD), (True, 3, ["user"]))
+            # The password is checked again, even when the roles are cached
+            self.assertFalse(client.authenticate_and_authorize("user3", "wrong"))
+            self.assertFalse(client.authenticate_and_authorize("nobody", USER_PASSWORD))
+            self.assertEqual(self.get_requests(), (4, 1))
+            client.invalidate_user_roles(3)
+            self.assertEqual(client.authenticate_and_authorize("user3", USER_PASSWORD), (True, 3, ["user"]))
+        self.assertEqual(self.get_requests(), (5, 2))
+
+    def test_no_roles(self):
+        with DesyDoorAuth(role_cache=DoorCache(ttl=60, negative_ttl=0.05)) as client:
+            self.assertEqual(client.authenticate_and_authorize("user5", USER_PASSWORD), (True, 5, False))
+            self.assertEqual(client.authenticate_and_authorize("user5", USER_PASSWORD), (True, 5, False))
+            self.assertEqual(self.get_requests(), (2, 1))
+            time.sleep(0.1)
+            # Fetched again once "no roles" expired, at the same time as the password check of the known user
+            self.assertEqual(client.authenticate_and_authorize("user5", USER_PASSWORD), (True, 5, False))
+        self.assertEqual(self.get_requests(), (3, 2))
+
+    def test_without_role_cache(self):
+        with DesyDoorAuth(role_cache=False) as client:
+            for _ in range(2):
+                self.assertEqual(client.authenticate_and_authorize("user3", USER_PASSWORD), (True, 3, ["user"]))
+            self.assertFalse(client.authenticate_and_authorize("user3", "wrong"))
+            self.assertIsNone(client.get_known_user_id("user3"))
+        self.assertEqual(self.get_requests(), (3, 2))
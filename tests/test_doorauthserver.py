@@ -0,0 +1,163 @@
+import os
+import json
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+from http.client import HTTPConnection
+from tests.fakedoor import USER_PASSWORD
+from pydesydoor import authdoor
+from pydesydoor.desydoorauth import DesyDoorAuth
+from pydesydoor.doorauthserver import DoorAuthServer, LatencyMetrics, UnixHTTPConnection, MAX_BODY_SIZE
+from tests.mockdoor import start_mock_door
+
+
+def request(connection, method, path, data=None, content_type="application/json", token=None):
+    body = None if data is None else json.dumps(data) if content_type == "application/json" else data
+    headers = {"Content-Type": content_type}
+    if token is not None:
+        headers["X-Auth-Token"] = token
+    connection.request(method, path, body, headers)
+    r = connection.getresponse()
+    return r.status, json.loads(r.read())
+
+
+class TestDoorAuthServer(TestCase):
+
+    def setUp(self) -> None:
+        self.door = start_mock_door(self)
+
+    def test_login_and_roles(self):
+        with DesyDoorAuth() as client, DoorAuthServer(client, token="secret") as server:
+            connection = HTTPConnection(*server.url[len("http://"):].split(":"))
+            self.assertEqual(request(connection, "POST", "/auth", {"username": "user3", "password": USER_PASSWORD}),
+                             (200, {"userid": 3, "roles": ["user"]}))
+            # Form encoded, over the same keep-alive connection
+            self.assertEqual(request(connection, "POST", "/auth", "username=user3&password=wrong",
+                                     "application/x-www-form-urlencoded")[0], 401)
+            self.assertEqual(request(connection, "POST", "/auth", {"username": "user3"})[0], 400)
+            self.assertEqual(request(connection, "GET", "/roles/5", token="secret"), (200, {"userid": "5", "roles": []}))
+            self.assertEqual(request(connection, "GET", "/roles/999", token="secret")[0], 404)
+            self.assertEqual(request(connection, "GET", "/roles/3")[0], 403)
+            self.assertEqual(request(connection, "GET", "/roles/3", token="wrong")[0], 403)
+            # No other DOOR url can be reached with the service account
+            self.assertEqual(request(connection, "GET", "/roles/../proposals/propid/1", token="secret")[0], 400)
+            self.assertEqual(request(connection, "GET", "/roles/3%2F..", token="secret")[0], 400)
+            self.assertEqual(request(connection, "GET", "/users/3")[0], 404)
+            status, metrics = request(connection, "GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics["endpoints"]["POST /auth"]["count"], 3)
+        self.assertEqual(metrics["endpoints"]["GET /roles"]["count"], 6)
+        self.assertIn("p99", metrics["endpoints"]["POST /auth"])
+        self.assertEqual(metrics["role_cache"]["size"], 3)
+        self.assertEqual(self.door.get_stats()["by_endpoint"]["GET /roles/userid"], 3)
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "authdoor.sock")
+            server = authdoor.create_server(authdoor.create_arg_parser().parse_args(["-u", path])).start()
+            try:
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o660)
+                connection = UnixHTTPConnection(path)
+                self.assertEqual(request(connection, "POST", "/auth", {"username": "user5", "password": USER_PASSWORD}),
+                                 (200, {"userid": 5, "roles": []}))
+                self.assertEqual(request(connection, "GET", "/health"), (200, {"status": "ok"}))
+                # The socket permissions restrict the callers, no token is needed
+                self.assertEqual(request(connection, "GET", "/roles/3"), (200, {"userid": "3", "roles": ["user"]}))
+            finally:
+                server.stop()
+                server.client.close()
+            self.assertFalse(os.path.exists(path))
+
+    def send_content_length(self, url, content_length):
+        connection = HTTPConnection(*url[len("http://"):].split(":"))
+        connection.putrequest("POST", "/auth")
+        connection.putheader("Content-Type", "application/json")
+        connection.putheader("Content-Length", content_length)
+        connection.endheaders()
+        r = connection.getresponse()
+        return r.status, json.loads(r.read()), r.getheader("Connection")
+
+    def test_invalid_content_length(self):
+        with DesyDoorAuth() as client, DoorAuthServer(client) as server:
+            for content_length in ("-1", "abc", "1e3", "\u00b2"):
+                self.assertEqual(self.send_content_length(server.url, content_length),
+                                 (400, {"message": "Invalid Content-Length"}, "close"))
+            metrics = server.get_metrics()
+        self.assertEqual(metrics["endpoints"], {})
+        self.assertEqual(self.door.get_stats()["requests"], 0)
+
+    def test_body_too_large(self):
+        with DesyDoorAuth() as client, DoorAuthServer(client) as server:
+            # Answered without waiting for a body that never comes
+            status, data, connection = self.send_content_length(server.url, str(10 ** 9))
+            self.assertEqual((status, connection), (413, "close"))
+            connection = HTTPConnection(*server.url[len("http://"):].split(":"))
+            body = json.dumps({"username": "user3", "password": "x" * MAX_BODY_SIZE})
+            connection.request("POST", "/auth", body, {"Content-Type": "application/json"})
+            self.assertEqual(connection.getresponse().status, 413)
+        self.assertEqual(self.door.get_stats()["requests"], 0)
+
+    def test_unexpected_error(self):
+        with DesyDoorAuth() as client, DoorAuthServer(client) as server:
+            connection = HTTPConnection(*server.url[len("http://"):].split(":"))
+            with patch.object(client, "authenticate_and_authorize", side_effect=ValueError("Unexpected DOOR answer")):
+                with self.assertLogs("pydesydoor.doorauthserver", "ERROR"):
+                    self.assertEqual(request(connection, "POST", "/auth", {"username": "user3", "password": "x"}),
+                                     (500, {"message": "Internal error"}))
+            # The same connection is still served
+            self.assertEqual(request(connection, "POST", "/auth", {"username": "user3", "password": USER_PASSWORD})[0], 200)
+            metrics = server.get_metrics()
+        self.assertEqual(metrics["endpoints"]["POST /auth"]["errors"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+
+    def test_roles_need_a_token_on_tcp(self):
+        with tempfile.TemporaryDirectory() as directory:
+            token_file = os.path.join(directory, "token")
+            with open(token_file, "w") as f:
+                f.write("secret\n")
+            server = authdoor.create_server(authdoor.create_arg_parser().parse_args(["-p", "0", "--token-file", token_file]))
+        with server.client, server:
+            connection = HTTPConnection(*server.url[len("http://"):].split(":"))
+            self.assertEqual(request(connection, "GET", "/roles/3", token="secret")[0], 200)
+        with DesyDoorAuth() as client, DoorAuthServer(client) as server:
+            connection = HTTPConnection(*server.url[len("http://"):].split(":"))
+            self.assertEqual(request(connection, "GET", "/roles/3")[0], 403)
+        self.assertEqual(self.door.get_stats()["by_endpoint"]["GET /roles/userid"], 1)
+
+    def test_unix_socket_keeps_other_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "authdoor.sock")
+            with open(path, "w") as f:
+                f.write("not a socket")
+            with DesyDoorAuth() as client:
+                with self.assertRaises(OSError):
+                    DoorAuthServer(client, unix_socket=path)
+            with open(path) as f:
+                self.assertEqual(f.read(), "not a socket")
+
+    def test_concurrency_limit(self):
+        self.door.latency = 0.3
+        results = []
+        with DesyDoorAuth() as client, DoorAuthServer(client, max_concurrency=1, queue_timeout=0.05) as server:
+            host, port = server.url[len("http://"):].split(":")
+
+            def login():
+                results.append(request(HTTPConnection(host, port), "POST", "/auth",
+                                       {"username": "user3", "password": USER_PASSWORD})[0])
+            threads = [threading.Thread(target=login) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            metrics = server.get_metrics()
+        self.assertEqual(sorted(results), [200, 503])
+        self.assertEqual((metrics["rejected"], metrics["in_flight"]), (1, 0))
+
+    def test_latency_percentiles(self):
+        metrics = LatencyMetrics(window=100)
+        for latency in range(1, 201):
+            metrics.add("POST /auth", latency / 1000.0, error=latency > 198)
+        # Only the last 100 latencies count for the percentiles
+        self.assertEqual(metrics.get_stats(), {"POST /auth": {"count": 200, "errors": 2, "p50": 151.0, "p95": 196.0,
+                                                              "p99": 200.0, "max": 200.0}})
@@ -0,0 +1,52 @@
+import time
+from unittest import TestCase
+from requests import HTTPError, Response
+from pydesydoor.doorcache import DoorCache
+
+
+class TestDoorCache(TestCase):
+
+    def setUp(self) -> None:
+        self.cache = DoorCache(max_size=2, ttl=60, negative_ttl=60)
+        self.calls = 0
+
+    def fetch_user(self):
+        self.calls += 1
+        return {"login": "user"}
+
+    def fetch_not_found(self):
+        self.calls += 1
+        response = Response()
+        response.status_code = 404
+        raise HTTPError("404 Client Error", response=response)
+
+    def test_get_or_fetch_hit(self):
+        self.cache.get_or_fetch("user", 1, self.fetch_user)
+        user = self.cache.get_or_fetch("user", "1", self.fetch_user)
+        self.assertEqual(user["login"], "user")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.get_or_fetch("user", 1, self.fetch_user)
+        self.cache.get_or_fetch("user", 2, self.fetch_user)
+        # Touch user 1 so user 2 becomes the least recently used entry
+        self.cache.get_or_fetch("user", 1, self.fetch_user)
+        self.cache.get_or_fetch("institute", 1, self.fetch_user)
+        self.assertEqual(len(self.cache), 2)
+        self.assertFalse(self.cache.get("user", 2)[0])
+        self.assertTrue(self.cache.get("user", 1)[0])
+
+    def test_ttl_expiration(self):
+        cache = DoorCache(ttl=0.01)
+        cache.get_or_fetch("user", 1, self.fetch_user)
+        time.sleep(0.02)
+        cache.get_or_fetch("user", 1, self.fetch_user)
+        self.assertEqual(self.calls, 2)
+
+    def test_negative_caching(self):
+        for _ in range(2):
+            with self.assertRaises(HTTPError):
+                self.cache.get_or_fetch("user", 1, self.fetch_not_found)
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,167 @@
+import time
+import asyncio
+import threading
+from unittest import TestCase, skipIf
+from unittest.mock import Mock
+from concurrent.futures import ThreadPoolExecutor
+from requests import HTTPError
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.asyncdoorapi import AsyncDesyDoorAPI, httpx
+from pydesydoor.doorflight import SingleFlight, AsyncSingleFlight
+from pydesydoor.doorretry import DeadlineExceeded, deadline
+from tests.fakedoor import door_response, set_test_environment
+from tests.test_asyncdoorpyispyb import mock_door_transport
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def call_concurrently(self, func, times=8):
+        barrier = threading.Barrier(times)
+
+        def call(_):
+            barrier.wait()
+            return func()
+        with ThreadPoolExecutor(max_workers=times) as executor:
+            return list(executor.map(call, range(times)))
+
+    def test_concurrent_calls_are_coalesced(self):
+        single_flight = SingleFlight()
+        func = Mock(side_effect=lambda: time.sleep(0.2) or "result")
+        results = self.call_concurrently(lambda: single_flight.do("key", func))
+        func.assert_called_once()
+        self.assertEqual([result for result, _ in results], ["result"] * 8)
+        self.assertEqual(sum(shared for _, shared in results), 7)
+        self.assertEqual(single_flight.get_stats(), {"calls": 8, "coalesced": 7})
+        # Nothing is kept once the call is done
+        single_flight.do("key", func)
+        self.assertEqual(func.call_count, 2)
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        def call():
+            try:
+                single_flight.do("key", fail)
+            except ValueError as e:
+                return str(e)
+        self.assertEqual(self.call_concurrently(call, 4), ["failed"] * 4)
+
+    def test_followers_wait_until_their_deadline(self):
+        single_flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+
+        def hang():
+            started.set()
+            release.wait(5)
+            return "result"
+        leader = threading.Thread(target=single_flight.do, args=("key", hang))
+        leader.start()
+        started.wait()
+        start_time = time.perf_counter()
+        with deadline(0.1):
+            with self.assertRaises(DeadlineExceeded):
+                single_flight.do("key", hang)
+        self.assertLess(time.perf_counter() - start_time, 1)
+        release.set()
+        leader.join()
+
+    def test_base_exceptions_are_shared(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def interrupted():
+            started.set()
+            time.sleep(0.2)
+            raise KeyboardInterrupt()
+
+        def lead():
+            try:
+                single_flight.do("key", interrupted)
+            except KeyboardInterrupt as e:
+                errors.append(e)
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        with self.assertRaises(KeyboardInterrupt):
+            single_flight.do("key", interrupted)
+        leader.join()
+        self.assertEqual(len(errors), 1)
+
+    def test_client_coalesces_identical_gets(self):
+        session = Mock()
+        session.get.side_effect = lambda url, **kwargs: time.sleep(0.2) or door_response(url.split("/api/v1.0")[-1])
+        with DesyDoorAPI(http_session=session) as client:
+            users = self.call_concurrently(lambda: client.get_user(1))
+            self.assertEqual(client.get_single_flight().coalesced, 7)
+        self.assertEqual(users, [users[0]] * 8)
+        session.get.assert_called_once()
+
+    def test_client_coalesced_errors(self):
+        session = Mock()
+        session.get.side_effect = lambda url, **kwargs: time.sleep(0.2) or door_response(url.split("/api/v1.0")[-1])
+        with DesyDoorAPI(http_session=session) as client:
+            def get_user():
+                with self.assertRaises(HTTPError):
+                    client.get_user(99)
+            self.call_concurrently(get_user, 4)
+        session.get.assert_called_once()
+
+    def test_async_concurrent_calls_are_coalesced(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(True)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*[single_flight.do("key", func) for _ in range(5)])
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("result", False)] + [("result", True)] * 4)
+
+    def test_async_followers_wait_until_their_deadline(self):
+        single_flight = AsyncSingleFlight()
+
+        async def hang():
+            await asyncio.sleep(1)
+            return "result"
+
+        async def follow():
+            await asyncio.sleep(0)
+            with deadline(0.05):
+                return await single_flight.do("key", hang)
+
+        async def run():
+            return await asyncio.gather(single_flight.do("key", hang), follow(), return_exceptions=True)
+        results = asyncio.run(run())
+        self.assertEqual(results[0], ("result", False))
+        self.assertIsInstance(results[1], DeadlineExceeded)
+
+    @skipIf(httpx is None, "httpx is not installed")
+    def test_async_client_coalesces_identical_gets(self):
+        calls = []
+        door_transport = mock_door_transport(calls)
+
+        async def handler(request):
+            # Slow enough for the requests to overlap
+            await asyncio.sleep(0.05)
+            return door_transport.handler(request)
+
+        async def run():
+            async with AsyncDesyDoorAPI(transport=httpx.MockTransport(handler)) as client:
+                users = await asyncio.gather(*[client.get_user(1) for _ in range(5)])
+                return users, client.get_single_flight().get_stats()
+        users, stats = asyncio.run(run())
+        self.assertEqual(calls, ["/users/id/1"])
+        self.assertEqual(stats, {"calls": 5, "coalesced": 4})
+        self.assertEqual(users, [users[0]] * 5)
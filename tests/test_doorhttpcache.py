@@ -0,0 +1,60 @@
+import os
+import stat
+import tempfile
+from unittest import TestCase
+from requests import Response
+from pydesydoor.doorhttpcache import DoorResponseCache
+
+
+class TestDoorResponseCache(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DoorResponseCache(os.path.join(self.directory.name, "door.sqlite"), {"users": 3600})
+        self.sent_headers = []
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.directory.cleanup()
+
+    def request(self, status_code):
+        def send(headers):
+            self.sent_headers.append(headers)
+            r = Response()
+            r.status_code = status_code
+            r._content = b'{"user metadata": {"1": {"login": "user"}}}'
+            r.headers["ETag"] = '"abc"'
+            return r
+        return send
+
+    def test_private_file(self):
+        # The users' emails and phone numbers are only readable by the owner, whatever the umask
+        self.cache.get_response("/users/id/1", self.request(200))
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache.path).st_mode), 0o600)
+
+    def test_fresh_response_from_disk(self):
+        self.cache.get_response("/users/id/1", self.request(200))
+        r = self.cache.get_response("/users/id/1", self.request(200))
+        self.assertEqual(r.json()["user metadata"]["1"]["login"], "user")
+        self.assertEqual(len(self.sent_headers), 1)
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+
+    def test_conditional_revalidation(self):
+        self.cache.max_ages["users"] = 0
+        self.cache.get_response("/users/id/1", self.request(200))
+        r = self.cache.get_response("/users/id/1", self.request(304))
+        self.assertEqual(self.sent_headers[1]["If-None-Match"], '"abc"')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["user metadata"]["1"]["login"], "user")
+        self.assertEqual(self.cache.get_stats()["revalidated"], 1)
+
+    def test_uncached_family(self):
+        self.cache.get_response("/roles/userid/1", self.request(200))
+        self.cache.get_response("/roles/userid/1", self.request(200))
+        self.assertEqual(len(self.sent_headers), 2)
+
+    def test_clear(self):
+        self.cache.get_response("/users/id/1", self.request(200))
+        self.cache.clear("users")
+        self.cache.get_response("/users/id/1", self.request(200))
+        self.assertEqual(len(self.sent_headers), 2)
@@ -0,0 +1,121 @@
+import os
+import time
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+from requests import exceptions
+from pydesydoor.doorlimit import TokenBucket, FileTokenBucket, AdaptiveConcurrencyLimit, ConcurrencyLimitTimeout, DoorRateLimiter
+from pydesydoor.doorretry import DeadlineExceeded, deadline
+from tests.fakedoor import door_response
+
+
+def make_response(status_code, headers=None):
+    r = door_response("/users/id/1")
+    r.status_code = status_code
+    r.headers.update(headers or {})
+    return r
+
+
+class TestDoorLimit(TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        start_time = time.perf_counter()
+        for _ in range(4):
+            bucket.acquire()
+        # The burst is free, the next two tokens take 1/50 s each
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.035)
+        self.assertGreater(bucket.take(), 0)
+
+    def test_token_bucket_deadline(self):
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.acquire()
+        with deadline(0.1):
+            with self.assertRaises(DeadlineExceeded):
+                bucket.acquire()
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.pause(2)
+        self.assertGreater(bucket.take(), 1.9)
+
+    def test_file_token_bucket_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bucket")
+            # Two processes would open the same file, like these two buckets
+            first, second = FileTokenBucket(path, rate=1, burst=2), FileTokenBucket(path, rate=1, burst=2)
+            self.assertEqual(first.take(), 0)
+            self.assertEqual(second.take(), 0)
+            self.assertGreater(first.take(), 0.9)
+            second.pause(5)
+            self.assertGreater(first.take(), 5)
+
+    def test_aimd(self):
+        limit = AdaptiveConcurrencyLimit(initial=4, min_limit=1, max_limit=5, cooldown=60)
+        for _ in range(8):
+            limit.acquire()
+            limit.release(latency=0.1)
+        self.assertEqual(limit.limit, 5)
+        limit.acquire()
+        limit.release(overloaded=True)
+        self.assertEqual(limit.limit, 2.5)
+        # A burst of errors within the cooldown cuts the limit once
+        limit.acquire()
+        limit.release(overloaded=True)
+        self.assertEqual(limit.limit, 2.5)
+
+    def test_aimd_latency(self):
+        limit = AdaptiveConcurrencyLimit(initial=4, latency_ratio=4, cooldown=0)
+        limit.acquire()
+        limit.release(latency=0.1)
+        limit.acquire()
+        limit.release(latency=1.0)
+        self.assertLess(limit.limit, 4)
+
+    def test_aimd_latency_by_family(self):
+        limit = AdaptiveConcurrencyLimit(initial=4, latency_ratio=4, cooldown=0)
+        limit.acquire()
+        limit.release(latency=0.02, family="users")
+        # Slower than the user lookups, but not than the other session listings
+        for _ in range(4):
+            limit.acquire()
+            limit.release(latency=1.0, family="sessions")
+        self.assertGreater(limit.limit, 4)
+        limit.acquire()
+        limit.release(latency=1.0, family="users")
+        self.assertLess(limit.limit, 4)
+
+    def test_aimd_acquire_timeout(self):
+        limit = AdaptiveConcurrencyLimit(initial=1, max_limit=1, timeout=0.1)
+        limit.acquire()
+        with self.assertRaises(ConcurrencyLimitTimeout):
+            limit.acquire()
+        limit.timeout = 60
+        with deadline(0.1):
+            with self.assertRaises(DeadlineExceeded):
+                limit.acquire()
+        self.assertEqual(limit.in_flight, 1)
+
+    def test_rate_limiter_throttled(self):
+        bucket = TokenBucket(rate=10, burst=10)
+        limiter = DoorRateLimiter(bucket, AdaptiveConcurrencyLimit(initial=4, cooldown=0))
+        r = limiter.call(Mock(return_value=make_response(429, {"Retry-After": "3"})))
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(limiter.throttled, 1)
+        self.assertEqual(limiter.concurrency.limit, 2)
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+        self.assertGreater(bucket.take(), 2.9)
+        # A Retry-After longer than max_pause pauses for max_pause
+        limiter.max_pause = 5
+        limiter.call(Mock(return_value=make_response(503, {"Retry-After": "3600"})))
+        self.assertLess(bucket.take(), 6)
+
+    def test_rate_limiter_errors(self):
+        limiter = DoorRateLimiter(concurrency=AdaptiveConcurrencyLimit(initial=4, cooldown=0))
+        with self.assertRaises(exceptions.ConnectionError):
+            limiter.call(Mock(side_effect=exceptions.ConnectionError()))
+        self.assertEqual(limiter.concurrency.limit, 4)
+        with self.assertRaises(exceptions.ReadTimeout):
+            limiter.call(Mock(side_effect=exceptions.ReadTimeout()))
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+        self.assertLess(limiter.concurrency.limit, 4)
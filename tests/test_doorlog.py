@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import logging
+import tempfile
+import subprocess
+from unittest import TestCase
+from unittest.mock import Mock
+from requests import exceptions
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doorlog import configure_logging, log_request, request_logger
+from pydesydoor.doorretry import RetryPolicy
+from tests.fakedoor import door_response, set_test_environment
+
+
+class TestDoorLog(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, "door.log")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def read_log(self):
+        with open(self.log_file) as f:
+            return f.read().splitlines()
+
+    def test_no_logging_side_effect(self):
+        # In a new interpreter, as the test runner configures the logging of this one
+        output = subprocess.check_output([sys.executable, "-c", "import logging, pydesydoor.desydoorauth; "
+                                          "print(logging.getLogger().handlers)"], cwd=self.directory.name,
+                                         env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        self.assertEqual(output.strip(), b"[]")
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_json_request_records(self):
+        session = Mock()
+        session.get.side_effect = [exceptions.ConnectionError("refused"), door_response("/users/id/1")]
+        with configure_logging(self.log_file, json_format=True, requests=True) as logs:
+            self.assertIsNotNone(logs.listener)
+            with DesyDoorAPI(http_session=session, retry=RetryPolicy(backoff=0)) as client:
+                client.get_user(1)
+        records = [json.loads(line) for line in self.read_log()]
+        failed, retry, succeeded = records
+        self.assertEqual((failed["method"], failed["url"], failed["error"]), ("GET", "/users/id/1", "refused"))
+        self.assertEqual((retry["level"], retry["logger"]), ("WARNING", "pydesydoor.doorretry"))
+        self.assertEqual((succeeded["status"], succeeded["logger"]), (200, "pydesydoor.requests"))
+        self.assertGreaterEqual(succeeded["latency_ms"], 0)
+
+    def test_asynchronous_exception(self):
+        with configure_logging(self.log_file, json_format=True):
+            try:
+                raise ValueError("bad proposal")
+            except ValueError:
+                logging.getLogger("pydesydoor.doorispyb").exception("Failed %s", "20210009")
+        record, = [json.loads(line) for line in self.read_log()]
+        self.assertEqual(record["message"], "Failed 20210009")
+        self.assertIn("ValueError: bad proposal", record["exception"])
+
+    def test_levels_restored(self):
+        request_logger.setLevel(logging.ERROR)
+        self.addCleanup(request_logger.setLevel, logging.NOTSET)
+        with configure_logging(self.log_file, level=logging.INFO, requests=True):
+            self.assertTrue(request_logger.isEnabledFor(logging.INFO))
+        self.assertEqual(request_logger.level, logging.ERROR)
+        self.assertEqual(logging.getLogger("pydesydoor").level, logging.NOTSET)
+
+    def test_plain_synchronous_logging(self):
+        with configure_logging(self.log_file, asynchronous=False) as logs:
+            self.assertIsNone(logs.listener)
+            logging.getLogger("pydesydoor.desydoorauth").warning("Username does not exist: %s", "nobody")
+            logging.getLogger("pydesydoor.desydoorauth").info("Not logged")
+            self.assertFalse(request_logger.isEnabledFor(logging.INFO))
+        lines = self.read_log()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith("WARNING - pydesydoor.desydoorauth - Username does not exist: nobody"))
+        # The handler is removed when the logging is stopped
+        self.assertFalse(any(isinstance(handler, logging.FileHandler)
+                             for handler in logging.getLogger("pydesydoor").handlers))
+
+    def test_requests_not_logged_by_default(self):
+        send = Mock(return_value=door_response("/users/id/1"))
+        self.assertEqual(log_request("GET", "/users/id/1", send).status_code, 200)
+        send.assert_called_once()
@@ -0,0 +1,56 @@
+from datetime import datetime
+from unittest import TestCase
+from pydesydoor.doormodel import DoorProposal, DoorSession, DoorUser, parse_id, parse_ids
+from pydesydoor.desydoorapi import DesyDoorAPI
+from tests.fakedoor import PROPOSALS, SESSIONS, USERS, FakeDoorMixin, set_test_environment
+
+
+class FakeDesyDoorAPI(FakeDoorMixin, DesyDoorAPI):
+    pass
+
+
+class TestDoorModel(TestCase):
+
+    def test_parse_ids(self):
+        self.assertEqual(parse_id(" 12 "), 12)
+        self.assertIsNone(parse_id(""))
+        self.assertEqual(parse_id("C-1"), "C-1")
+        self.assertEqual(parse_ids("3, 1"), (3, 1))
+        self.assertEqual(parse_ids(5), (5,))
+        self.assertEqual(parse_ids(None), ())
+
+    def test_proposal(self):
+        proposal = DoorProposal.from_door("20210009", PROPOSALS["20210009"])
+        self.assertEqual(proposal.proposal_id, 20210009)
+        self.assertEqual((proposal.pi_id, proposal.leader_id, proposal.cowriter_ids), (1, 2, (3, 1)))
+        self.assertFalse(proposal.single_cowriter)
+        self.assertFalse(hasattr(proposal, "__dict__"))
+
+    def test_session(self):
+        session = DoorSession.from_door(SESSIONS["11000001"])
+        self.assertEqual(session.start_date, datetime(2022, 7, 1, 8))
+        self.assertEqual(session.participants, {"remote": (2, 3), "on-site": (1,), "data-only": ()})
+        # Interned, so every session of a beamline shares the name
+        self.assertIs(session.beamline_name, DoorSession.from_door(SESSIONS["11000002"]).beamline_name)
+
+    def test_user(self):
+        user = DoorUser.from_door("1", USERS["1"])
+        self.assertEqual((user.user_id, user.laboratory_id), (1, 11))
+
+
+class TestDoorModelClient(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.client = FakeDesyDoorAPI()
+
+    def test_session_models_match_sessions(self):
+        for start_date, end_date in ((None, None), ("2022-07-01", "2022-07-31")):
+            sessions = self.client.get_proposal_sessions("20210009", "P11", start_date, end_date)
+            models = self.client.get_session_models("20210009", "P11", start_date, end_date)
+            self.assertEqual([session["expSessionPk"] for session in sessions],
+                             [model.session_id for model in models])
+
+    def test_models_are_equal_to_their_door_entity(self):
+        self.assertEqual(self.client.get_user_model("2"), DoorUser.from_door(2, USERS["2"]))
+        self.assertEqual(self.client.get_proposal_model("20210009").title, "Test proposal")
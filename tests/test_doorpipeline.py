@@ -0,0 +1,64 @@
+import os
+import json
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import Mock
+from pydesydoor.doorpipeline import DoorPipeline, FileSink, PyISPyBSink, iter_bounded_map
+from tests.fakedoor import set_test_environment
+from tests.test_doorpyispyb import FakeDoorPyISPyB
+
+
+class TestDoorPipeline(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_bounded_buffering(self):
+        taken = []
+
+        def source():
+            for item in range(20):
+                taken.append(item)
+                yield item
+
+        results = iter_bounded_map(lambda item: item * 2, source(), max_workers=4, buffer_size=3)
+        self.assertEqual(next(results), 0)
+        # The source is only read a few items ahead of the consumer
+        self.assertLessEqual(len(taken), 4)
+        self.assertEqual(list(results), [item * 2 for item in range(1, 20)])
+
+    def test_ordered_parallel_transform(self):
+        started = threading.Barrier(2, timeout=5)
+
+        def transform(item):
+            if item < 2:
+                # Both first items run at the same time
+                started.wait()
+            return None if item == 3 else {"item": item}
+
+        pipeline = DoorPipeline(range(5), transform, max_workers=2)
+        self.assertEqual([json.loads(payload)["item"] for payload in pipeline], [0, 1, 2, 4])
+        self.assertEqual(pipeline.skipped, 1)
+
+    def test_sessions_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.jsonl")
+            with FakeDoorPyISPyB(max_workers=4) as client:
+                sessions = client.iter_beamline_sessions("P11", year=2022)
+                written = DoorPipeline(sessions, client.get_session_to_pyispyb, sink=FileSink(path), max_workers=2).run()
+                expected = client.get_sessions_to_pyispyb("20210009", "P11")
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(written, 2)
+        self.assertEqual(lines, expected)
+
+    def test_proposals_to_pyispyb(self):
+        pyispyb_client = Mock()
+        with FakeDoorPyISPyB() as client:
+            proposal_ids = (proposal_id for proposal_id, _ in client.iter_beamline_proposals("P11", 2022))
+            sink = PyISPyBSink(pyispyb_client)
+            self.assertEqual(DoorPipeline(proposal_ids, client.get_full_proposal_data, client.get_serializer(),
+                                          sink).run(), 1)
+            expected = client.get_full_proposal_to_pyispyb("20210009")
+        pyispyb_client.sync_proposal.assert_called_once_with(expected)
@@ -0,0 +1,150 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from pydesydoor.doorpyispyb import DoorPyISPyB
+from pydesydoor.doorispyb import DoorISPyB
+from pydesydoor.doorispybjava import DoorISPyBJava
+from tests.fakedoor import PROPOSALS, SESSIONS, FakeDoorMixin, door_response, set_test_environment
+
+
+class FakeDoorPyISPyB(FakeDoorMixin, DoorPyISPyB):
+    pass
+
+
+class FakeDoorISPyB(FakeDoorMixin, DoorISPyB):
+    pass
+
+
+class FakeDoorISPyBJava(FakeDoorMixin, DoorISPyBJava):
+    pass
+
+
+class TestDoorPyISPyB(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.proposal_id = "20210009"
+
+    def test_get_full_proposal_to_pyispyb(self):
+        with FakeDoorPyISPyB() as client:
+            proposal = json.loads(client.get_full_proposal_to_pyispyb(self.proposal_id))
+        self.assertEqual(len(proposal["proposal"]["persons"]), 4)
+        self.assertEqual(proposal["proposal"]["persons"][2]["type"], "cowriter")
+        # The P14 session is filtered out
+        self.assertEqual([s["expSessionPk"] for s in proposal["sessions"]], [11000001, 11000002])
+        self.assertEqual(proposal["sessions"][0]["beamlineOperator"], "Given4 Family4")
+        self.assertEqual([p["login"] for p in proposal["sessions"][0]["persons"]], ["user2", "user3", "user1"])
+        self.assertEqual(proposal["sessions"][0]["persons"][0]["session_options"]["remote"], 1)
+
+    def test_planned_lookups(self):
+        with FakeDoorPyISPyB(max_workers=8) as client:
+            client.get_full_proposal_to_pyispyb(self.proposal_id)
+        # Every user and institute is fetched once, even without an entity cache
+        self.assertEqual(sorted(client.door_calls[2:6]), ["/users/id/1", "/users/id/2", "/users/id/3", "/users/id/4"])
+        self.assertEqual(sorted(client.door_calls[6:]), ["/institutes/id/10", "/institutes/id/11"])
+
+    def test_explain(self):
+        with FakeDoorPyISPyB() as client:
+            explanation = client.explain_full_proposal(self.proposal_id)
+            self.assertEqual(len(client.door_calls), explanation["planning_calls"])
+            client.get_full_proposal_to_pyispyb(self.proposal_id)
+        self.assertEqual(explanation["user_calls"], 4)
+        self.assertLessEqual(len(client.door_calls) - 2, explanation["max_calls"])
+
+    def test_concurrent_output_is_identical(self):
+        with FakeDoorPyISPyB() as serial, FakeDoorPyISPyB(max_workers=8) as concurrent:
+            self.assertEqual(serial.get_full_proposal_to_pyispyb(self.proposal_id),
+                             concurrent.get_full_proposal_to_pyispyb(self.proposal_id))
+        with FakeDoorISPyB() as serial, FakeDoorISPyB(max_workers=8) as concurrent:
+            self.assertEqual(serial.get_full_proposal_to_ispyb(self.proposal_id),
+                             concurrent.get_full_proposal_to_ispyb(self.proposal_id))
+        with FakeDoorISPyBJava() as serial, FakeDoorISPyBJava(max_workers=8) as concurrent:
+            self.assertEqual(serial.get_labcontacts(self.proposal_id), concurrent.get_labcontacts(self.proposal_id))
+            self.assertEqual(serial.get_sessions(self.proposal_id), concurrent.get_sessions(self.proposal_id))
+
+    def test_ispyb_sessions_keep_door_fields(self):
+        with FakeDoorISPyB() as client:
+            without_participants = client.get_sessions_to_ispyb(self.proposal_id, with_participants=False)
+            with_participants = client.get_sessions_to_ispyb(self.proposal_id)
+            operator = client.get_user_to_ispyb(4, False)
+        # Every DOOR field is kept, only the dates and the users are converted
+        self.assertEqual(without_participants[0], dict(SESSIONS["11000001"], startDate="2022-07-01T08:00:00",
+                                                       endDate="2022-07-02T08:00:00", beamlineOperator=operator))
+        self.assertEqual(set(with_participants[1]), set(SESSIONS["11000002"]))
+        self.assertEqual([user["type"] for user in with_participants[1]["participants"]],
+                         ["on-site", "on-site", "data-only"])
+        self.assertEqual(SESSIONS["11000001"]["startDate"], "2022-07-01 08:00:00")
+
+    def test_exporters_keep_the_baseline_id_types(self):
+        # As the exporters always gave them: the ids split from "3, 1" are str, the others int
+        with FakeDoorISPyB() as client:
+            participants = client.get_proposal_to_ispyb(self.proposal_id)["participants"]
+            sessions = client.get_sessions_to_ispyb(self.proposal_id)
+        self.assertEqual([participant["siteId"] for participant in participants], [1, 2, "3", "1"])
+        self.assertEqual(sessions[0]["beamlineOperator"]["siteId"], 4)
+        self.assertEqual([participant["siteId"] for participant in sessions[0]["participants"]], ["2", "3", "1"])
+        with FakeDoorISPyBJava() as client:
+            labcontacts = json.loads(client.get_labcontacts(self.proposal_id))
+            with patch.dict(PROPOSALS, {self.proposal_id: dict(PROPOSALS[self.proposal_id], proposalCowriters=3)}):
+                single_cowriter = json.loads(client.get_labcontacts(self.proposal_id))[2]
+        self.assertEqual([(contact["scientistPk"], contact["siteId"], contact["laboratoryPk"]) for contact in labcontacts],
+                         [(1, 1, 11), (2, 2, 10), ("3", "3", 11), ("1", "1", 11)])
+        # The whole co-writer entry of the baseline exporter
+        self.assertEqual(labcontacts[2], {
+            "bllogin": "user3", "categoryCode": "I", "categoryCounter": 20210009,
+            "labAddress": [None, "Notkestr. 85", None, None, None], "labAddress1": "Notkestr. 85", "labAddress2": None,
+            "labCity": "HAMBURG", "labCountryCode": "DE", "labName": "European Molecular Biology Laboratory",
+            "labPostalCode": None, "laboratoryPk": 11, "mainProposer": False, "proposalGroup": 103,
+            "proposalTitle": "Test proposal", "proposalType": 3, "proposer": True, "scientistEmail": "user3@example.org",
+            "scientistFirstName": "Given3", "scientistName": "Family3", "scientistPk": "3", "scientistTitle": "Dr.",
+            "siteId": "3", "user": True, "userName": "user3"})
+        # DOOR gives a single co-writer as an int
+        self.assertEqual((single_cowriter["scientistPk"], single_cowriter["siteId"]), (3, 3))
+
+    def test_sessions_strategies_on_empty_window(self):
+        with FakeDoorPyISPyB() as client:
+            # Short window: auto takes the beamline sessions, long window: the proposal sessions
+            for date_range in (("2022-09-01", "2022-09-30"), ("2023-01-01", "2023-12-31")):
+                for strategy in ("auto", "proposal", "beamline"):
+                    self.assertEqual(client.get_proposal_sessions(self.proposal_id, "P11", *date_range,
+                                                                  strategy=strategy), [])
+                    self.assertEqual(client.get_session_models(self.proposal_id, "P11", *date_range,
+                                                               strategy=strategy), [])
+
+    def test_sessions_without_proposal_id(self):
+        def window_without_proposal_ids(url):
+            r = door_response(url)
+            if url.startswith("/experiments/beamline/"):
+                sessions = r.json()["experiment metadata"]
+                for session in sessions.values():
+                    del session["proposalId"]
+                r._content = json.dumps({"experiment metadata": sessions}).encode()
+            return r
+
+        with FakeDoorPyISPyB() as client:
+            expected = client.get_proposal_sessions(self.proposal_id, "P11", "2022-07-01", "2022-07-31", strategy="proposal")
+            expected_models = client.get_session_models(self.proposal_id, "P11", "2022-07-01", "2022-07-31",
+                                                        strategy="proposal")
+            client.door_calls = []
+            with patch("tests.fakedoor.door_response", window_without_proposal_ids):
+                # The beamline window does not tell the proposal of its sessions, the proposal sessions do
+                self.assertEqual(client.get_proposal_sessions(self.proposal_id, "P11", "2022-07-01", "2022-07-31"),
+                                 expected)
+                self.assertEqual(client.get_session_models(self.proposal_id, "P11", "2022-07-01", "2022-07-31"),
+                                 expected_models)
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(client.door_calls, ["/experiments/beamline/P11/date/20220701/20220731",
+                                             "/experiments/propid/20210009"] * 2)
+
+    def test_sessions_strategies_are_identical(self):
+        with FakeDoorPyISPyB() as client:
+            for date_range in (("2022-07-01", "2022-07-31"), ("2022-06-01", "2022-08-31"), ("2022-08-02", "2022-08-03")):
+                by_proposal = client.get_proposal_sessions(self.proposal_id, "P11", *date_range, strategy="proposal")
+                by_beamline = client.get_proposal_sessions(self.proposal_id, "P11", *date_range, strategy="beamline")
+                self.assertEqual(by_proposal, by_beamline)
+            client.door_calls = []
+            client.get_proposal_sessions(self.proposal_id, "P11", "2022-07-01", "2022-07-31")
+            client.get_proposal_sessions(self.proposal_id, "P11", "2021-01-01", "2022-12-31")
+            client.get_proposal_sessions(self.proposal_id, "P11")
+        self.assertEqual(client.door_calls, ["/experiments/beamline/P11/date/20220701/20220731",
+                                             "/experiments/propid/20210009", "/experiments/propid/20210009"])
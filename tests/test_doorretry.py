@@ -0,0 +1,133 @@
+import time
+import threading
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from requests import exceptions
+from concurrent.futures import ThreadPoolExecutor
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.doorretry import RetryBudget, RetryPolicy, HedgePolicy, DeadlineExceeded, deadline, get_timeouts
+from tests.fakedoor import set_test_environment, door_response
+
+
+def patch_sleep():
+    return patch("pydesydoor.doorretry.time.sleep")
+
+
+def make_response(status_code):
+    r = door_response("/users/id/1")
+    r.status_code = status_code
+    return r
+
+
+class TestDoorRetry(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_timeouts(self):
+        timeouts = get_timeouts({"users": 5, "default": (1, 2)})
+        self.assertEqual(timeouts["users"], (5, 5))
+        self.assertEqual(timeouts["default"], (1, 2))
+        self.assertEqual(timeouts["experiments"], (3.05, 120))
+        self.assertEqual(get_timeouts((1, 2))["default"], (1, 2))
+
+    def test_retry_transient_errors(self):
+        send = Mock(side_effect=[exceptions.ConnectionError(), make_response(503), make_response(200)])
+        r = RetryPolicy(max_retries=2, backoff=0).run(send)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(send.call_count, 3)
+
+    def test_retry_gives_up(self):
+        send = Mock(return_value=make_response(503))
+        self.assertEqual(RetryPolicy(max_retries=1, backoff=0).run(send).status_code, 503)
+        self.assertEqual(send.call_count, 2)
+        # Client errors are not retried
+        send = Mock(return_value=make_response(404))
+        self.assertEqual(RetryPolicy(backoff=0).run(send).status_code, 404)
+        self.assertEqual(send.call_count, 1)
+
+    def test_retry_after(self):
+        throttled = make_response(429)
+        throttled.headers["Retry-After"] = "1"
+        send = Mock(side_effect=[throttled, make_response(200)])
+        with patch_sleep() as sleep:
+            self.assertEqual(RetryPolicy(backoff=0, max_backoff=5).run(send).status_code, 200)
+        sleep.assert_called_once_with(1)
+        # Longer than max_backoff: the throttled answer is returned, without waiting
+        throttled.headers["Retry-After"] = "86400"
+        send = Mock(return_value=throttled)
+        with patch_sleep() as sleep:
+            self.assertEqual(RetryPolicy(backoff=0, max_backoff=5).run(send).status_code, 429)
+        sleep.assert_not_called()
+        self.assertEqual(send.call_count, 1)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1)
+        policy = RetryPolicy(max_retries=3, backoff=0, budget=budget)
+        send = Mock(side_effect=exceptions.ConnectTimeout())
+        with self.assertRaises(exceptions.ConnectTimeout):
+            policy.run(send)
+        # One request allows min_retries + 0.5 retries
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(budget.retries, 2)
+
+    def test_deadline(self):
+        client = DesyDoorAPI(http_session=Mock())
+        self.assertEqual(client.get_timeout("/users/id/1"), (3.05, 30))
+        with deadline(1):
+            connect, read = client.get_timeout("/users/id/1")
+            self.assertLessEqual(read, 1)
+        with deadline(0.001):
+            time.sleep(0.01)
+            with self.assertRaises(DeadlineExceeded):
+                client.get_user(1)
+        client.get_http_session().get.assert_not_called()
+
+    def test_client_retries_get(self):
+        session = Mock()
+        session.get.side_effect = [exceptions.ReadTimeout(), door_response("/users/id/1")]
+        with DesyDoorAPI(http_session=session, retry=RetryPolicy(backoff=0)) as client:
+            self.assertEqual(client.get_user(1)["login"], "user1")
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(session.get.call_args.kwargs["timeout"], (3.05, 30))
+
+    def test_hedge_delay(self):
+        hedge = HedgePolicy(percentile=50, min_samples=4, min_delay=0.01)
+        self.assertIsNone(hedge.get_delay("users"))
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            hedge.add_latency("users", latency)
+        self.assertEqual(hedge.get_delay("users"), 0.3)
+        self.assertIsNone(hedge.get_delay("institutes"))
+
+    def test_hedged_get(self):
+        slow = threading.Event()
+
+        def get(url, **kwargs):
+            # The first request is stuck until the hedged one answered
+            if not slow.is_set():
+                slow.set()
+                time.sleep(0.5)
+            return door_response(url.split("/api/v1.0")[-1])
+        session = Mock()
+        session.get.side_effect = get
+        hedge = HedgePolicy(min_samples=1, min_delay=0.05)
+        hedge.add_latency("users", 0.01)
+        with DesyDoorAPI(http_session=session, hedge=hedge) as client:
+            start_time = time.perf_counter()
+            self.assertEqual(client.get_user(1)["login"], "user1")
+            self.assertLess(time.perf_counter() - start_time, 0.4)
+        self.assertEqual(hedge.hedges, 1)
+        self.assertEqual(session.get.call_count, 2)
+
+    def test_first_response(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            failed = executor.submit(Mock(side_effect=exceptions.ConnectionError()))
+            loser = make_response(200)
+            loser.close = Mock()
+            winner = executor.submit(lambda: make_response(200))
+            failed.exception()
+            winner.result()
+            slow = executor.submit(lambda: time.sleep(0.05) or loser)
+            self.assertIs(DesyDoorAPI.get_first_response([failed, winner]), winner.result())
+            DesyDoorAPI.get_first_response([winner, slow])
+        loser.close.assert_called_once()
@@ -0,0 +1,71 @@
+import os
+import sys
+import stat
+import tempfile
+import subprocess
+from unittest import TestCase
+from unittest.mock import patch
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.pyispybapi import PyISPyBAPI
+from pydesydoor.doorsettings import DoorSettings, create_private_file, get_settings
+from tests.fakedoor import set_test_environment
+
+
+class TestDoorSettings(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_loaded_once(self):
+        settings = get_settings()
+        with patch("dotenv.load_dotenv") as load_dotenv:
+            self.assertIs(get_settings(), settings)
+            DesyDoorAPI().close()
+            PyISPyBAPI().close()
+        load_dotenv.assert_not_called()
+        # Built again when the environment changed
+        with patch.dict(os.environ, {"DOOR_REST_ROOT": "http://other.test"}):
+            self.assertEqual(DesyDoorAPI().get_door_rest_root(), "http://other.test")
+        self.assertEqual(get_settings().get("DOOR_REST_ROOT"), settings.get("DOOR_REST_ROOT"))
+
+    def test_explicit_settings(self):
+        settings = DoorSettings({"DOOR_REST_ROOT": "http://door.local", "DOOR_REST_TOKEN": "", "DOOR_SERVICE_ACCOUNT": "a",
+                                 "DOOR_SERVICE_PASSWORD": "b"})
+        client = DesyDoorAPI(settings=settings)
+        self.assertEqual(client.get_door_rest_root(), "http://door.local")
+        self.assertEqual(client.get_door_header_token(), {"x-door-token": None})
+        with self.assertRaises(KeyError):
+            PyISPyBAPI(settings=settings)
+
+    def test_create_private_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache", "door.sqlite")
+            create_private_file(path)
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            # An existing file is kept
+            with open(path, "w") as f:
+                f.write("data")
+            create_private_file(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), "data")
+
+    def test_lazy_http_session(self):
+        client = DesyDoorAPI(max_workers=4)
+        # Closing a client that never sent a request does not create its session
+        client.close()
+        with DesyDoorAPI(max_workers=4) as client:
+            session = client.get_http_session()
+            self.assertIs(client.get_http_session(), session)
+            self.assertEqual(session.get_adapter("https://door.test")._pool_maxsize, 10)
+
+    def get_heavy_imports(self, module):
+        # In a new interpreter, as this one already imported everything
+        code = (f"import sys, {module}; print(sorted(name for name in ('requests', 'asyncio', 'dotenv', "
+                f"'pydesydoor.doorpyispyb') if name in sys.modules))")
+        return subprocess.check_output([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=os.getcwd())).strip()
+
+    def test_light_imports(self):
+        self.assertEqual(self.get_heavy_imports("pydesydoor.syncdoor"), b"[]")
+        # The .env file is only read when a client is constructed
+        self.assertEqual(self.get_heavy_imports("pydesydoor.desydoorauth"), b"['requests']")
@@ -0,0 +1,69 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase, skipIf
+from requests import HTTPError
+from pydesydoor.doorpyispyb import DoorPyISPyB, DEFAULT_PERSON_ID
+from pydesydoor.doorsnapshot import DoorSnapshot, pyarrow
+from tests.mockdoor import start_mock_door
+
+
+class TestDoorSnapshot(TestCase):
+
+    def setUp(self) -> None:
+        self.server = start_mock_door(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "snapshot.sqlite")
+        self.snapshot = DoorSnapshot(self.path)
+        with DoorPyISPyB(max_workers=4) as client:
+            self.stats = self.snapshot.update(client, "p11", [2021, 2022], user_ids=[DEFAULT_PERSON_ID])
+
+    def tearDown(self) -> None:
+        self.snapshot.close()
+        self.directory.cleanup()
+
+    def test_normalized_store(self):
+        counts = self.snapshot.get_counts()
+        self.assertEqual((self.stats["years"], self.stats["proposals"], self.stats["sessions"]), (2, 1, 5))
+        self.assertEqual((counts["proposals"], counts["sessions"], counts["snapshot_years"]), (1, 5, 2))
+        self.assertEqual(counts["users"], self.stats["users"])
+        self.assertGreater(counts["participants"], 5)
+        self.assertGreater(counts["institutes"], 0)
+
+    def test_read_only_backend(self):
+        with DoorPyISPyB() as client:
+            expected = client.get_full_proposal_to_pyispyb("20220001")
+            expected_sessions = client.get_beamline_sessions_by_date_range("P11", "20220301", "20220630")
+        self.server.reset_stats()
+        with DoorPyISPyB(snapshot=DoorSnapshot(self.path, read_only=True)) as client:
+            self.assertEqual(client.get_full_proposal_to_pyispyb("20220001"), expected)
+            self.assertEqual(client.get_beamline_sessions_by_date_range("P11", "20220301", "20220630"), expected_sessions)
+            self.assertEqual(list(client.get_beamline_proposals_by_year("P11", 2022)), ["20220001"])
+            # Not in the snapshot, and nothing is written to DOOR
+            with self.assertRaises(HTTPError):
+                client.get_user_roles(1)
+            with self.assertRaises(HTTPError) as error:
+                client.post_door_request("/doorauth/auth")
+            self.assertEqual(error.exception.response.status_code, 405)
+        self.assertEqual(self.server.get_stats()["requests"], 0)
+
+    def test_incremental_refresh(self):
+        self.server.reset_stats()
+        current_year = datetime.now().year
+        with DoorPyISPyB(max_workers=4) as client:
+            # The past years taken after their end are final, the users and institutes are all there
+            stats = self.snapshot.update(client, "P11", [2022])
+            self.assertEqual(self.server.get_stats()["requests"], 0)
+            self.snapshot.update(client, "P11", [current_year])
+            self.assertEqual(self.snapshot.get_years_to_update("P11", [2022, current_year]), [current_year])
+            forced = self.snapshot.update(client, "P11", [2022], force=True)
+        self.assertEqual(stats, {"years": 0, "proposals": 0, "sessions": 0, "users": 0, "institutes": 0})
+        self.assertEqual(forced["sessions"], 5)
+        # Every user of the year again, only the default person is not part of it
+        self.assertEqual(forced["users"], self.snapshot.get_counts()["users"] - 1)
+
+    @skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_write_parquet(self):
+        self.snapshot.write_parquet(self.directory.name)
+        table = pyarrow.parquet.read_table(os.path.join(self.directory.name, "sessions.parquet"))
+        self.assertEqual(table.num_rows, 5)
@@ -0,0 +1,55 @@
+import os
+import io
+import json
+import tempfile
+from unittest import TestCase
+from contextlib import redirect_stdout
+from pydesydoor import syncdoor
+from pydesydoor.doorcache import DoorCache
+from pydesydoor.doorpyispyb import DoorPyISPyB
+from pydesydoor.doortrace import DoorTracer, get_endpoint
+from tests.mockdoor import start_mock_door
+
+
+class TestDoorTracer(TestCase):
+
+    def setUp(self) -> None:
+        self.server = start_mock_door(self)
+
+    def test_get_endpoint(self):
+        self.assertEqual(get_endpoint("GET", "/users/id/12"), "GET /users/id/{}")
+        self.assertEqual(get_endpoint("GET", "/experiments/beamline/P11/date/20220701/20220731"),
+                         "GET /experiments/beamline/{}/date/{}/{}")
+        self.assertEqual(get_endpoint("POST", "/ispyb/api/v1/auth/login"), "POST /ispyb/api/v1/auth/login")
+
+    def test_calls_belong_to_their_operation(self):
+        tracer = DoorTracer()
+        with DoorPyISPyB(max_workers=4, cache=DoorCache(), tracer=tracer) as client:
+            client.get_full_proposal_to_pyispyb("20220001")
+        spans = {span.span_id: span for span in tracer.get_spans()}
+        # Entity cache hits and coalesced GETs did not send a request
+        calls = [span for span in spans.values() if span.kind == "call" and span.cache not in ("entity", "coalesced")]
+        self.assertEqual(len(calls), self.server.get_stats()["requests"])
+        # Institute calls made in the pool workers are still within their batch and proposal
+        institute_call = next(span for span in calls if span.endpoint == "GET /institutes/id/{}")
+        names = []
+        span = institute_call
+        while span.parent_id is not None:
+            span = spans[span.parent_id]
+            names.append(span.name.split(" ")[0])
+        self.assertEqual(names[-1], "proposal")
+        self.assertEqual(names[0], "institutes")
+        self.assertEqual(tracer.get_critical_path()[0][1].name, "proposal 20220001")
+        self.assertEqual(sum(stats["calls"] for stats in tracer.get_slowest_endpoints()), len(calls))
+
+    def test_syncdoor_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profile_file = os.path.join(directory, "profile.json")
+            with redirect_stdout(io.StringIO()) as output:
+                syncdoor.main(["-p", "20220001", "--no-cache", "--state-file", os.path.join(directory, "state"),
+                               "--profile", "--profile-json", profile_file])
+            with open(profile_file) as f:
+                profile = json.load(f)
+        self.assertIn("Critical path:", output.getvalue())
+        endpoints = [stats["endpoint"] for stats in profile["slowest_endpoints"]]
+        self.assertIn("POST /ispyb/api/v1/userportalsync/sync_proposal", endpoints)
@@ -0,0 +1,51 @@
+import asyncio
+from unittest import TestCase, skipIf
+from tests.fakedoor import MockDataset
+from pydesydoor.desydoorapi import DesyDoorAPI
+from pydesydoor.asyncdoorapi import AsyncDesyDoorAPI, httpx
+from tests.fakedoor import set_test_environment
+from tests.mockdoor import start_mock_door
+from tests.test_asyncdoorpyispyb import mock_door_transport
+
+
+class TestDateWindows(TestCase):
+
+    def test_split_date_range(self):
+        self.assertEqual(DesyDoorAPI.split_date_range("20211215", "20220210", "month"),
+                         [("20211215", "20211231"), ("20220101", "20220131"), ("20220201", "20220210")])
+        self.assertEqual(DesyDoorAPI.split_date_range("20220701", "20220720", 7),
+                         [("20220701", "20220707"), ("20220708", "20220714"), ("20220715", "20220720")])
+        self.assertEqual(DesyDoorAPI.split_date_range("20210601", "20230101", "year"),
+                         [("20210601", "20211231"), ("20220101", "20221231"), ("20230101", "20230101")])
+        self.assertEqual(DesyDoorAPI.split_date_range("20220702", "20220701", 7), [("20220702", "20220701")])
+        with self.assertRaises(ValueError):
+            DesyDoorAPI.split_date_range("20220701", "20220720", "week")
+
+    def test_same_as_single_request(self):
+        # Sessions of 12 to 48 hours over 8 years, many of them across the end of a window
+        dataset = MockDataset(proposals=0, users=10, commissioning_sessions=400)
+        server = start_mock_door(self, dataset)
+        with DesyDoorAPI(max_workers=4) as client:
+            sessions = client.get_beamline_sessions_by_date_range("P11", "20160101", "20231231")
+            proposals = client.get_beamline_proposals_by_date_range("P11", "20160101", "20231231")
+            server.reset_stats()
+            for window in ("month", 30, "year"):
+                self.assertEqual(client.get_beamline_sessions_by_date_range("P11", "20160101", "20231231",
+                                                                            window), sessions)
+                self.assertEqual(client.get_beamline_proposals_by_date_range("P11", "20160101", "20231231",
+                                                                             window), proposals)
+            self.assertEqual(server.get_stats()["by_endpoint"]["GET /proposals/beamline"], 96 + 98 + 8)
+        self.assertGreater(len(sessions), 100)
+
+    @skipIf(httpx is None, "httpx is not installed")
+    def test_async_windows(self):
+        set_test_environment(self)
+
+        async def get_sessions(window):
+            async with AsyncDesyDoorAPI(transport=mock_door_transport([])) as client:
+                return await client.get_beamline_sessions_by_date_range("P11", "20220601", "20220831", window)
+
+        # The session of July 1st to 2nd is in two windows of a day
+        single, windowed = asyncio.run(get_sessions(None)), asyncio.run(get_sessions(1))
+        self.assertEqual(list(windowed), ["11000001", "11000002"])
+        self.assertEqual(windowed, single)
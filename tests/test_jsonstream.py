@@ -0,0 +1,45 @@
+import json
+from unittest import TestCase
+from pydesydoor.jsonstream import iter_object_items
+from tests.fakedoor import set_test_environment
+from tests.test_doorpyispyb import FakeDoorPyISPyB
+
+
+def split_chunks(document, size):
+    data = document.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestJSONStream(TestCase):
+
+    def setUp(self) -> None:
+        self.document = json.dumps({
+            "message": "ok",
+            "experiment metadata": {
+                "1": {"name": "Müller", "nbShifts": 123456, "participants": {"remote": "1, 2"}},
+                "2": {"name": "Ångström", "nbShifts": 3.5, "scheduled": True, "list": [1, {"a": None}]},
+            },
+            "count": 2,
+        }, ensure_ascii=False, indent=2)
+
+    def test_iter_object_items_with_any_chunk_size(self):
+        expected = list(json.loads(self.document)["experiment metadata"].items())
+        for size in (1, 2, 3, 7, 64, 100000):
+            items = list(iter_object_items(split_chunks(self.document, size), "experiment metadata"))
+            self.assertEqual(items, expected, "chunk size {}".format(size))
+
+    def test_iter_object_items_missing_key(self):
+        with self.assertLogs(level="WARNING") as logs:
+            items = list(iter_object_items(split_chunks('{"message": "No sessions found"}', 5), "experiment metadata"))
+        self.assertEqual(items, [])
+        self.assertIn("No sessions found", logs.output[0])
+
+    def test_iter_object_items_empty_object(self):
+        self.assertEqual(list(iter_object_items([b'{"proposals": {}}'], "proposals")), [])
+
+    def test_iter_proposal_sessions(self):
+        set_test_environment(self)
+        with FakeDoorPyISPyB() as client:
+            for date_range in ((None, None), ("2022-08-01", "2022-08-31")):
+                self.assertEqual(list(client.iter_proposal_sessions("20210009", "p11", *date_range)),
+                                 client.get_proposal_sessions("20210009", "p11", *date_range))
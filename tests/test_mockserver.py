@@ -0,0 +1,35 @@
+import json
+from unittest import TestCase
+from tests.fakedoor import MockDataset, USER_PASSWORD
+from pydesydoor.desydoorauth import DesyDoorAuth
+from pydesydoor.doorpyispyb import DoorPyISPyB
+from tests.mockdoor import start_mock_door
+
+
+class TestMockDoorServer(TestCase):
+
+    def setUp(self) -> None:
+        self.dataset = MockDataset.from_name("small")
+        self.server = start_mock_door(self, self.dataset)
+
+    def test_datasets_are_reproducible(self):
+        self.assertEqual(MockDataset.from_name("small").sessions, self.dataset.sessions)
+        commissioning = MockDataset(proposals=0, users=10, commissioning_sessions=100)
+        self.assertEqual(len(commissioning.sessions), 100)
+
+    def test_exporter_against_mock(self):
+        with DoorPyISPyB() as client:
+            proposal = json.loads(client.get_full_proposal_to_pyispyb("20220001"))
+        self.assertEqual(len(proposal["sessions"]), 5)
+        stats = self.server.get_stats()
+        self.assertEqual(stats["by_endpoint"]["GET /proposals/propid"], 1)
+        self.assertEqual(stats["by_endpoint"]["GET /experiments/propid"], 1)
+        self.assertEqual(stats["requests"], sum(stats["by_endpoint"].values()))
+
+    def test_door_login_and_roles(self):
+        with DesyDoorAuth() as client:
+            self.assertEqual(client.login("user3", USER_PASSWORD), (True, 3))
+            self.assertFalse(client.login("user3", "wrong"))
+        with DoorPyISPyB() as client:
+            self.assertEqual(client.get_user_roles(3), ["user"])
+            self.assertFalse(client.get_user_roles(5))
@@ -0,0 +1,52 @@
+import json
+import time
+import base64
+from unittest import TestCase
+from unittest.mock import Mock
+from requests import Response
+from pydesydoor.pyispybapi import PyISPyBAPI, PyISPyBError
+from tests.fakedoor import set_test_environment
+
+
+def make_response(status_code, body):
+    r = Response()
+    r.status_code = status_code
+    r._content = json.dumps(body).encode()
+    return r
+
+
+def make_token(expires):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": expires}).encode()).decode().rstrip("=")
+    return "header." + payload + ".signature"
+
+
+class TestPyISPyBAPI(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.session = Mock()
+        self.session.post.return_value = make_response(201, {"token": make_token(time.time() + 3600)})
+        self.client = PyISPyBAPI(http_session=self.session)
+
+    def test_token_is_cached(self):
+        self.session.request.return_value = make_response(200, {})
+        for _ in range(3):
+            self.client.sync_proposal("{}")
+        self.assertEqual(self.client.logins, 1)
+        self.assertEqual(self.session.request.call_count, 3)
+
+    def test_expired_token_is_renewed(self):
+        self.session.post.return_value = make_response(201, {"token": make_token(time.time() - 1)})
+        self.client.get_token()
+        self.client.get_token()
+        self.assertEqual(self.client.logins, 2)
+
+    def test_login_again_on_401(self):
+        self.session.request.side_effect = [make_response(401, {}), make_response(200, {})]
+        self.client.sync_proposal("{}")
+        self.assertEqual(self.client.logins, 2)
+
+    def test_sync_proposal_error(self):
+        self.session.request.return_value = make_response(422, {"detail": "wrong"})
+        with self.assertRaises(PyISPyBError):
+            self.client.sync_proposal("{}")
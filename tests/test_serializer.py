@@ -0,0 +1,35 @@
+import json
+from unittest import TestCase, skipIf
+from pydesydoor import serializer
+from pydesydoor.serializer import get_serializer
+from tests.fakedoor import set_test_environment
+from tests.test_doorpyispyb import FakeDoorPyISPyB
+
+
+class TestSerializer(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+        self.pretty = FakeDoorPyISPyB().get_full_proposal_to_pyispyb("20210009")
+
+    def assert_same_payload(self, name):
+        client = FakeDoorPyISPyB(serializer=get_serializer(name))
+        payload = client.get_full_proposal_to_pyispyb("20210009")
+        self.assertIsInstance(payload, bytes)
+        self.assertNotIn(b"\n", payload)
+        self.assertEqual(json.loads(payload), json.loads(self.pretty))
+
+    def test_compact_is_the_same_json(self):
+        self.assert_same_payload("compact")
+
+    @skipIf(serializer.orjson is None, "orjson is not installed")
+    def test_orjson_is_the_same_json(self):
+        self.assert_same_payload("orjson")
+
+    def test_default_is_pretty(self):
+        self.assertIn('\n    "proposal": {', self.pretty)
+
+    def test_auto(self):
+        self.assertEqual(get_serializer().name, "compact" if serializer.orjson is None else "orjson")
+        with self.assertRaises(ValueError):
+            get_serializer("yaml")
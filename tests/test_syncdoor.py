@@ -0,0 +1,85 @@
+import io
+import os
+import json
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, Mock, patch
+from contextlib import redirect_stdout, redirect_stderr
+from pydesydoor import syncdoor
+from pydesydoor.syncstate import SyncStateStore
+from tests.fakedoor import set_test_environment
+from tests.test_doorpyispyb import FakeDoorPyISPyB
+
+
+@patch("pydesydoor.doorpyispyb.DoorPyISPyB", FakeDoorPyISPyB)
+class TestSyncDoor(TestCase):
+
+    def setUp(self) -> None:
+        set_test_environment(self)
+
+    def test_sync_proposals_door_only(self):
+        with redirect_stdout(io.StringIO()):
+            results = syncdoor.sync_proposals(["20210009", "999", "20010001"], door=True, workers=2)
+        self.assertEqual([(proposal_id, status) for proposal_id, status, _, _ in results],
+                         [("20210009", "shown"), ("999", "failed"), ("20010001", "failed")])
+        self.assertIn("error retrieving proposal 999", results[1][2])
+        self.assertIn("date range", results[2][2])
+
+    def test_explain(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            syncdoor.main(["-p", "20210009", "--explain", "--no-cache"])
+        # Proposal and sessions, users 1 to 4, at most one institute per user with a laboratory (1, 2, 3)
+        self.assertIn("Proposal 20210009: 2 sessions, 12 user references, 9 DOOR calls at most: 2 to plan, 4 users, "
+                      "at most 3 institutes", output.getvalue())
+
+    def test_output(self):
+        with redirect_stdout(io.StringIO()) as output, redirect_stderr(io.StringIO()) as errors:
+            with patch("sys.stdin", io.StringIO("999\n20210009\n")), self.assertRaises(SystemExit):
+                syncdoor.main(["-p", "20210009", "-f", "-", "-o", "-", "--no-cache"])
+        with FakeDoorPyISPyB() as client:
+            expected = client.get_full_proposal_data("20210009")
+        # One JSON document per line on stdout, the summary on stderr
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], [expected])
+        self.assertIn("Exported 1 proposals, 1 failed", errors.getvalue())
+        self.assertIn("error retrieving proposal 999", errors.getvalue())
+
+    def test_proposal_id_with_batch(self):
+        # -p is synchronized along with the proposals of the file, not ignored
+        with tempfile.TemporaryDirectory() as directory, redirect_stdout(io.StringIO()) as output:
+            with patch("sys.stdin", io.StringIO("999\n20210009\n")), self.assertRaises(SystemExit):
+                syncdoor.main(["-p", "20210009", "-f", "-", "-d", "--no-cache", "--state-file",
+                               os.path.join(directory, "state.sqlite")])
+        # Listed once, first as given with -p
+        self.assertIn("Synchronized 2 proposals", output.getvalue())
+        summary = output.getvalue().split("Synchronized 2 proposals")[1].splitlines()[1:3]
+        self.assertEqual([line.split()[:2] for line in summary], [["20210009", "shown"], ["999", "failed"]])
+
+    def test_read_proposal_ids_from_stdin(self):
+        with patch("sys.stdin", io.StringIO("20210009\n\n# comment\n20210046\n")):
+            self.assertEqual(syncdoor.read_proposal_ids("-"), ["20210009", "20210046"])
+
+    def test_sync_proposals_skips_unchanged(self):
+        pyispyb_client = Mock()
+        with tempfile.TemporaryDirectory() as directory:
+            sync_state = SyncStateStore(os.path.join(directory, "state.sqlite"))
+            statuses = [syncdoor.sync_proposals(["20210009"], sync_state=sync_state, force=force,
+                                                pyispyb_client=pyispyb_client)[0][1]
+                        for force in (False, False, True)]
+            sync_state.close()
+        self.assertEqual(statuses, ["synced", "unchanged", "synced"])
+        self.assertEqual(pyispyb_client.sync_proposal.call_count, 2)
+
+    def test_sync_proposal_closes_the_clients(self):
+        pyispyb_client = MagicMock()
+        pyispyb_client.__enter__.return_value = pyispyb_client
+        with patch.object(FakeDoorPyISPyB, "close") as close_door, redirect_stdout(io.StringIO()), \
+                patch("pydesydoor.pyispybapi.PyISPyBAPI", return_value=pyispyb_client):
+            syncdoor.sync_proposal("20210009")
+        close_door.assert_called_once()
+        pyispyb_client.sync_proposal.assert_called_once()
+        pyispyb_client.__exit__.assert_called_once()
+
+    def test_payload_hash_ignores_formatting(self):
+        self.assertEqual(SyncStateStore.get_payload_hash('{"b": 1, "a": [1, 2]}'),
+                         SyncStateStore.get_payload_hash(b'{\n    "a": [1, 2],\n    "b": 1\n}'))